@@ -0,0 +1,395 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Measures the speed of zhonglib. Each benchmark runs in its own process so
+# that its peak memory use and start up are its own. The results are
+# written as JSON so that runs before and after a change can be compared
+# with '--compare'.
+#
+# The corpora are generated from the word lists and frequency tables in
+# zhonglib-data with a fixed seed, so every run measures the same text.
+
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+_script = os.path.abspath(__file__)
+_src_dir = os.path.dirname(_script)
+
+# Returns the value at 'fraction' of the way through 'sorted_values'.
+def percentile(sorted_values, fraction):
+    if len(sorted_values) == 0:
+        return None
+    idx = int(round(fraction*(len(sorted_values) - 1)))
+    return sorted_values[idx]
+
+# Peak resident set size of this process in kilobytes. Linux reports
+# ru_maxrss in kilobytes and OS X in bytes.
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return rss
+
+# Resident set size of this process in kilobytes, or None where /proc isn't
+# available.
+def current_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+# Times 'function' on every item in 'items'. 'size' gives the number of
+# characters in an item for the throughput figure.
+def time_calls(function, items, size=len):
+    latencies = []
+    characters = 0
+    start = time.time()
+    for item in items:
+        call_start = time.time()
+        function(item)
+        latencies.append(time.time() - call_start)
+        characters += size(item)
+    elapsed = time.time() - start
+    latencies.sort()
+    return {
+        'calls': len(latencies),
+        'characters': characters,
+        'seconds': elapsed,
+        'characters_per_second': characters/elapsed if elapsed > 0 else None,
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p90': percentile(latencies, 0.9),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': latencies[-1] if latencies else None,
+    }
+
+#==============================================================================
+# Corpora
+
+_punctuation = [u'，', u'。', u'、', u'；', u'！', u'？']
+
+# Returns 'count' sentences made of words from the standard word list for
+# 'character_set'. Common characters are mixed in as words on their own,
+# picked in proportion to their frequency.
+def make_sentences(zhonglib, character_set, count, seed):
+    generator = random.Random(seed)
+    model = zhonglib.standard_word_model(character_set)
+    frequencies = zhonglib.get_frequency_table(character_set)
+    words = sorted(w for w in model if len(w) > 1)
+    characters = [c for c, f in frequencies.top(3000)]
+    weights = [f for c, f in frequencies.top(3000)]
+    cumulative = []
+    total = 0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    def common_character():
+        target = generator.random()*total
+        low, high = 0, len(cumulative) - 1
+        while low < high:
+            middle = (low + high)//2
+            if cumulative[middle] < target:
+                low = middle + 1
+            else:
+                high = middle
+        return characters[low]
+
+    result = []
+    for i in xrange(count):
+        parts = []
+        for j in xrange(generator.randint(4, 12)):
+            if generator.random() < 0.4:
+                parts.append(common_character())
+            else:
+                parts.append(generator.choice(words))
+            if generator.random() < 0.15:
+                parts.append(generator.choice(_punctuation))
+        parts.append(u'。')
+        result.append(u''.join(parts))
+    return result
+
+#==============================================================================
+# Benchmarks. Each one takes the options and returns a dictionary of
+# results, or None if it can't run here.
+
+def bench_import(options):
+    times = []
+    # 'python -c' doesn't put this directory on the path like running a
+    # script does.
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        [_src_dir] + [p for p in [os.environ.get('PYTHONPATH')] if p])
+    for i in xrange(options.import_runs):
+        start = time.time()
+        subprocess.check_call(
+            [sys.executable, '-c', 'import zhonglib'],
+            env=environment)
+        times.append(time.time() - start)
+    times.sort()
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return {
+        'runs': len(times),
+        'cold_start_min': times[0],
+        'cold_start_p50': percentile(times, 0.5),
+        'cold_start_max': times[-1],
+        'import_peak_rss_kb': rss,
+    }
+
+def _import_zhonglib():
+    start = time.time()
+    import zhonglib
+    return zhonglib, time.time() - start
+
+# Segmenting nothing loads the data 'segment' needs for 'method', such as
+# the word model or the standard dictionary and its reading table. This is
+# timed before 'make_sentences', which would otherwise load some of it
+# outside any measurement.
+def _time_segmentation_load(zhonglib, method):
+    start = time.time()
+    zhonglib.segment(u'', zhonglib.SIMPLIFIED, method=method)
+    return time.time() - start
+
+def _bench_segment(options, method):
+    zhonglib, import_seconds = _import_zhonglib()
+    if method == 'mmseg' and not zhonglib.has_standard_dictionary():
+        return None
+    load_seconds = _time_segmentation_load(zhonglib, method)
+    sentences = make_sentences(zhonglib, zhonglib.SIMPLIFIED, options.sentences, options.seed)
+    # The first call still pays for anything loaded lazily while
+    # segmenting, so it is timed on its own.
+    start = time.time()
+    zhonglib.segment(sentences[0], zhonglib.SIMPLIFIED, method=method, on_unknown='single')
+    warm_up = time.time() - start
+    result = time_calls(
+        lambda s: zhonglib.segment(s, zhonglib.SIMPLIFIED, method=method, on_unknown='single'),
+        sentences)
+    result['import_seconds'] = import_seconds
+    result['load_seconds'] = load_seconds
+    result['first_call_seconds'] = warm_up
+    return result
+
+def bench_segment_mmseg(options):
+    return _bench_segment(options, 'mmseg')
+
+def bench_segment_max_probability(options):
+    return _bench_segment(options, 'max_probability')
+
+def bench_find(options):
+    zhonglib, import_seconds = _import_zhonglib()
+    if not zhonglib.has_standard_dictionary():
+        return None
+    generator = random.Random(options.seed)
+    words = sorted(w for w in zhonglib.standard_word_model(zhonglib.SIMPLIFIED) if len(w) > 1)
+    queries = [generator.choice(words) for i in xrange(options.lookups)]
+    result = time_calls(lambda w: zhonglib.find(w, zhonglib.SIMPLIFIED), queries)
+    result['import_seconds'] = import_seconds
+    return result
+
+# Loads the standard decomposition data into a second CharacterDecomposer
+# and measures how much the resident and peak sizes grow. The peak shows
+# memory used only while parsing.
+def bench_decomposer_load(options):
+    zhonglib, import_seconds = _import_zhonglib()
+    import gc
+    path = os.path.join(os.path.dirname(zhonglib.__file__), 'zhonglib-data', 'decomposition-data.txt')
+    gc.collect()
+    rss_before = current_rss_kb()
+    peak_before = peak_rss_kb()
+    start = time.time()
+    decomposer = zhonglib.CharacterDecomposer(path)
+    seconds = time.time() - start
+    gc.collect()
+    rss_after = current_rss_kb()
+    result = {
+        'records': len(decomposer),
+        'seconds': seconds,
+        'peak_rss_growth_kb': peak_rss_kb() - peak_before,
+        'import_seconds': import_seconds,
+        'import_rss_kb': rss_before,
+    }
+    if rss_before != None:
+        result['rss_growth_kb'] = rss_after - rss_before
+    return result
+
+def bench_decompose_character(options):
+    zhonglib, import_seconds = _import_zhonglib()
+    frequencies = zhonglib.get_frequency_table(zhonglib.SIMPLIFIED)
+    def has_decomposition(c):
+        try:
+            zhonglib.decompose_character(c)
+            return True
+        except zhonglib.ZhonglibException:
+            return False
+    characters = [c for c, f in frequencies.top(options.lookups) if has_decomposition(c)]
+    result = time_calls(zhonglib.decompose_character, characters)
+    result['import_seconds'] = import_seconds
+    return result
+
+# Tokenizes the corpus twice with ChineseTokenizer, so the second pass is
+# served from its cache, and once with Whoosh's RegexTokenizer to compare.
+def bench_tokenize(options):
+    zhonglib, import_seconds = _import_zhonglib()
+    import whoosh.analysis
+    if zhonglib.has_standard_dictionary():
+        method = 'mmseg'
+    else:
+        method = 'max_probability'
+    load_seconds = _time_segmentation_load(zhonglib, method)
+    sentences = make_sentences(zhonglib, zhonglib.SIMPLIFIED, options.sentences, options.seed)
+    tokenizer = zhonglib.ChineseTokenizer(zhonglib.SIMPLIFIED, method=method)
+    tokenize = lambda s: sum(1 for t in tokenizer(s, positions=True, chars=True))
+    # The first call is timed on its own, as for the segment benchmarks
+    start = time.time()
+    tokenize(sentences[0])
+    warm_up = time.time() - start
+    result = time_calls(tokenize, sentences)
+    cached = time_calls(tokenize, sentences)
+    regex_tokenizer = whoosh.analysis.RegexTokenizer()
+    regex = time_calls(
+        lambda s: sum(1 for t in regex_tokenizer(s, positions=True, chars=True)),
+        sentences)
+    result['method'] = method
+    result['load_seconds'] = load_seconds
+    result['first_call_seconds'] = warm_up
+    result['cached_characters_per_second'] = cached['characters_per_second']
+    result['regex_characters_per_second'] = regex['characters_per_second']
+    result['import_seconds'] = import_seconds
+    return result
+
+_benchmarks = [
+    ('import', bench_import),
+    ('segment_mmseg', bench_segment_mmseg),
+    ('segment_max_probability', bench_segment_max_probability),
+    ('find', bench_find),
+    ('decompose_character', bench_decompose_character),
+    ('decomposer_load', bench_decomposer_load),
+    ('tokenize', bench_tokenize),
+]
+
+#==============================================================================
+# Running and comparing
+
+def _run_in_child(name, options):
+    command = [
+        sys.executable, _script, '--child', name,
+        '--seed', str(options.seed),
+        '--sentences', str(options.sentences),
+        '--lookups', str(options.lookups),
+        '--import-runs', str(options.import_runs),
+    ]
+    output = subprocess.check_output(command, env=os.environ)
+    return json.loads(output)
+
+def _git_revision():
+    try:
+        with open(os.devnull, 'w') as null:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=_src_dir, stderr=null).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(options, names):
+    results = {}
+    for name, function in _benchmarks:
+        if names and not name in names:
+            continue
+        print >> sys.stderr, 'Running', name
+        results[name] = _run_in_child(name, options)
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {
+            'seed': options.seed,
+            'sentences': options.sentences,
+            'lookups': options.lookups,
+            'import_runs': options.import_runs,
+        },
+        'benchmarks': results,
+    }
+
+# Prints the numbers in 'new' as a ratio of those in 'old'.
+def compare(old, new):
+    for name in sorted(set(old['benchmarks']) | set(new['benchmarks'])):
+        old_result = old['benchmarks'].get(name)
+        new_result = new['benchmarks'].get(name)
+        print name
+        if old_result == None or new_result == None:
+            print '    not in both runs'
+            continue
+        for key in sorted(set(old_result) & set(new_result)):
+            before = old_result[key]
+            after = new_result[key]
+            if not isinstance(before, (int, long, float)) or not isinstance(after, (int, long, float)):
+                continue
+            if before == 0:
+                ratio = '-'
+            else:
+                ratio = '%.2fx'%(float(after)/before)
+            print '    %-24s %14.6g %14.6g %8s'%(key, before, after, ratio)
+
+def main():
+    parser = OptionParser(usage='%prog [options] [benchmark ...]\n'
+        '       %prog --compare <old.json> <new.json>')
+    parser.add_option('-o', '--output', help='Write the results to this file')
+    parser.add_option('--compare', action='store_true', help='Compare two result files')
+    parser.add_option('--list', action='store_true', help='List the benchmarks')
+    parser.add_option('--seed', type='int', default=1)
+    parser.add_option('--sentences', type='int', default=2000)
+    parser.add_option('--lookups', type='int', default=2000)
+    parser.add_option('--import-runs', type='int', default=5, dest='import_runs')
+    parser.add_option('--child', help='Used internally to run one benchmark')
+    options, args = parser.parse_args()
+
+    if options.list:
+        for name, function in _benchmarks:
+            print name
+        return 0
+
+    if options.compare:
+        if len(args) != 2:
+            parser.error('--compare needs two result files')
+        with open(args[0]) as f:
+            old = json.load(f)
+        with open(args[1]) as f:
+            new = json.load(f)
+        compare(old, new)
+        return 0
+
+    if options.child:
+        function = dict(_benchmarks)[options.child]
+        result = function(options)
+        if result != None:
+            result['peak_rss_kb'] = peak_rss_kb()
+        json.dump(result, sys.stdout)
+        return 0
+
+    unknown = set(args) - set(name for name, function in _benchmarks)
+    if unknown:
+        parser.error('Unknown benchmarks: ' + ', '.join(sorted(unknown)))
+
+    results = run(options, args)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print text
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
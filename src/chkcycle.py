@@ -16,11 +16,14 @@ if not os.path.exists(decomposition_file):
 
 decomposer = zhonglib.CharacterDecomposer(decomposition_file)
 
-result = zhonglib.check_decomposer_for_cycles(decomposer)
+# Lines that couldn't be loaded and dangling references are reported along
+# with the cycles among the records that were loaded.
+result = decomposer.load_report().messages()
+result += zhonglib.check_decomposer_for_cycles(decomposer)
 
 if len(result) == 0:
     sys.exit(0)
 
 for msg in result:
-    print msg
+    print msg.encode('utf-8')
 sys.exit(1)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import codecs
+import multiprocessing
+import os
+import sys
+import zhonglib
+
+# Counts the characters, words and character pairs in corpus files, with
+# one text on each line, and writes frequency tables and a word list in the
+# formats of those in zhonglib-data to a directory.
+
+if len(sys.argv) < 4 or not sys.argv[1] in ('simplified', 'traditional'):
+    print 'usage:', sys.argv[0], 'simplified|traditional <dst> <corpus> ...'
+    sys.exit(1)
+
+if sys.argv[1] == 'simplified':
+    character_set = zhonglib.SIMPLIFIED
+else:
+    character_set = zhonglib.TRADITIONAL
+dst = sys.argv[2]
+corpora = sys.argv[3:]
+
+if not os.path.isdir(dst):
+    print 'Destination directory does not exist.'
+    sys.exit(1)
+
+def texts():
+    for corpus in corpora:
+        with codecs.open(corpus, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield line
+
+paths = zhonglib.build_frequency_tables(texts(), character_set, dst,
+    processes=multiprocessing.cpu_count(), on_unknown='single')
+for key in sorted(paths):
+    print paths[key]
@@ -1,12 +1,34 @@
 # -*- coding: utf-8 -*-
 
 import os.path
+import re
+from array import array
 import functools
 import operator
 import codecs
+import io
 import string
 import math
+import sys
+import time
+import marshal
+import random
+import threading
+import Queue
+import heapq
+import multiprocessing
 import unicodedata
+import collections
+import logging
+
+_log = logging.getLogger('zhonglib')
+_log.addHandler(logging.NullHandler())
+
+# Guards the data that threads, such as the workers of a RequestPool, share
+# and that is built the first time it is needed or changed at run time: the
+# standard_* objects, dictionaries' reading tables, the CEDICT syllable
+# numbers and the user dictionaries.
+_shared_data_lock = threading.RLock()
 
 # Constants
 
@@ -23,6 +45,10 @@ VARIANT_OF  = 4
 SIMPLIFIED = 0x0001
 TRADITIONAL = 0x0002
 
+# Given to 'segment' or 'to_pinyin' in place of one of the above to have the
+# character set of the text detected. See 'detect_character_set'.
+AUTO = 0x0004
+
 # These codes are used in the file to represent the abovementioned constants.
 _constant_codes = {
 
@@ -70,6 +96,14 @@ class DecompositionError(ZhonglibException):
     def __str__(self):
         return unicode(self).encode('utf-8')
 
+# Raised by RequestPool futures whose request took too long
+class RequestTimeout(ZhonglibException):
+    pass
+
+# Raised by RequestPool futures whose request was cancelled
+class RequestCancelled(ZhonglibException):
+    pass
+
 class DecompositionCycle(ZhonglibException):
 
     def __init__(self, ch):
@@ -87,22 +121,117 @@ class DecompositionCycle(ZhonglibException):
         return unicode(self).encode('utf-8')
 
 
+# Problems and statistics gathered while loading decomposition data.
+# Each problem is a 3-tuple of the file name, the line number and a
+# message. A line number of None means the problem is not with one line;
+# e.g., a reference to an ID that is not defined anywhere.
+class DecompositionLoadReport:
+
+    def __init__(self):
+        self.problems = []
+        self.files = []
+        self.line_count = 0
+        self.record_count = 0
+        self.character_count = 0
+        self.group_count = 0
+        self.variant_count = 0
+        self.override_count = 0
+        self.skipped_count = 0
+
+    def add_problem(self, file_name, line_number, message):
+        self.problems.append((file_name, line_number, message))
+
+    def is_ok(self):
+        return len(self.problems) == 0
+
+    # Returns the problems as strings of the form 'file:line: message'
+    def messages(self):
+        result = []
+        for file_name, line_number, message in self.problems:
+            if line_number == None:
+                result.append(u'%s: %s'%(file_name, message))
+            else:
+                result.append(u'%s:%s: %s'%(file_name, line_number, message))
+        return result
+
+# Returns a description of an ID that has the wrong length. On a narrow
+# Python build, characters above U+FFFF are decoded as surrogate pairs so
+# they look like two characters.
+def _describe_bad_character_id(identifier):
+    if len(identifier) == 2 and all(0xD800 <= ord(c) <= 0xDFFF for c in identifier):
+        return u'"%s" is a surrogate pair; a wide Python build is needed'%identifier
+    return u'"%s" must be a single character'%identifier
+
+# The records are not kept as tuples. Every ID, including IDs that are only
+# referred to, is given an integer node number and the records are stored
+# in columns indexed by node number:
+#   - '_types' and '_relations' are byte arrays of the type codes. A type of
+#     0 marks an ID that is referred to but has no record.
+#   - '_children' holds the node numbers of the referents of all nodes
+#     packed together. The referents of node i are
+#     _children[_starts[i]:_ends[i]].
+#   - '_line_numbers' and '_file_numbers', the index in the load report's
+#     'files' of the file the record came from, are only needed for error
+#     messages.
+# Records are written to the columns as they are parsed. A record that
+# replaces one from an earlier file gets new referents at the end of
+# '_children' and the old ones are left unused.
+# Each ID string is kept once, in '_ids'. '__getitem__' builds the 5-tuple
+# for a record when it is asked for so callers see the same records as
+# before.
 class CharacterDecomposer:
 
-    def __init__(self, file_name):
-        self._decomp_table = {}
+    # 'override_files' are loaded after 'file_name' in the given order. See
+    # 'load_overrides'.
+    def __init__(self, file_name, override_files=()):
+        self._ids = []
+        self._id_index = {}
+        self._types = bytearray()
+        self._relations = bytearray()
+        self._children = array('I')
+        self._starts = array('I')
+        self._ends = array('I')
+        self._line_numbers = array('I')
+        self._file_numbers = array('H')
         self._file_name = file_name
+        self._report = DecompositionLoadReport()
         self._load_decomposition_data()
+        for override_file in override_files:
+            self.load_overrides(override_file)
 
 
     def __contains__(self, ch):
-        return ch in self._decomp_table
+        node = self._id_index.get(ch)
+        return node != None and self._types[node] != 0
 
     def __getitem__(self, ch):
-        return self._decomp_table[ch]
+        node = self._id_index[ch]
+        node_type = self._types[node]
+        if node_type == 0:
+            raise KeyError(ch)
+        relation_type = self._relations[node]
+        start = self._starts[node]
+        end = self._ends[node]
+        ids = self._ids
+        if relation_type == VARIANT_OF:
+            referent = ids[self._children[start]]
+        elif start == end:
+            referent = None
+        else:
+            referent = [ids[child] for child in self._children[start:end]]
+        return (ids[node], node_type, relation_type, referent, self._line_numbers[node])
 
     def __iter__(self):
-        return self._decomp_table.__iter__()
+        types = self._types
+        return (identifier for node, identifier in enumerate(self._ids)
+            if types[node] != 0)
+
+    def __len__(self):
+        return self._report.record_count
+
+    # The problems found and statistics gathered while loading the data.
+    def load_report(self):
+        return self._report
 
     # Returns a 5-tuple representing the relation between a node ID
     # and a referent.
@@ -114,8 +243,19 @@ class CharacterDecomposer:
     #           relation is VARIANT_OF or a list of component characters when the
     #           relation is COMPOSED_OF.
     #   5. The line number
-    def _parse_line(self, line_string, line_number):
+    #
+    # Returns None if the line can't be used. If 'problems' is a list, a
+    # (line number, message) pair describing what is wrong is appended
+    # to it.
+    def _parse_line(self, line_string, line_number, problems=None):
+        def problem(message):
+            if problems != None:
+                problems.append((line_number, message))
+            return None
+
         split_line = line_string.strip().split(':')
+        if len(split_line) != 4:
+            return problem(u'Expected 4 fields but found %s'%len(split_line))
 
         # Extract the four fields as strings
         node_id = split_line[0]
@@ -123,8 +263,13 @@ class CharacterDecomposer:
         relation_string = split_line[2]
         referent_string = split_line[3]
 
+        if len(node_id) == 0:
+            return problem(u'Missing node ID')
+
         # 1. The node type
-        node_type = _constant_codes[type_string]
+        node_type = _constant_codes.get(type_string)
+        if not node_type in (CHARACTER, GROUP):
+            return problem(u'Bad node type code "%s"'%type_string)
 
         # 2. The node ID does not need to be parsed but we do need to make
         #    some checks.
@@ -134,11 +279,13 @@ class CharacterDecomposer:
             # work correctly. For example, if the Python build is narrow
             # then it can't represent Unicode characters above 2^32. In that
             # case, it seems that a two character string is returned.
-            return None
+            return problem(_describe_bad_character_id(node_id))
         # Turn the strings into binary
 
         # 3. The type of relation the node represents
-        relation_type = _constant_codes[relation_string]
+        relation_type = _constant_codes.get(relation_string)
+        if not relation_type in (COMPOSED_OF, VARIANT_OF):
+            return problem(u'Bad relation type code "%s"'%relation_string)
 
         # 4. The referent
 
@@ -146,10 +293,11 @@ class CharacterDecomposer:
         # character. There should only be one character.
         # The referent in this relation is the primary character.
         if relation_type == VARIANT_OF:
-            if len(referent_string) > 1:
+            if node_type != CHARACTER:
+                return problem(u'Group %s cannot be a variant'%node_id)
+            if len(referent_string) != 1:
             # See comment for 'node_id' just above
-                return None
-            assert(node_type == CHARACTER and len(referent_string) == 1)
+                return problem(_describe_bad_character_id(referent_string))
             referent = referent_string
         else:
             # Second case, this character is composed of other
@@ -160,31 +308,141 @@ class CharacterDecomposer:
             referent = None
             if len(referent_string) > 0:
                 referent = referent_string.split(',')
+                if u'' in referent:
+                    return problem(u'Empty component in "%s"'%referent_string)
 
         return (node_id, node_type, relation_type, referent, line_number)
 
-    def _load_decomposition_data(self):
-        if not os.path.exists(self._file_name):
-            msg = "Decomposition data file does not exist: " + self._file_name
+    # Returns the node number for 'identifier', giving it a new one, with no
+    # record, if it doesn't have one yet.
+    def _intern(self, identifier):
+        node = self._id_index.get(identifier)
+        if node == None:
+            node = len(self._ids)
+            self._ids.append(identifier)
+            self._id_index[identifier] = node
+            self._types.append(0)
+            self._relations.append(0)
+            self._starts.append(0)
+            self._ends.append(0)
+            self._line_numbers.append(0)
+            self._file_numbers.append(0)
+        return node
+
+    # Parses one file in a single pass, writing each record straight into
+    # the columns. Records replace those with the same ID loaded from
+    # earlier files. An ID that is defined twice in the same file is
+    # reported and only the first record is kept.
+    def _load_file(self, file_name):
+        if not os.path.exists(file_name):
+            msg = "Decomposition data file does not exist: " + file_name
             raise ZhonglibException(msg)
 
-        with codecs.open(self._file_name, 'r', encoding='utf-8') as f:
+        report = self._report
+        file_number = len(report.files)
+        report.files.append(file_name)
+        problems = []
+        id_index = self._id_index
+        types = self._types
+        relations = self._relations
+        children = self._children
+        # io reads lines much faster than codecs
+        with io.open(file_name, 'r', encoding='utf-8') as f:
             line_number = 0
             for line in f:
                 line_number += 1
-                record = self._parse_line(line, line_number)
+                report.line_count += 1
+                if len(line.strip()) == 0:
+                    continue
+                record = self._parse_line(line, line_number, problems)
                 if record == None:
                     # There was a detectable problem with the line. Just
                     # ignore it
+                    report.skipped_count += 1
                     continue
-                assert(not record_id(record) in self._decomp_table)
-                self._decomp_table[record_id(record)] = record
+                identifier, node_type, relation_type, referent, line_number = record
+                node = id_index.get(identifier)
+                if node == None:
+                    node = self._intern(identifier)
+                elif types[node] != 0:
+                    if self._file_numbers[node] == file_number:
+                        problems.append((line_number,
+                            u'Duplicate ID "%s"; first defined on line %s'%(
+                                identifier, self._line_numbers[node])))
+                        report.skipped_count += 1
+                        continue
+                    report.override_count += 1
+                if relation_type == VARIANT_OF:
+                    referent = [referent]
+                start = len(children)
+                for child_id in referent or ():
+                    child = id_index.get(child_id)
+                    if child == None:
+                        child = self._intern(child_id)
+                    children.append(child)
+                types[node] = node_type
+                relations[node] = relation_type
+                self._starts[node] = start
+                self._ends[node] = len(children)
+                self._line_numbers[node] = line_number
+                self._file_numbers[node] = file_number
+        for line_number, message in problems:
+            report.add_problem(file_name, line_number, message)
+
+    # Recounts the records and reports references to IDs that have no
+    # record, against each file with records that refer to them. Has to be
+    # done after every file because an override can both add and remove
+    # references.
+    def _check_references(self):
+        report = self._report
+        report.problems = [p for p in report.problems
+            if not p[1] == None]
+        report.record_count = 0
+        report.character_count = 0
+        report.group_count = 0
+        report.variant_count = 0
+        referrers = {}
+        for node, node_type in enumerate(self._types):
+            if node_type == 0:
+                continue
+            report.record_count += 1
+            if node_type == CHARACTER:
+                report.character_count += 1
+            else:
+                report.group_count += 1
+            if self._relations[node] == VARIANT_OF:
+                report.variant_count += 1
+            for child in self._children[self._starts[node]:self._ends[node]]:
+                if self._types[child] == 0:
+                    key = (self._file_numbers[node], self._ids[child])
+                    referrers.setdefault(key, []).append(self._ids[node])
+        for file_number, child_id in sorted(referrers):
+            report.add_problem(report.files[file_number], None,
+                u'"%s" is referred to by %s but is not defined'%(
+                    child_id, u', '.join(sorted(referrers[(file_number, child_id)]))))
+
+    def _load_decomposition_data(self):
+        self._load_file(self._file_name)
+        self._check_references()
+
+    # Loads another decomposition file on top of the data already loaded.
+    # Its records replace any existing records with the same ID. Only the
+    # new file is parsed.
+    def load_overrides(self, file_name):
+        self._load_file(file_name)
+        self._check_references()
 
     # Returns a tree. Symbolic references between nodes are resolved
     # into direct references so forming a recursive data structure.
-    def decomposition_tree(self, ch):
+    # If 'memo' is a dictionary, subtrees that have already been built are
+    # taken from it and new ones are added to it, so that a memo shared
+    # across many calls builds each subtree only once.
+    def decomposition_tree(self, ch, memo=None):
+        if memo != None and ch in memo:
+            return memo[ch]
+
         try:
-            record = self._decomp_table[ch]
+            record = self[ch]
         except KeyError:
             raise ZhonglibException(u'No decomposition data for "%s"'%ch)
 
@@ -192,29 +450,33 @@ class CharacterDecomposer:
         if relation_type == COMPOSED_OF:
             component_ids = record_referent(record)
             if component_ids == None: 
-                return record
+                tree = record
             else:
                 # Replace component IDs with references to nodes.
-                return (
+                tree = (
                     record_id(record),
                     record_type(record),
                     record_relation_type(record),
-                    [self.decomposition_tree(i) for i in component_ids],
+                    [self.decomposition_tree(i, memo) for i in component_ids],
                     record_line_number(record)
                 )
         else:
             assert(relation_type == VARIANT_OF)
             # Replace ID of primary character with a reference to a node.
-            return (
+            tree = (
                 record_id(record),
                 record_type(record),
                 record_relation_type(record),
-                self.decomposition_tree(record_referent(record)),
+                self.decomposition_tree(record_referent(record), memo),
                 record_line_number(record)
             )
 
+        if memo != None:
+            memo[ch] = tree
+        return tree
+
     def __str__(self):
-        return str(self._decomp_table)
+        return str(dict((identifier, self[identifier]) for identifier in self))
 
 # For all the following classifications, see the following overview page:
 #http://en.wikipedia.org/wiki/Han_unification
@@ -344,10 +606,12 @@ def create_dictionary(source, destination, english_index=True, verbose=False):
         line_count = 0
     index = create_in(destination, schema)
     writer = index.writer()
+    readings = ReadingTable()
     with codecs.open(source, 'r', encoding='utf-8') as f:
         for line in f:
             if not line[0] == '#':
                 trad, simp, pin, eng = parse_dictionary_line(line)
+                readings.add(trad, simp, pin)
                 if verbose:
                     line_count += 1
                     pct_done = 100.0*line_count/num_lines
@@ -360,6 +624,157 @@ def create_dictionary(source, destination, english_index=True, verbose=False):
     if verbose:
         print "Committing. This may take a couple of minutes."
     writer.commit()
+    readings.write(os.path.join(destination, _readings_file_name))
+
+# The length of the longest word starting with each character. The
+# segmentation code uses it so it doesn't look for words longer than any
+# that can start at a given position.
+#
+# The longest length of all is kept up to date as words are added, along
+# with how many first characters have each length, so it can be found
+# again from those few lengths when the longest word is removed.
+class WordLengthTable:
+
+    def __init__(self, words=()):
+        self._lengths = {}
+        self._first_character_counts = {}
+        self._max_length = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        if len(word) > self._lengths.get(word[0], 0):
+            self.set(word[0], len(word))
+
+    # Sets the length of the longest word starting with 'first_character'.
+    # A length of 0 means no word starts with it.
+    def set(self, first_character, length):
+        old_length = self._lengths.get(first_character, 0)
+        if old_length == length:
+            return
+        if old_length > 0:
+            self._first_character_counts[old_length] -= 1
+            if self._first_character_counts[old_length] == 0:
+                del self._first_character_counts[old_length]
+        if length == 0:
+            del self._lengths[first_character]
+        else:
+            self._lengths[first_character] = length
+            self._first_character_counts[length] = \
+                self._first_character_counts.get(length, 0) + 1
+        if length > self._max_length:
+            self._max_length = length
+        elif old_length == self._max_length and \
+                not old_length in self._first_character_counts:
+            self._max_length = max(self._first_character_counts or [0])
+
+    # Returns the length of the longest word starting with 'first_character'
+    # or of the longest word of all if 'first_character' is None.
+    def get(self, first_character=None):
+        if first_character == None:
+            return self._max_length
+        return self._lengths.get(first_character, 0)
+
+# Returns the length of the longest word in 'dictionary' starting with
+# 'first_character', or of all if it is None, but no more than 'limit'.
+# Dictionaries that don't have 'max_word_length', such as the ones the
+# tests use, or that return None from it only have 'limit'.
+def _dictionary_max_word_length(dictionary, character_set, first_character, limit):
+    if not hasattr(dictionary, 'max_word_length'):
+        return limit
+    length = dictionary.max_word_length(character_set, first_character)
+    if length == None:
+        return limit
+    if limit == None:
+        return length
+    return min(length, limit)
+
+# The reading table is kept in this file in the dictionary directory.
+_readings_file_name = 'readings.txt'
+
+# Holds the pinyin of every word in a dictionary, by character set, so
+# that readings can be looked up without searching the index. Readings are
+# kept as CEDICT pinyin strings, e.g. '[men2 kou3]'. Equal strings are only
+# kept once.
+#
+# A word can have more than one reading; e.g. 行 is both xing2 and hang2.
+class ReadingTable:
+
+    def __init__(self):
+        self._traditional = {}
+        self._simplified = {}
+        self._pinyin = {}
+        # The lines of the table file. Traditional, simplified and pinyin
+        # for each dictionary entry.
+        self._entries = []
+        self._traditional_lengths = WordLengthTable()
+        self._simplified_lengths = WordLengthTable()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, traditional, simplified, pinyin):
+        pinyin = self._pinyin.setdefault(pinyin, pinyin)
+        self._entries.append((traditional, simplified, pinyin))
+        for table, word in ((self._traditional, traditional), (self._simplified, simplified)):
+            readings = table.setdefault(word, [])
+            if not pinyin in readings:
+                readings.append(pinyin)
+        self._traditional_lengths.add(traditional)
+        self._simplified_lengths.add(simplified)
+
+    # See 'WordLengthTable.get'. 'character_set' is TRADITIONAL, SIMPLIFIED
+    # or both.
+    def max_word_length(self, character_set, first_character=None):
+        result = 0
+        if character_set & TRADITIONAL:
+            result = self._traditional_lengths.get(first_character)
+        if character_set & SIMPLIFIED:
+            result = max(result, self._simplified_lengths.get(first_character))
+        return result
+
+    # Returns the CEDICT pinyin strings for 'word' in the order they are in
+    # the dictionary. 'character_set' is TRADITIONAL, SIMPLIFIED or both.
+    def readings(self, word, character_set):
+        assert character_set & TRADITIONAL or character_set & SIMPLIFIED
+        result = []
+        if character_set & TRADITIONAL:
+            result.extend(self._traditional.get(word, ()))
+        if character_set & SIMPLIFIED:
+            for pinyin in self._simplified.get(word, ()):
+                if not pinyin in result:
+                    result.append(pinyin)
+        return result
+
+    # Returns the usual reading of 'word' as a list of (syllable, tone)
+    # pairs or None if the word isn't in the table. CEDICT capitalises the
+    # pinyin of proper nouns, so the first reading that isn't capitalised
+    # is taken if there is one.
+    def reading(self, word, character_set):
+        readings = self.readings(word, character_set)
+        if len(readings) == 0:
+            return None
+        for pinyin in readings:
+            if not pinyin[1:2].isupper():
+                return parse_cedict_pinyin(pinyin)
+        return parse_cedict_pinyin(readings[0])
+
+    # Returns the (traditional, simplified) pair of every entry
+    def pairs(self):
+        return [(traditional, simplified) for traditional, simplified, pinyin in self._entries]
+
+    def write(self, file_name):
+        with codecs.open(file_name, 'w', encoding='utf-8') as f:
+            for entry in self._entries:
+                f.write(u'%s %s %s\n'%entry)
+
+def read_reading_table(file_name):
+    result = ReadingTable()
+    with codecs.open(file_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            traditional, simplified, pinyin = line.rstrip('\n').split(' ', 2)
+            result.add(traditional, simplified, pinyin)
+    return result
 
 from whoosh.query import Term
 from whoosh.query import NullQuery
@@ -406,6 +821,46 @@ class Dictionary:
 
     def __init__(self, dict_path):
         self._index =  open_dir(dict_path)
+        self._path = dict_path
+        self._readings = None
+        self._script_converter = None
+
+    # Returns the dictionary's ReadingTable. It is read the first time it
+    # is needed. Dictionaries that were created before there were reading
+    # tables get one made from the index.
+    def readings(self):
+        if self._readings != None:
+            return self._readings
+        with _shared_data_lock:
+            if self._readings == None:
+                readings_path = os.path.join(self._path, _readings_file_name)
+                if os.path.exists(readings_path):
+                    readings = read_reading_table(readings_path)
+                else:
+                    readings = ReadingTable()
+                    with self._index.searcher() as searcher:
+                        for fields in searcher.reader().all_stored_fields():
+                            readings.add(
+                                fields['traditional'],
+                                fields['simplified'],
+                                fields['pinyin'])
+                self._readings = readings
+        return self._readings
+
+    # Returns a ScriptConverter made from the dictionary's entries
+    def script_converter(self):
+        if self._script_converter != None:
+            return self._script_converter
+        with _shared_data_lock:
+            if self._script_converter == None:
+                self._script_converter = ScriptConverter(self.readings().pairs())
+        return self._script_converter
+
+    # Returns the length of the longest word in 'character_set' starting
+    # with 'first_character', or of all words if it is None. Worked out
+    # from the reading table.
+    def max_word_length(self, character_set, first_character=None):
+        return self.readings().max_word_length(character_set, first_character)
 
     # Looks for entries in the dictionary.
     # 'character_set' is TRADITIONAL, SIMPLIFIED, (TRADITIONAL | SIMPLIFIED)
@@ -416,23 +871,36 @@ class Dictionary:
     def find(self, search_string, character_set=0, include_english=False):
         assert character_set or include_english
         with self._index.searcher() as searcher:
-            query = NullQuery()
-            if character_set & TRADITIONAL:
-                query |= Term("traditional", search_string)
-            if character_set & SIMPLIFIED:
-                query |= Term('simplified', search_string)
-            if include_english:
-                query |= Term('english', search_string)
-            results = searcher.search(query)
-            return_value = []
-            for result in results:
-                return_value.append(Entry(
-                    result['traditional'],
-                    result['simplified'],
-                    result['pinyin'],
-                    result['english']
-                ));
-            return return_value
+            return self._find(searcher, search_string, character_set, include_english)
+
+    # Like 'find' for each of 'search_strings' but with one searcher for
+    # all of them. Returns a list of the entries found for each.
+    def find_many(self, search_strings, character_set=0, include_english=False):
+        assert character_set or include_english
+        with self._index.searcher() as searcher:
+            return [
+                self._find(searcher, search_string, character_set, include_english)
+                for search_string in search_strings
+            ]
+
+    def _find(self, searcher, search_string, character_set, include_english):
+        query = NullQuery()
+        if character_set & TRADITIONAL:
+            query |= Term("traditional", search_string)
+        if character_set & SIMPLIFIED:
+            query |= Term('simplified', search_string)
+        if include_english:
+            query |= Term('english', search_string)
+        results = searcher.search(query)
+        return_value = []
+        for result in results:
+            return_value.append(Entry(
+                result['traditional'],
+                result['simplified'],
+                result['pinyin'],
+                result['english']
+            ));
+        return return_value
 
     def has_word(self, character_set, key):
         assert character_set & TRADITIONAL or character_set & SIMPLIFIED
@@ -459,18 +927,305 @@ __standard_dictionary_path = os.path.join(
 if os.path.exists(__standard_dictionary_path):
     __standard_dictionary = Dictionary(os.path.join(__standard_dictionary_path))
 
+# The standard dictionary is only there if it has been built; without it
+# 'standard_dictionary', 'find' and MMSEG segmentation with the standard
+# lexicon fail.
+def has_standard_dictionary():
+    return os.path.exists(__standard_dictionary_path)
+
 def standard_dictionary():
     return __standard_dictionary
 
 def find(word, character_set=0, include_english=False):
     return __standard_dictionary.find(word, character_set, include_english)
 
+def find_many(words, character_set=0, include_english=False):
+    return __standard_dictionary.find_many(words, character_set, include_english)
+
+# Returns the pinyin of 'text' as a list of (word, reading) pairs, one for
+# each word found by 'segment'. A reading is a list of (syllable, tone)
+# pairs as returned by 'parse_cedict_pinyin'. Words in the dictionary get
+# the reading of the whole word, which settles the reading of characters
+# that have more than one. Other words get the reading of each character.
+# Characters that have no reading get None in place of a pair.
+#
+# 'character_set' can be AUTO, as for 'segment'. 'dictionary' and
+# 'max_word_length' are passed on to 'segment'. The readings come from
+# 'dictionary', or the standard dictionary if it is None.
+def to_pinyin(text, character_set, dictionary=None, max_word_length=None):
+    if character_set == AUTO:
+        character_set = detect_character_set(text)
+    words = segment(text, character_set, dictionary, max_word_length)
+    if dictionary == None:
+        dictionary = standard_dictionary()
+    readings = dictionary.readings()
+    result = []
+    for word in words:
+        reading = readings.reading(word, character_set)
+        if reading == None or len(reading) != len(word):
+            reading = []
+            for ch in word:
+                ch_reading = readings.reading(ch, character_set)
+                if ch_reading == None or len(ch_reading) != 1:
+                    reading.append(None)
+                else:
+                    reading.append(ch_reading[0])
+        result.append((word, reading))
+    return result
+
+#==============================================================================
+# Traditional and simplified conversion
+
+# Converts text between traditional and simplified characters using the
+# (traditional, simplified) pairs of dictionary entries.
+#
+# Each character is mapped to the character it most often corresponds to in
+# the pairs, e.g. simplified 发 to 發 rather than 髮. Words that would come
+# out wrong that way, such as 头发, are kept in a trie with their whole
+# conversion. Conversion takes the longest word in the trie at each
+# position, or else maps the character on its own, so the text is gone
+# through once. Characters that aren't in any pair are left as they are.
+#
+# The tables are made the first time they are needed, after which pairs
+# should not be added.
+class ScriptConverter:
+
+    def __init__(self, pairs=()):
+        self._pairs = []
+        self._tables = None
+        for traditional, simplified in pairs:
+            self.add(traditional, simplified)
+
+    def add(self, traditional, simplified):
+        self._pairs.append((traditional, simplified))
+        self._tables = None
+
+    def __len__(self):
+        return len(self._pairs)
+
+    # Returns (word trie, character map, longest word in trie) for
+    # converting to 'target', which is TRADITIONAL or SIMPLIFIED.
+    def _get_tables(self, target):
+        if self._tables == None:
+            self._tables = {
+                TRADITIONAL: self._make_tables([(s, t) for t, s in self._pairs]),
+                SIMPLIFIED: self._make_tables(self._pairs),
+            }
+        return self._tables[target]
+
+    # 'pairs' are (source, target) pairs. Ties between targets go to the one
+    # seen first.
+    @staticmethod
+    def _make_tables(pairs):
+        character_counts = {}
+        word_counts = {}
+        for source, target in pairs:
+            if len(source) != len(target):
+                continue
+            for s, t in zip(source, target):
+                counts = character_counts.setdefault(s, collections.OrderedDict())
+                counts[t] = counts.get(t, 0) + 1
+            if len(source) > 1:
+                counts = word_counts.setdefault(source, collections.OrderedDict())
+                counts[target] = counts.get(target, 0) + 1
+        characters = {}
+        for s, counts in character_counts.items():
+            t = max(counts, key=counts.get)
+            if t != s:
+                characters[s] = t
+        trie = {}
+        max_length = 1
+        for source, counts in word_counts.items():
+            target = max(counts, key=counts.get)
+            if u''.join(characters.get(ch, ch) for ch in source) == target:
+                continue
+            node = trie
+            for ch in source:
+                node = node.setdefault(ch, {})
+            node[None] = target
+            max_length = max(max_length, len(source))
+        return trie, characters, max_length
+
+    # Converts the words of 'text' that start before 'end'. Returns the
+    # converted pieces and where the next word starts, which can be after
+    # 'end' if a word crosses it.
+    def _convert_part(self, text, target, end):
+        trie, characters, max_length = self._get_tables(target)
+        pieces = []
+        idx = 0
+        length = len(text)
+        while idx < end:
+            node = trie
+            word = None
+            word_end = idx
+            for j in xrange(idx, min(length, idx + max_length)):
+                node = node.get(text[j])
+                if node == None:
+                    break
+                if None in node:
+                    word = node[None]
+                    word_end = j + 1
+            if word != None:
+                pieces.append(word)
+                idx = word_end
+            else:
+                ch = text[idx]
+                pieces.append(characters.get(ch, ch))
+                idx += 1
+        return pieces, idx
+
+    # 'target' is TRADITIONAL or SIMPLIFIED
+    def convert(self, text, target):
+        if not target in (TRADITIONAL, SIMPLIFIED):
+            raise ZhonglibException('Invalid target character set: %s'%target)
+        pieces, idx = self._convert_part(text, target, len(text))
+        return u''.join(pieces)
+
+    def convert_many(self, texts, target):
+        return [self.convert(text, target) for text in texts]
+
+    # Converts the pieces of text from the iterable 'texts' as they come,
+    # e.g. the lines of a file, yielding converted text. Words that cross
+    # from one piece to the next are converted whole, so the joined output
+    # is the same as converting the joined input.
+    def convert_stream(self, texts, target):
+        if not target in (TRADITIONAL, SIMPLIFIED):
+            raise ZhonglibException('Invalid target character set: %s'%target)
+        trie, characters, max_length = self._get_tables(target)
+        pending = u''
+        for text in texts:
+            pending += text
+            # Only words starting at least 'max_length' - 1 characters
+            # before the end are certain not to go past it.
+            pieces, idx = self._convert_part(pending, target, len(pending) - max_length + 1)
+            pending = pending[idx:]
+            if pieces:
+                yield u''.join(pieces)
+        if pending:
+            pieces, idx = self._convert_part(pending, target, len(pending))
+            yield u''.join(pieces)
+
+# Reads the (traditional, simplified) pairs of a file in the CC-CEDICT format
+def read_script_converter(file_name):
+    result = ScriptConverter()
+    with codecs.open(file_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line[0] == '#':
+                traditional, simplified, pinyin, english = parse_dictionary_line(line)
+                result.add(traditional, simplified)
+    return result
+
+def standard_script_converter():
+    return standard_dictionary().script_converter()
+
+# 'converter' is the standard one if None
+def to_simplified(text, converter=None):
+    if converter == None:
+        converter = standard_script_converter()
+    return converter.convert(text, SIMPLIFIED)
+
+# 'converter' is the standard one if None
+def to_traditional(text, converter=None):
+    if converter == None:
+        converter = standard_script_converter()
+    return converter.convert(text, TRADITIONAL)
+
 #==============================================================================
 # Character frequency data
 
+# Frequencies of characters or words with the interface of a dictionary.
+# The total, the rank of every entry, the cumulative coverage at each rank
+# and the log-probabilities are worked out when the table is made so that
+# queries don't have to sort or sum the whole table.
+#
+# Ranks start at 1 for the most frequent entry. Entries with the same
+# frequency are ranked in the order of the entries themselves.
+class FrequencyTable:
+
+    # 'frequencies' is a dictionary or a sequence of (entry, frequency)
+    # pairs.
+    def __init__(self, frequencies):
+        if isinstance(frequencies, dict) or isinstance(frequencies, FrequencyTable):
+            frequencies = frequencies.items()
+        ranked = sorted(frequencies, key=lambda pair: (-pair[1], pair[0]))
+        self._frequencies = dict(ranked)
+        assert len(self._frequencies) == len(ranked)
+        self._ranked = tuple(entry for entry, frequency in ranked)
+        self._ranks = dict((entry, rank) for rank, entry in enumerate(self._ranked))
+        self.total = 0
+        self._cumulative = array('d')
+        for entry, frequency in ranked:
+            self.total += frequency
+            self._cumulative.append(self.total)
+        self._log_probabilities = array('d')
+        for entry, frequency in ranked:
+            if frequency == 0:
+                self._log_probabilities.append(float('-inf'))
+            else:
+                self._log_probabilities.append(math.log(float(frequency)/self.total))
+
+    def __contains__(self, entry):
+        return entry in self._frequencies
+
+    def __getitem__(self, entry):
+        return self._frequencies[entry]
+
+    def __iter__(self):
+        return iter(self._ranked)
+
+    def __len__(self):
+        return len(self._ranked)
+
+    def get(self, entry, default=None):
+        return self._frequencies.get(entry, default)
+
+    # In rank order
+    def keys(self):
+        return list(self._ranked)
+
+    def values(self):
+        return [self._frequencies[entry] for entry in self._ranked]
+
+    def items(self):
+        return [(entry, self._frequencies[entry]) for entry in self._ranked]
+
+    def rank(self, entry):
+        return self._ranks[entry] + 1
+
+    def entry_at_rank(self, rank):
+        if rank < 1:
+            raise IndexError(rank)
+        return self._ranked[rank-1]
+
+    # Returns the 'n' most frequent (entry, frequency) pairs.
+    def top(self, n):
+        return [(entry, self._frequencies[entry]) for entry in self._ranked[:n]]
+
+    def relative_frequency(self, entry):
+        if self.total == 0:
+            return 0.0
+        return float(self._frequencies[entry])/self.total
+
+    def log_probability(self, entry):
+        return self._log_probabilities[self._ranks[entry]]
+
+    # Returns the fraction of the total accounted for by the 'n' most
+    # frequent entries.
+    def coverage(self, n):
+        if n <= 0 or self.total == 0:
+            return 0.0
+        n = min(n, len(self._ranked))
+        return self._cumulative[n-1]/self.total
+
+    # Returns the percentage of entries that are ranked below 'entry'. An
+    # empty table has no percentiles.
+    def percentile(self, entry):
+        if len(self._ranked) == 0:
+            raise ZhonglibException('The frequency table is empty')
+        return 100.0*(len(self._ranked) - self.rank(entry))/len(self._ranked)
+
 def read_frequency_table(file_name):
     result = {}
-    frequency_total = 0
     with codecs.open(file_name, 'r', encoding='utf-8') as f:
         for line in f:
             words = line.split(' ')
@@ -478,8 +1233,7 @@ def read_frequency_table(file_name):
             word = words[0]
             frequency = int(words[1])
             result[word] = frequency
-            frequency_total += frequency
-    return result
+    return FrequencyTable(result)
 
 # Populates _traditional_frequency_table and _simplified_frequency_table
 # if their respective files exist
@@ -519,6 +1273,219 @@ def get_frequency_table(character_set):
 def character_frequency(character_set, ch):
     return get_frequency_table(character_set)[ch]
 
+#==============================================================================
+# Word frequency data
+
+# Reads a word list in the format used by MMSEG; e.g. 'simplified-words.dic'.
+# Each line is the length of a word followed by the word. The number is a
+# length, not a count, so it isn't kept.
+def read_word_list(file_name):
+    result = []
+    with codecs.open(file_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            words = line.split()
+            if len(words) == 0:
+                continue
+            assert len(words) == 2
+            result.append(words[1])
+    return result
+
+# A unigram model of the probabilities of words. It is also a lexicon, with
+# the same 'has_word' as Dictionary, so it can be given to 'segment'.
+#
+# 'character_frequencies' are the frequencies of single characters.
+# 'word_frequencies' are the frequencies of words, if there are any.
+# 'words' are words that have no frequency; e.g. from 'read_word_list'.
+#
+# The standard word lists have no counts, so a word without a frequency is
+# given the frequency of its rarest character; a word can't occur more
+# often than any of its characters. All frequencies have one added so that
+# nothing has a probability of zero.
+class WordFrequencyModel:
+
+    def __init__(self, character_frequencies, word_frequencies=None, words=()):
+        if not isinstance(character_frequencies, FrequencyTable):
+            character_frequencies = FrequencyTable(character_frequencies)
+        if word_frequencies == None:
+            word_frequencies = FrequencyTable({})
+        elif not isinstance(word_frequencies, FrequencyTable):
+            word_frequencies = FrequencyTable(word_frequencies)
+        self._character_frequencies = character_frequencies
+        self._word_frequencies = word_frequencies
+        self._words = set(words)
+        self._words.update(word_frequencies)
+        self._words.update(character_frequencies)
+        self._word_lengths = WordLengthTable(self._words)
+        self._total = float(
+            character_frequencies.total + word_frequencies.total + len(self._words))
+
+    def __contains__(self, word):
+        return word in self._words
+
+    def __iter__(self):
+        return iter(self._words)
+
+    def __len__(self):
+        return len(self._words)
+
+    def has_word(self, character_set, word):
+        return word in self._words
+
+    # See 'WordLengthTable.get'. The model is for one character set so
+    # 'character_set' is not used.
+    def max_word_length(self, character_set, first_character=None):
+        return self._word_lengths.get(first_character)
+
+    # Returns the count of 'word' with one added.
+    def count(self, word):
+        count = self._word_frequencies.get(word)
+        if count == None:
+            character_frequencies = self._character_frequencies
+            count = min(character_frequencies.get(ch, 0) for ch in word)
+        return count + 1
+
+    def log_probability(self, word):
+        return math.log(self.count(word)/self._total)
+
+# The standard word models are only built the first time they are needed.
+__standard_word_models = {}
+
+def standard_word_model(character_set):
+    assert character_set == SIMPLIFIED or character_set == TRADITIONAL
+    model = __standard_word_models.get(character_set)
+    if model != None:
+        return model
+    with _shared_data_lock:
+        model = __standard_word_models.get(character_set)
+        if model == None:
+            if character_set == SIMPLIFIED:
+                name = 'simplified'
+            else:
+                name = 'traditional'
+            word_list_path = os.path.join(
+                os.path.dirname(__file__),
+                'zhonglib-data',
+                name + '-words.dic'
+            )
+            if not os.path.exists(word_list_path):
+                raise ZhonglibException('Word data for %s characters does not exist.'%name)
+            model = WordFrequencyModel(
+                get_frequency_table(character_set),
+                words=read_word_list(word_list_path))
+            __standard_word_models[character_set] = model
+    return model
+
+#==============================================================================
+# Character set detection
+
+# Tells whether text is traditional or simplified from the characters that
+# are only used in one of them, e.g. 们 and 們. There is a flag for each
+# character, indexed by code point, that is SIMPLIFIED or TRADITIONAL for
+# those characters and 0 for the rest.
+class CharacterSetDetector:
+
+    def __init__(self, simplified_only=(), traditional_only=()):
+        simplified_only = [ch for ch in simplified_only if len(ch) == 1]
+        traditional_only = [ch for ch in traditional_only if len(ch) == 1]
+        size = max([ord(ch) + 1 for ch in simplified_only + traditional_only] or [0])
+        self._flags = bytearray(size)
+        for ch in simplified_only:
+            self._flags[ord(ch)] |= SIMPLIFIED
+        for ch in traditional_only:
+            self._flags[ord(ch)] |= TRADITIONAL
+
+    # Returns SIMPLIFIED or TRADITIONAL if 'ch' is only used in that
+    # character set and 0 otherwise.
+    def character_set(self, ch):
+        code = ord(ch)
+        if code >= len(self._flags):
+            return 0
+        flags = self._flags[code]
+        if flags == SIMPLIFIED or flags == TRADITIONAL:
+            return flags
+        return 0
+
+    # Returns the number of simplified only and traditional only characters
+    # in 'text' as a pair.
+    def counts(self, text):
+        flags = self._flags
+        size = len(flags)
+        simplified = 0
+        traditional = 0
+        for ch in text:
+            code = ord(ch)
+            if code < size:
+                flag = flags[code]
+                if flag == SIMPLIFIED:
+                    simplified += 1
+                elif flag == TRADITIONAL:
+                    traditional += 1
+        return simplified, traditional
+
+    # Returns the character set with more of its own characters in 'text',
+    # or 'default' if neither has more.
+    def detect(self, text, default=SIMPLIFIED):
+        simplified, traditional = self.counts(text)
+        if simplified > traditional:
+            return SIMPLIFIED
+        if traditional > simplified:
+            return TRADITIONAL
+        return default
+
+# Characters in only one of the frequency tables are taken to belong to that
+# character set. 'pairs' are the (traditional, simplified) pairs of
+# dictionary entries. Where they are given, they decide for the characters
+# in them: a character is simplified only if it is the simplified form of
+# a different traditional one and never appears on the traditional side,
+# and likewise the other way round.
+def make_character_set_detector(simplified_frequencies, traditional_frequencies, pairs=()):
+    simplified_only = set(ch for ch in simplified_frequencies if not ch in traditional_frequencies)
+    traditional_only = set(ch for ch in traditional_frequencies if not ch in simplified_frequencies)
+    simplified_side = set()
+    traditional_side = set()
+    simplified_forms = set()
+    traditional_forms = set()
+    for traditional, simplified in pairs:
+        simplified_side.update(simplified)
+        traditional_side.update(traditional)
+        if len(traditional) != len(simplified):
+            continue
+        for t, s in zip(traditional, simplified):
+            if t != s:
+                traditional_forms.add(t)
+                simplified_forms.add(s)
+    known = simplified_side | traditional_side
+    simplified_only = (simplified_only - known) | (simplified_forms - traditional_side)
+    traditional_only = (traditional_only - known) | (traditional_forms - simplified_side)
+    return CharacterSetDetector(simplified_only, traditional_only)
+
+__standard_character_set_detector = None
+
+# Made from the standard frequency tables and, if it's there, the standard
+# dictionary.
+def standard_character_set_detector():
+    global __standard_character_set_detector
+    if __standard_character_set_detector != None:
+        return __standard_character_set_detector
+    with _shared_data_lock:
+        if __standard_character_set_detector == None:
+            pairs = ()
+            if os.path.exists(__standard_dictionary_path):
+                pairs = standard_dictionary().readings().pairs()
+            __standard_character_set_detector = make_character_set_detector(
+                get_frequency_table(SIMPLIFIED),
+                get_frequency_table(TRADITIONAL),
+                pairs)
+    return __standard_character_set_detector
+
+# Returns SIMPLIFIED or TRADITIONAL, whichever 'text' has more characters
+# only used in, going through the text once. Text with neither or as many
+# of each is taken to be 'default'. 'detector' is the standard one if None.
+def detect_character_set(text, default=SIMPLIFIED, detector=None):
+    if detector == None:
+        detector = standard_character_set_detector()
+    return detector.detect(text, default)
+
 #==============================================================================
 # Decomposition 
 __standard_decomposer = CharacterDecomposer(os.path.join(
@@ -533,6 +1500,54 @@ def decompose_character(character, flatten=True):
         decomposition = flatten_decomposition(decomposition)
     return decomposition
 
+# Values for the 'on_missing' argument of 'decompose_many'
+_on_missing_values = frozenset({'skip', 'none', 'raise'})
+
+# Decomposes every character in 'characters' and returns a list of the
+# decompositions in the same order. Each distinct character is only
+# decomposed once and the subtrees shared between characters are only
+# built once.
+#
+# 'on_missing' says what to do with characters that have no decomposition
+# data. 'skip' leaves them out of the result, 'none' puts None in their
+# place and 'raise' raises the usual ZhonglibException.
+def decompose_many(characters, flatten=True, on_missing='skip', decomposer=None):
+    if not isinstance(on_missing, basestring) or not on_missing in _on_missing_values:
+        raise ZhonglibException('Invalid value for on_missing: %r'%(on_missing,))
+    if decomposer == None:
+        decomposer = __standard_decomposer
+
+    # The input is gone over twice
+    characters = list(characters)
+
+    memo = {}
+    decompositions = {}
+    for ch in characters:
+        if ch in decompositions:
+            continue
+        if not ch in decomposer:
+            if on_missing == 'raise':
+                raise ZhonglibException(u'No decomposition data for "%s"'%ch)
+            decompositions[ch] = None
+            continue
+        decomposition = decomposer.decomposition_tree(ch, memo)
+        if flatten:
+            decomposition = flatten_decomposition(decomposition)
+        decompositions[ch] = decomposition
+
+    result = []
+    for ch in characters:
+        decomposition = decompositions[ch]
+        if decomposition == None:
+            if on_missing == 'none':
+                result.append(None)
+        elif flatten:
+            # Each position gets its own list so callers can modify them.
+            result.append(list(decomposition))
+        else:
+            result.append(decomposition)
+    return result
+
 def any_are_strokes(characters):
     for c in characters:
         if is_stroke(c):
@@ -564,6 +1579,267 @@ def flatten_decomposition(record):
         result += flatten_one_level_down(child)
     return result
 
+#==============================================================================
+# Stroke decomposition
+
+# Returns the decomposition data as a graph in the form expected by
+# 'topological_sort'. Each node ID maps to the IDs it refers to directly.
+# IDs that are referred to but have no record of their own become leaves.
+def decomposition_graph(decomposer):
+    graph = {}
+    for identifier in decomposer:
+        record = decomposer[identifier]
+        referent = record_referent(record)
+        if referent == None:
+            graph[identifier] = []
+        elif record_relation_type(record) == VARIANT_OF:
+            graph[identifier] = [referent]
+        else:
+            graph[identifier] = list(referent)
+    for dependencies in graph.values():
+        for dependency in dependencies:
+            if not dependency in graph:
+                graph[dependency] = []
+    return graph
+
+# Stored in place of a stroke count when the decomposition of a character
+# stops at a primitive that isn't a stroke (e.g. 口) or goes through a
+# variant form, which needn't be written like the character it is a
+# variant of (e.g. 氵 and 水).
+_UNKNOWN_STROKE_COUNT = 0xFFFF
+
+# Holds the full expansion of every node in a decomposer down to its
+# primitives. These are the strokes in the range U+31C0-U+31EF and the
+# components the data goes no further with, such as 口 and 女, so an
+# expansion is only a list of strokes for characters that the data breaks
+# down completely. The table is computed once, visiting the nodes in
+# topological order so that each expansion is just the concatenation of the
+# expansions of its children.
+#
+# Expansions are kept in one string with an array of offsets into it and
+# the stroke counts are kept in an array, so a lookup is a dictionary hit
+# followed by an array index.
+class StrokeTable:
+
+    def __init__(self, decomposer):
+        self._index = {}
+        self._offsets = array('I', [0])
+        self._counts = array('H')
+
+        expansions = {}
+        counts = {}
+        pieces = []
+        offset = 0
+        graph = decomposition_graph(decomposer)
+        for node in topological_sort(graph):
+            dependencies = graph[node]
+            if dependencies:
+                expansion = u''.join([expansions[d] for d in dependencies])
+            elif len(node) == 1:
+                # A primitive. Either a stroke or a component for which
+                # there is no further data.
+                expansion = node
+            else:
+                # A group with no record
+                expansion = u''
+            expansions[node] = expansion
+
+            if node in decomposer and record_relation_type(decomposer[node]) == VARIANT_OF:
+                count = _UNKNOWN_STROKE_COUNT
+            elif dependencies:
+                count = 0
+                for d in dependencies:
+                    count += counts[d]
+                count = min(count, _UNKNOWN_STROKE_COUNT)
+            elif len(node) == 1 and is_stroke(node):
+                count = 1
+            else:
+                count = _UNKNOWN_STROKE_COUNT
+            counts[node] = count
+
+            self._index[node] = len(self._counts)
+            self._counts.append(count)
+            pieces.append(expansion)
+            offset += len(expansion)
+            self._offsets.append(offset)
+        self._strokes = u''.join(pieces)
+
+    def __contains__(self, ch):
+        return ch in self._index
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _row(self, ch):
+        try:
+            return self._index[ch]
+        except KeyError:
+            raise ZhonglibException(u'No decomposition data for "%s"'%ch)
+
+    # Returns the primitives of 'ch' as a list. These are strokes and the
+    # components that the data doesn't break down any further; they are
+    # all strokes only if 'stroke_count' isn't None.
+    def strokes(self, ch):
+        row = self._row(ch)
+        return list(self._strokes[self._offsets[row]:self._offsets[row+1]])
+
+    # Returns the number of strokes in 'ch' or None if the character
+    # doesn't decompose completely into strokes. The count is only as good
+    # as the data; where it splits a character into overlapping shapes the
+    # shared strokes are counted twice.
+    def stroke_count(self, ch):
+        count = self._counts[self._row(ch)]
+        if count == _UNKNOWN_STROKE_COUNT:
+            return None
+        return count
+
+# The standard stroke table is only built the first time it is needed.
+__standard_stroke_table = None
+
+def standard_stroke_table():
+    global __standard_stroke_table
+    if __standard_stroke_table != None:
+        return __standard_stroke_table
+    with _shared_data_lock:
+        if __standard_stroke_table == None:
+            __standard_stroke_table = StrokeTable(__standard_decomposer)
+    return __standard_stroke_table
+
+# Returns the primitives of 'character' in the standard decomposition data.
+# Despite the name, these are components such as 女 and 子 as well as
+# strokes, because the data doesn't break every component down into
+# strokes. See 'StrokeTable.strokes'.
+def decompose_to_strokes(character):
+    return standard_stroke_table().strokes(character)
+
+def stroke_count(character):
+    return standard_stroke_table().stroke_count(character)
+
+#==============================================================================
+# Component similarity
+
+# Two characters are similar when their flattened decompositions (see
+# 'flatten_decomposition') share components. Similarity is the Jaccard
+# index of the two component multisets.
+def component_similarity(components_1, components_2):
+    counts_1 = collections.Counter(components_1)
+    counts_2 = collections.Counter(components_2)
+    union = sum((counts_1 | counts_2).values())
+    if union == 0:
+        return 0.0
+    return float(sum((counts_1 & counts_2).values()))/union
+
+# A large prime for the MinHash hash functions
+_minhash_prime = (1 << 61) - 1
+
+# Finds characters with similar components without comparing against every
+# character. Each character's component multiset gets a MinHash signature.
+# The signature is cut into bands of 'band_size' hashes and the characters
+# are put into one bucket per band. Only characters sharing at least one
+# bucket with the query are compared.
+#
+# A component occurring n times in a character is treated as the n distinct
+# features (component, 1) ... (component, n) so that the MinHash estimates
+# the multiset Jaccard index.
+class SimilarityIndex:
+
+    def __init__(self, decomposer, num_hashes=32, band_size=2, seed=0):
+        assert num_hashes % band_size == 0
+        self._band_size = band_size
+        generator = random.Random(seed)
+        self._hash_parameters = [
+            (generator.randrange(1, _minhash_prime), generator.randrange(0, _minhash_prime))
+            for i in xrange(num_hashes)
+        ]
+        self._feature_hash_cache = {}
+        self._components = {}
+        self._buckets = [{} for i in xrange(num_hashes/band_size)]
+
+        characters = [i for i in decomposer
+            if record_type(decomposer[i]) == CHARACTER]
+        decompositions = decompose_many(characters, decomposer=decomposer)
+        for ch, components in zip(characters, decompositions):
+            if len(components) == 0:
+                continue
+            self._components[ch] = tuple(components)
+            for band in self._bands(components):
+                self._buckets[band[0]].setdefault(band[1], []).append(ch)
+
+    def __contains__(self, ch):
+        return ch in self._components
+
+    def __len__(self):
+        return len(self._components)
+
+    # The hashes of a feature are needed for every character it occurs in,
+    # so they are only computed once.
+    def _feature_hashes(self, feature):
+        try:
+            return self._feature_hash_cache[feature]
+        except KeyError:
+            h = hash(feature)
+            hashes = tuple((a*h + b) % _minhash_prime for a, b in self._hash_parameters)
+            self._feature_hash_cache[feature] = hashes
+            return hashes
+
+    def _signature(self, components):
+        occurrences = collections.Counter()
+        rows = []
+        for c in components:
+            occurrences[c] += 1
+            rows.append(self._feature_hashes((c, occurrences[c])))
+        return map(min, zip(*rows))
+
+    # Returns (band number, band) pairs for the given components.
+    def _bands(self, components):
+        signature = self._signature(components)
+        return [
+            (i, tuple(signature[i*self._band_size:(i+1)*self._band_size]))
+            for i in xrange(len(self._buckets))
+        ]
+
+    # Returns the characters that share at least one bucket with 'ch'.
+    def candidates(self, ch):
+        components = self._components.get(ch)
+        if components == None:
+            return set()
+        result = set()
+        for band_number, band in self._bands(components):
+            result.update(self._buckets[band_number][band])
+        result.discard(ch)
+        return result
+
+    # Returns up to 'k' (character, similarity) pairs for the characters most
+    # similar to 'ch', most similar first.
+    def similar(self, ch, k=10):
+        components = self._components.get(ch)
+        if components == None:
+            return []
+        scored = [
+            (c, component_similarity(components, self._components[c]))
+            for c in self.candidates(ch)
+        ]
+        scored.sort(key=lambda pair: (-pair[1], pair[0]))
+        return scored[:k]
+
+# The standard similarity index is only built the first time it is needed.
+__standard_similarity_index = None
+
+def standard_similarity_index():
+    global __standard_similarity_index
+    if __standard_similarity_index != None:
+        return __standard_similarity_index
+    with _shared_data_lock:
+        if __standard_similarity_index == None:
+            __standard_similarity_index = SimilarityIndex(__standard_decomposer)
+    return __standard_similarity_index
+
+# Returns up to 'k' characters that look like 'character', most similar first.
+def similar_characters(character, k=10):
+    if not character in __standard_decomposer:
+        raise ZhonglibException(u'No decomposition data for "%s"'%character)
+    return [c for c, similarity in standard_similarity_index().similar(character, k)]
+
 def decompose_word(word):
     result = []
     for ch in word:
@@ -629,11 +1905,120 @@ def _parse_one_cedict_pinyin(text):
     syllable = syllable.replace(u'u:',u'ü').replace(u'U:',u'Ü') 
     return (syllable, tone)
 
-def parse_cedict_pinyin(text):
+# Syllables seen in CEDICT pinyin are numbered in the order they are first
+# seen. There are only a couple of thousand distinct CEDICT pinyin tokens
+# so each of them is only parsed once and equal (syllable, tone) pairs are
+# always the same tuple.
+_cedict_syllables = []
+_cedict_syllable_ids = {}
+# The (syllable, tone) tuples for each syllable number, indexed by tone
+_cedict_syllable_tuples = []
+# Maps a token to its syllable number and tone. Text that isn't from CEDICT
+# can have any number of distinct tokens, so once the cache holds
+# '_cedict_token_cache_size' tokens, new ones are parsed every time.
+_cedict_token_cache = {}
+_cedict_token_cache_size = 10000
+
+# Stored in place of a syllable number for 'xx5', which has no pinyin
+_NO_SYLLABLE = 0xFFFF
+
+def _cedict_syllable_id(syllable):
+    syllable_id = _cedict_syllable_ids.get(syllable)
+    if syllable_id != None:
+        return syllable_id
+    with _shared_data_lock:
+        syllable_id = _cedict_syllable_ids.get(syllable)
+        if syllable_id == None:
+            syllable_id = len(_cedict_syllables)
+            _cedict_syllables.append(syllable)
+            _cedict_syllable_tuples.append(tuple((syllable, tone) for tone in xrange(5)))
+            _cedict_syllable_ids[syllable] = syllable_id
+    return syllable_id
+
+def _parse_cedict_token(token):
+    try:
+        return _cedict_token_cache[token]
+    except KeyError:
+        pass
+    parsed = _parse_one_cedict_pinyin(token)
+    if parsed == None:
+        result = (_NO_SYLLABLE, 0)
+    else:
+        result = (_cedict_syllable_id(parsed[0]), parsed[1])
+    if len(_cedict_token_cache) < _cedict_token_cache_size:
+        _cedict_token_cache[token] = result
+    return result
+
+def _cedict_pinyin_tuple(syllable_id, tone):
+    if syllable_id == _NO_SYLLABLE:
+        return None
+    if tone < 5:
+        return _cedict_syllable_tuples[syllable_id][tone]
+    # Not a real tone number but it was accepted before
+    return (_cedict_syllables[syllable_id], tone)
+
+# Returns the syllable with the given number. See 'PinyinColumn'.
+def cedict_syllable(syllable_id):
+    return _cedict_syllables[syllable_id]
+
+def _split_cedict_pinyin(text):
     if text[0] != '[' or text[-1] != ']':
         raise ZhonglibException(text + ' is not in CEDICT pinyin format.')
-    elements = text[1:-1].split(' ')
-    return map(_parse_one_cedict_pinyin, elements)
+    return text[1:-1].split(' ')
+
+def parse_cedict_pinyin(text):
+    return [
+        _cedict_pinyin_tuple(*_parse_cedict_token(token))
+        for token in _split_cedict_pinyin(text)
+    ]
+
+# Holds many parsed CEDICT pinyin strings, such as the 'pinyin' of every
+# Entry in a set of results, in columns. The syllable numbers (see
+# 'cedict_syllable') of all the strings are packed into one array and the
+# tones into a byte array. The syllables of string i are at
+# _offsets[i]:_offsets[i+1]. A syllable number of 0xFFFF stands for 'xx5',
+# which 'parse_cedict_pinyin' returns as None.
+class PinyinColumn:
+
+    def __init__(self, texts):
+        self._syllable_ids = array('H')
+        self._tones = bytearray()
+        self._offsets = array('I', [0])
+        for text in texts:
+            for token in _split_cedict_pinyin(text):
+                syllable_id, tone = _parse_cedict_token(token)
+                self._syllable_ids.append(syllable_id)
+                self._tones.append(tone)
+            self._offsets.append(len(self._syllable_ids))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    # Returns string i as 'parse_cedict_pinyin' would.
+    def __getitem__(self, i):
+        start, end = self._bounds(i)
+        return [
+            _cedict_pinyin_tuple(self._syllable_ids[j], self._tones[j])
+            for j in xrange(start, end)
+        ]
+
+    def _bounds(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        return self._offsets[i], self._offsets[i+1]
+
+    def syllable_ids(self, i):
+        start, end = self._bounds(i)
+        return self._syllable_ids[start:end]
+
+    def tones(self, i):
+        start, end = self._bounds(i)
+        return self._tones[start:end]
+
+def parse_cedict_pinyin_column(texts):
+    return PinyinColumn(texts)
 
 # Pinyin vowels are ordered (a,o,e,i,u,ü). It's not significant for this code.
 _vowels = frozenset({'a','o','e','i','u',u'ü','A','O','E','I','U',u'Ü'})
@@ -651,7 +2036,7 @@ _tone_table = {
     u'E':(u'E',u'Ē',u'É',u'Ě',u'È'),
     u'I':(u'I',u'Ī',u'Í',u'Ǐ',u'Ì'),
     u'U':(u'U',u'Ū',u'Ú',u'Ǔ',u'Ù'),
-    u'Ü':(u'U',u'Ǖ',u'Ǘ',u'Ǚ',u'Ǜ')
+    u'Ü':(u'Ü',u'Ǖ',u'Ǘ',u'Ǚ',u'Ǜ')
 }
 
 def is_vowel(ch):
@@ -660,13 +2045,9 @@ def is_vowel(ch):
 # See http://en.wikipedia.org/wiki/Pinyin#Rules_for_placing_the_tone_mark
 # and http://en.wikipedia.org/wiki/Pinyin_table
 
-def format_pinyin(syllable, tone):
-
-    if syllable == 'r':
-        # Special case for retroflex r (兒), which should represented
-        # as ('r', 0).
-        assert tone == 0
-        return 'r'
+# Works out the toned form of a syllable one character at a time. Only
+# used to build '_toned_pinyin_table' and for syllables that are not in it.
+def _compute_toned_pinyin(syllable, tone):
 
     initial = u''
     final = u''
@@ -739,23 +2120,384 @@ def format_pinyin(syllable, tone):
     # Put it all together again
     return syllable[0:vowel_idx] + toned_vowel + syllable[vowel_idx+1:]
 
+# Returns True if the tone mark in 'toned' is where the rule puts it when
+# worded the other way: a and e take the mark, in ou the o takes it and
+# otherwise the last vowel does. This is independent of the way
+# '_compute_toned_pinyin' finds the vowel.
+def _is_tone_mark_placed_correctly(syllable, tone, toned):
+    if len(toned) != len(syllable):
+        return False
+    if tone == 0:
+        return toned == syllable
+    lower = syllable.lower()
+    if 'a' in lower:
+        vowel_idx = lower.index('a')
+    elif 'e' in lower:
+        vowel_idx = lower.index('e')
+    elif 'ou' in lower:
+        vowel_idx = lower.index('ou')
+    else:
+        vowel_idx = max(i for i, ch in enumerate(syllable) if is_vowel(ch))
+    expected = (syllable[0:vowel_idx]
+        + _tone_table[syllable[vowel_idx]][tone]
+        + syllable[vowel_idx+1:])
+    return toned == expected
+
+# Returns a tuple of (syllable, zhuyin) pairs.
+def read_pinyin_syllables(file_name):
+    result = []
+    with codecs.open(file_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line[0] == '#':
+                continue
+            words = line.split()
+            assert len(words) == 2
+            result.append((words[0], words[1]))
+    return tuple(result)
+
+# Maps (syllable, tone) to the toned syllable for every syllable in
+# 'syllables' and every tone, in both lower case and capitalised form.
+def make_toned_pinyin_table(syllables):
+    # Retroflex r (兒) has no vowel. See 'format_pinyin'.
+    result = {(u'r', 0): u'r'}
+    for syllable in syllables:
+        for form in (syllable, syllable[0].upper() + syllable[1:]):
+            for tone in xrange(5):
+                toned = _compute_toned_pinyin(form, tone)
+                if not _is_tone_mark_placed_correctly(form, tone, toned):
+                    raise ZhonglibException(
+                        u'Tone mark misplaced in "%s" for (%s, %s)'%(toned, form, tone))
+                result[(form, tone)] = toned
+    return result
+
+__pinyin_syllable_path = os.path.join(
+    os.path.dirname(__file__),
+    'zhonglib-data',
+    'pinyin-syllables.txt'
+)
+if os.path.exists(__pinyin_syllable_path):
+    __pinyin_syllable_rows = read_pinyin_syllables(__pinyin_syllable_path)
+else:
+    raise ZhonglibException('Pinyin syllable data does not exist.')
+__pinyin_syllables = tuple(row[0] for row in __pinyin_syllable_rows)
+_toned_pinyin_table = make_toned_pinyin_table(__pinyin_syllables)
+
+# All the Mandarin syllables, without tones, in lower case.
+def pinyin_syllables():
+    return __pinyin_syllables
+
+# Syllables that are not in '_toned_pinyin_table', such as those with odd
+# capitalisation, are worked out as they are asked for.
+def format_pinyin(syllable, tone):
+    try:
+        return _toned_pinyin_table[(syllable, tone)]
+    except KeyError:
+        pass
+
+    if syllable == 'r':
+        # Special case for retroflex r (兒), which should represented
+        # as ('r', 0).
+        assert tone == 0
+        return 'r'
+
+    return _compute_toned_pinyin(syllable, tone)
+
 # A pinyin sequence is a sequence of pairs and None. A pair contains
 # a syllable and a tone number.  If None, it means that there is no
 # pinyin available. This happens in the CEDICT dictionary sometimes for
 # Unicode supplemental radicals and Korean characters.
 def format_pinyin_sequence(tuples):
     try:
-        result = u''
-        for t in tuples:
-            if t == None:
-                result += 'None'
-            else:
-                result += format_pinyin(t[0], t[1])
-        return result
+        return u''.join([
+            u'None' if t == None else format_pinyin(t[0], t[1])
+            for t in tuples
+        ])
     except IndexError:
         print 'tuples: %s'%tuples
         raise
 
+#==============================================================================
+# Pinyin conversion
+
+# Formats for 'convert_pinyin'
+NUMBERED_PINYIN     = 1     # As in CEDICT; e.g. 'xian4 zai4'
+DIACRITIC_PINYIN    = 2     # e.g. 'xiànzài'
+ZHUYIN              = 3     # Also known as Bopomofo; e.g. 'ㄒㄧㄢˋ ㄗㄞˋ'
+
+_pinyin_formats = frozenset({NUMBERED_PINYIN, DIACRITIC_PINYIN, ZHUYIN})
+
+# Values for the 'on_error' argument of 'convert_many'
+_on_error_values = frozenset({'none', 'raise'})
+
+# Maps each toned vowel to its plain vowel and tone.
+_untoned_vowels = dict(
+    (toned, (tones[0], tone))
+    for tones in _tone_table.values()
+    for tone, toned in enumerate(tones)
+    if tone > 0
+)
+
+# Zhuyin tone marks, indexed by tone. The neutral tone mark goes before the
+# syllable and the others after it. The first tone is normally unmarked.
+_zhuyin_tone_marks = (u'˙', u'', u'ˊ', u'ˇ', u'ˋ')
+_zhuyin_tones = {u'ˉ':1, u'ˊ':2, u'ˇ':3, u'ˋ':4}
+
+# Syllables are separated by whitespace, apostrophes and hyphens or just
+# run together.
+_pinyin_separators = re.compile(u"[\\s'’-]+", re.UNICODE)
+
+# Returns a trie of 'words'. Each node is a dictionary from a character to
+# the next node. Nodes that end a word have None as a key.
+def _make_trie(words):
+    root = {}
+    for word in words:
+        node = root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[None] = True
+    return root
+
+# Splits 'text' into words from 'trie' and returns them as (start, end)
+# pairs, or None if it can't be done. Longer words are preferred, so
+# 'xianzai' is xian zai rather than xi an zai. A shorter word is only used
+# when the rest of the text can't be split after the longer one. Splits
+# where a word other than the first starts with one of 'weak_initials' are
+# only used if there are no others. For pinyin these are a, o and e, which
+# would be preceded by an apostrophe; e.g. 'minge' is min ge, not ming e.
+def _split_with_trie(trie, text, weak_initials=u''):
+    length = len(text)
+    # 'next_end[i]' is the end of the word starting at i in a split of
+    # text[i:], or None if there is no such split.
+    next_end = [None] * (length + 1)
+    next_end[length] = length
+    for start in xrange(length - 1, -1, -1):
+        ends = []
+        node = trie
+        idx = start
+        while idx < length:
+            node = node.get(text[idx])
+            if node == None:
+                break
+            idx += 1
+            if None in node:
+                ends.append(idx)
+        ends.reverse()
+        for end in ends:
+            if next_end[end] != None and (end == length or not text[end] in weak_initials):
+                next_end[start] = end
+                break
+        else:
+            for end in ends:
+                if next_end[end] != None:
+                    next_end[start] = end
+                    break
+    if next_end[0] == None:
+        return None
+    result = []
+    start = 0
+    while start < length:
+        result.append((start, next_end[start]))
+        start = next_end[start]
+    return result
+
+# Converts between numbered pinyin, pinyin with tone marks and Zhuyin. All
+# three are parsed into a list of (syllable, tone) pairs, the same as
+# 'parse_cedict_pinyin' returns, and formatted from it. Parsing is done
+# with tries of the syllables so run together syllables like 'xianzai' are
+# split up.
+#
+# 'syllable_rows' are (syllable, zhuyin) pairs as returned by
+# 'read_pinyin_syllables'.
+class PinyinConverter:
+
+    def __init__(self, syllable_rows):
+        self._zhuyin = dict(syllable_rows)
+        # Retroflex r (兒) is written with the same Zhuyin as 'er' so it
+        # comes back from Zhuyin as 'er'.
+        self._zhuyin[u'r'] = self._zhuyin[u'er']
+        self._syllables_by_zhuyin = dict((z, s) for s, z in syllable_rows)
+        self._pinyin_trie = _make_trie(self._zhuyin)
+        self._zhuyin_trie = _make_trie(self._syllables_by_zhuyin)
+
+    # Splits 'letters' into syllables and appends them to 'result'. 'tones'
+    # holds the tone found at each position in 'letters', if any. A
+    # syllable with no tone gets 'default_tone'.
+    def _add_syllables(self, trie, letters, tones, default_tone, text, result):
+        if len(letters) == 0:
+            return
+        spans = _split_with_trie(trie, u''.join(letters).lower(), u'aoe')
+        if spans == None:
+            raise ZhonglibException(u'Unable to split "%s" into syllables'%text)
+        for start, end in spans:
+            tone = default_tone
+            for t in tones[start:end]:
+                if t != None:
+                    tone = t
+            result.append((u''.join(letters[start:end]), tone))
+
+    # Numbers and tone marks can be mixed. A number gives the tone of the
+    # syllable just before it. 'u:' and 'v' are read as ü. A syllable with
+    # neither gets the tone None, which isn't the neutral tone: that is
+    # written 5 or 0. Retroflex r never has a tone of its own and is always
+    # neutral.
+    def _parse_pinyin(self, text):
+        result = []
+        normalised = text.replace(u'u:', u'ü').replace(u'U:', u'Ü')\
+            .replace(u'v', u'ü').replace(u'V', u'Ü')
+        for word in _pinyin_separators.split(normalised):
+            letters = []
+            tones = []
+            for ch in word:
+                if ch.isdigit():
+                    tone = int(ch)
+                    if tone > 5:
+                        raise ZhonglibException(u'Bad tone number in "%s"'%text)
+                    self._add_syllables(self._pinyin_trie, letters, tones, None, text, result)
+                    if len(letters) == 0 or len(result) == 0:
+                        raise ZhonglibException(u'Tone number without a syllable in "%s"'%text)
+                    result[-1] = (result[-1][0], tone % 5)
+                    letters = []
+                    tones = []
+                elif ch in _untoned_vowels:
+                    vowel, tone = _untoned_vowels[ch]
+                    letters.append(vowel)
+                    tones.append(tone)
+                else:
+                    letters.append(ch)
+                    tones.append(None)
+            self._add_syllables(self._pinyin_trie, letters, tones, None, text, result)
+        return [
+            (syllable, 0 if tone == None and syllable.lower() == u'r' else tone)
+            for syllable, tone in result
+        ]
+
+    def _parse_zhuyin(self, text):
+        result = []
+        for word in text.split():
+            letters = []
+            tones = []
+            neutral = False
+            for ch in word:
+                if ch in _zhuyin_tones:
+                    if len(tones) == 0:
+                        raise ZhonglibException(u'Tone mark without a syllable in "%s"'%text)
+                    tones[-1] = _zhuyin_tones[ch]
+                elif ch == _zhuyin_tone_marks[0]:
+                    neutral = True
+                else:
+                    letters.append(ch)
+                    tones.append(0 if neutral else None)
+                    neutral = False
+            zhuyin = []
+            self._add_syllables(self._zhuyin_trie, letters, tones, 1, text, zhuyin)
+            result.extend((self._syllables_by_zhuyin[z], tone) for z, tone in zhuyin)
+        return result
+
+    # Returns a list of (syllable, tone) pairs. Numbered pinyin and pinyin
+    # with tone marks are parsed the same way. The tone is 0 for the
+    # neutral tone and None for pinyin syllables written without a tone.
+    def parse(self, text, source):
+        if source == ZHUYIN:
+            return self._parse_zhuyin(text)
+        if source == NUMBERED_PINYIN or source == DIACRITIC_PINYIN:
+            return self._parse_pinyin(text)
+        raise ZhonglibException('Invalid pinyin format: %s'%source)
+
+    # Formats a list of (syllable, tone) pairs. Pinyin with tone marks has
+    # an apostrophe before a syllable starting with a, o or e so that it
+    # can be split up again; e.g. xī'ān. A tone of None is written as
+    # nothing at all. Zhuyin has no way of leaving the tone out, so such
+    # syllables come out as they would for the first tone.
+    def format(self, tuples, target):
+        if target == NUMBERED_PINYIN:
+            return u' '.join([
+                syllable.replace(u'ü', u'u:').replace(u'Ü', u'U:') +
+                    (u'' if tone == None else unicode(tone or 5))
+                for syllable, tone in tuples
+            ])
+        if target == DIACRITIC_PINYIN:
+            parts = []
+            for syllable, tone in tuples:
+                if len(parts) > 0 and syllable[0] in u'aoeAOE':
+                    parts.append(u"'")
+                if tone == None:
+                    parts.append(syllable)
+                else:
+                    parts.append(format_pinyin(syllable, tone))
+            return u''.join(parts)
+        if target == ZHUYIN:
+            parts = []
+            for syllable, tone in tuples:
+                zhuyin = self._zhuyin.get(syllable.lower())
+                if zhuyin == None:
+                    raise ZhonglibException(u'No Zhuyin for "%s"'%syllable)
+                if tone == None:
+                    parts.append(zhuyin)
+                elif tone == 0:
+                    parts.append(_zhuyin_tone_marks[0] + zhuyin)
+                else:
+                    parts.append(zhuyin + _zhuyin_tone_marks[tone])
+            return u' '.join(parts)
+        raise ZhonglibException('Invalid pinyin format: %s'%target)
+
+    def convert(self, text, source, target):
+        return self.format(self.parse(text, source), target)
+
+    # Converts every string in 'texts' and returns a list of the results in
+    # the same order. Each distinct string is only converted once.
+    #
+    # 'on_error' says what to do with strings that can't be converted.
+    # 'none' puts None in their place and 'raise' raises the usual
+    # ZhonglibException.
+    def convert_many(self, texts, source, target, on_error='raise'):
+        if not on_error in _on_error_values:
+            raise ZhonglibException('Invalid value for on_error: ' + on_error)
+        if not source in _pinyin_formats or not target in _pinyin_formats:
+            raise ZhonglibException('Invalid pinyin format')
+        converted = {}
+        result = []
+        for text in texts:
+            try:
+                result.append(converted[text])
+                continue
+            except KeyError:
+                pass
+            try:
+                value = self.convert(text, source, target)
+            except ZhonglibException:
+                if on_error == 'raise':
+                    raise
+                value = None
+            converted[text] = value
+            result.append(value)
+        return result
+
+# The standard converter is only built the first time it is needed.
+__standard_pinyin_converter = None
+
+def standard_pinyin_converter():
+    global __standard_pinyin_converter
+    if __standard_pinyin_converter != None:
+        return __standard_pinyin_converter
+    with _shared_data_lock:
+        if __standard_pinyin_converter == None:
+            __standard_pinyin_converter = PinyinConverter(__pinyin_syllable_rows)
+    return __standard_pinyin_converter
+
+# Parses numbered pinyin or pinyin with tone marks into (syllable, tone)
+# pairs.
+def parse_pinyin(text):
+    return standard_pinyin_converter().parse(text, DIACRITIC_PINYIN)
+
+# 'source' and 'target' are each one of NUMBERED_PINYIN, DIACRITIC_PINYIN
+# or ZHUYIN.
+def convert_pinyin(text, source, target):
+    return standard_pinyin_converter().convert(text, source, target)
+
+def convert_pinyin_many(texts, source, target, on_error='raise'):
+    return standard_pinyin_converter().convert_many(texts, source, target, on_error)
+
 def list_to_uc(l):
     result = u''
     result += u'['
@@ -773,12 +2515,6 @@ def list_to_uc(l):
 # http://technology.chtsai.org/mmseg/
 # A copy of that page is kept in the doc directory.
 
-def print_debug(depth, *args):
-    print ' ' * depth,
-    for a in args:
-        print a,
-    print
-
 # A chunk is a list of matched words.
 # This function looks at the given text starting from the starting index.
 # It will return a list of all chunks that can be found from that position.
@@ -790,10 +2526,7 @@ def print_debug(depth, *args):
 # This is a recursive function. The last two parameters are used for recursion
 # and should not be used by client code.
 def get_chunks(text, character_set, start_idx, dictionary, max_word_length, chunk_length=3, depth=0):
-    #print_debug(depth, 'get_chunks: enter')
-    #print_debug(depth, 'text: "%s"'%text[start_idx:])
     if chunk_length == 0:
-        #print_debug(depth, 'get_chunks: chunk length is 0, returning [[]]')
         # A list length of 0 mean there is only one possible list, the empty
         # list. This is not the same as no chunk list. See below when there
         # are no matching words.
@@ -801,32 +2534,26 @@ def get_chunks(text, character_set, start_idx, dictionary, max_word_length, chun
 
     # Get first words
     first_words = []
-    last_idx = min(len(text), start_idx+max_word_length)
 
-    if start_idx == last_idx:
+    if start_idx >= len(text):
         # No more input left
-        #print_debug(depth, 'no input left, returning [[]]')
         # If there is no more input, the empty list is the only possible chunk
         # list. This is not the same as no chunk list. See below when there
         return [[]]
 
+    # Words can't be longer than the longest word starting with this
+    # character.
+    last_idx = min(len(text), start_idx+_dictionary_max_word_length(
+        dictionary, character_set, text[start_idx], max_word_length))
+
     # Find all words at the start of the input up to the max key length
     # and also not exceeding the available input.
-    #print_debug(depth, 'start_idx: %s last_idx: %s'%(start_idx,last_idx))
     for end_idx in xrange(start_idx+1, last_idx+1):
-        ##print_debug(depth, 'end_idx:',end_idx)
         word = text[start_idx:end_idx]
-        #print_debug(depth, "potential word: '%s'"%word)
         if dictionary.has_word(character_set, word):
-            #print_debug(depth+1, "'%s' found in dictionary"%word)
             first_words.append(word)
-        else:
-            pass
-            #print_debug(depth+1, "'%s' not found in dictionary"%word)
 
-    #print_debug(depth, 'first_words:', list_to_uc(first_words))
     if len(first_words) == 0:
-        #print_debug(depth, 'get_chunks: there are no words at start of text, returning []')
         # None of the input could be matched to any words. There are no
         # chunk lists.
         return []
@@ -836,7 +2563,6 @@ def get_chunks(text, character_set, start_idx, dictionary, max_word_length, chun
     # chunk list, create a new one that prepends the first word.
     result = []
     for first_word in first_words:
-        #print_debug(depth, "getting tails for '%s'"%first_word)
         tails = get_chunks(
             text,
             character_set,
@@ -846,11 +2572,9 @@ def get_chunks(text, character_set, start_idx, dictionary, max_word_length, chun
             chunk_length-1,
             depth+1
         )
-        #print_debug(depth, "tails for '%s': %s"%(first_word,list_to_uc(tails)))
         for tail in tails:
             result.append([first_word] + tail)
 
-    #print_debug(depth, 'get_chunks: returning ', list_to_uc(result))
     return result
 
 # The length of a chunk is the total number of characters in the chunk. It is
@@ -869,22 +2593,24 @@ def morphic_freedom(chunk, character_set, frequency_table=None):
         result += math.log(frequency_table[w])
     return result
 
-def get_next_word(text, character_set, idx, dictionary, max_word_length, frequency_table):
-    
-    #print 'get_next_word: text=%s idx=%s'%(text,idx)
+# Returns the next word starting at 'idx' chosen with the MMSEG rules or None
+# if there are no chunks there or the rules can't choose between them. If
+# 'trace' is a SegmentationTrace, the number of candidate chunks and what
+# decided the word are recorded in it.
+def get_next_word(text, character_set, idx, dictionary, max_word_length, frequency_table, trace=None):
     candidates = get_chunks(text, character_set, idx, dictionary, max_word_length)
+    if trace != None:
+        trace.chunk_candidate_count += len(candidates)
 
-    ##print 'get_next_word: candidates=', list_to_uc(candidates)
     if len(candidates) == 0:
-        print 'get_next_word: no chunks found'
+        _record_decision(trace, 'no_chunks')
         return None
 
     if len(candidates) == 1:
         # No ambiguities.  Choose the first chunk of the only candidate.
-        #print 'get_next_word: no ambiguity'
+        _record_decision(trace, 'unambiguous')
         return candidates[0][0]
 
-    #print 'get_next_word: invoking first rule'
     # There is more than one candidate. Use Rule 1, which is to pick the
     # chunk with biggest number of characters in it and then to pick the
     # first word.
@@ -892,25 +2618,22 @@ def get_next_word(text, character_set, idx, dictionary, max_word_length, frequen
     candidates = filter(lambda c: chunk_length(c) == max_length, candidates)
 
     if len(candidates) == 1:
-        # No ambiguities.  Choose the first chunk of the only candidate.
-        #print 'get_next_word: first rule successful'
+        _record_decision(trace, 'rule1')
         return candidates[0][0]
 
     # All candidates have the same number of characters.  Now choose the one
     # with the highest average word length.  Becuase they all have the same
     # number of characters, this is the same as choosing the chunk list with
     # the smallest number of words in it.
-
-    #print 'get_next_word: invoking second rule, candidates=', candidates
     min_avg_length = min(map(lambda c: len(c), candidates))
     candidates = filter(lambda c: len(c) == min_avg_length, candidates)
 
     if len(candidates) == 1:
-        # No ambiguities.  Choose the first chunk of the only candidate.
-        #print 'get_next_word: second rule successful'
+        _record_decision(trace, 'rule2')
         return candidates[0][0]
 
-    #print 'get_next_word: invoking fourth rule'
+    # Rule 4: the largest sum of degree of morphemic freedom of one character
+    # words.
     max_morphic_freedom = max(map(
         lambda c: morphic_freedom(c, character_set, frequency_table),
         candidates
@@ -920,28 +2643,281 @@ def get_next_word(text, character_set, idx, dictionary, max_word_length, frequen
         candidates)
 
     if len(candidates) == 1:
-        # No ambiguities.  Choose the first chunk of the only candidate.
-        #print 'get_next_word: second rule successful'
+        _record_decision(trace, 'rule4')
         return candidates[0][0]
 
-    #print 'get_next_word: ambiguity not resolved, candidates=',list_to_uc(candidates)
+    # The ambiguity can't be resolved
+    _record_decision(trace, 'unresolved')
     return None
 
+# Values for the 'on_unknown' argument of 'segment'
+_on_unknown_values = frozenset({'raise', 'single', 'merge'})
+
+# Counts gathered by 'segment' when it is given a 'statistics' argument.
+# Unknown characters are those at which no word in the dictionary starts.
+# Fallback words are words taken without the MMSEG rules because the rules
+# failed near an unknown character or couldn't choose between chunks.
+class SegmentationStatistics:
+
+    def __init__(self):
+        self.word_count = 0
+        self.character_count = 0
+        self.unknown_word_count = 0
+        self.unknown_character_count = 0
+        self.fallback_word_count = 0
+
+    def _add_word(self, word):
+        self.word_count += 1
+        self.character_count += len(word)
+
+    def _add_unknown_word(self, word):
+        self._add_word(word)
+        self.unknown_word_count += 1
+        self.unknown_character_count += len(word)
+
+    # The fraction of characters that were unknown
+    def unknown_character_rate(self):
+        if self.character_count == 0:
+            return 0.0
+        return float(self.unknown_character_count)/self.character_count
+
+    # The fraction of words that were unknown
+    def unknown_word_rate(self):
+        if self.word_count == 0:
+            return 0.0
+        return float(self.unknown_word_count)/self.word_count
+
+# What can decide a word found by the mmseg method. 'unambiguous' words
+# were the start of the only candidate chunk and 'rule1', 'rule2' and
+# 'rule4' words were chosen by that MMSEG rule. 'no_chunks' and
+# 'unresolved' mean the rules found no chunks or couldn't choose between
+# them. Either is followed by a 'fallback' word if 'on_unknown' allows one.
+SEGMENTATION_DECISIONS = (
+    'unambiguous', 'rule1', 'rule2', 'rule4', 'unresolved', 'no_chunks', 'fallback'
+)
+
+# A record of one call of 'segment', made when segmentation is being traced.
+# See 'set_segmentation_hook' and 'enable_segmentation_stats'. 'probe_count'
+# is the number of 'has_word' lookups made in the dictionary and
+# 'chunk_candidate_count' the total number of candidate chunks the MMSEG
+# rules chose between. 'decisions' maps each of SEGMENTATION_DECISIONS to
+# the number of times it happened. 'error' is the name of the exception
+# raised by the call, if there was one.
+class SegmentationTrace:
+
+    def __init__(self, text, character_set, method):
+        self.text = text
+        self.character_set = character_set
+        self.method = method
+        self.probe_count = 0
+        self.chunk_candidate_count = 0
+        self.decisions = dict((d, 0) for d in SEGMENTATION_DECISIONS)
+        self.word_count = 0
+        self.seconds = 0.0
+        self.error = None
+
+def _record_decision(trace, decision):
+    if trace != None:
+        trace.decisions[decision] += 1
+
+# Counts 'has_word' calls on 'dictionary' in 'trace'. Everything else is
+# passed on to 'dictionary' so that, for example, 'max_word_length' is only
+# there if 'dictionary' has it.
+class _ProbeCountingDictionary:
+
+    def __init__(self, dictionary, trace):
+        self._dictionary = dictionary
+        self._trace = trace
+
+    def has_word(self, character_set, word):
+        self._trace.probe_count += 1
+        return self._dictionary.has_word(character_set, word)
+
+    def __getattr__(self, name):
+        return getattr(self._dictionary, name)
+
+# Totals of the SegmentationTrace records of many calls of 'segment'. The
+# 'slowest_count' slowest calls are kept, slowest first, in 'slowest'.
+class SegmentationStats:
+
+    def __init__(self, slowest_count=10):
+        self.slowest_count = slowest_count
+        self.call_count = 0
+        self.error_count = 0
+        self.character_count = 0
+        self.word_count = 0
+        self.probe_count = 0
+        self.chunk_candidate_count = 0
+        self.decisions = dict((d, 0) for d in SEGMENTATION_DECISIONS)
+        self.seconds = 0.0
+        self.slowest = []
+        self._lock = threading.Lock()
+
+    def _add_trace(self, trace):
+        with self._lock:
+            self._add_trace_locked(trace)
+
+    def _add_trace_locked(self, trace):
+        self.call_count += 1
+        if trace.error != None:
+            self.error_count += 1
+        self.character_count += len(trace.text)
+        self.word_count += trace.word_count
+        self.probe_count += trace.probe_count
+        self.chunk_candidate_count += trace.chunk_candidate_count
+        for decision, count in trace.decisions.items():
+            self.decisions[decision] += count
+        self.seconds += trace.seconds
+        if self.slowest_count > 0 and (len(self.slowest) < self.slowest_count or
+                trace.seconds > self.slowest[-1].seconds):
+            self.slowest.append(trace)
+            self.slowest.sort(key=lambda t: t.seconds, reverse=True)
+            del self.slowest[self.slowest_count:]
+
+    # The fraction of the words decided by the mmseg method that were
+    # decided by 'decision'
+    def decision_rate(self, decision):
+        total = sum(self.decisions.values())
+        if total == 0:
+            return 0.0
+        return float(self.decisions[decision])/total
+
+    def probes_per_character(self):
+        if self.character_count == 0:
+            return 0.0
+        return float(self.probe_count)/self.character_count
+
+    def characters_per_second(self):
+        if self.seconds == 0:
+            return None
+        return self.character_count/self.seconds
+
+# Returns the end of the longest word in 'dictionary' that starts at 'idx'
+# or None if no word does.
+def _longest_word_end(text, character_set, idx, dictionary, max_word_length):
+    max_word_length = _dictionary_max_word_length(
+        dictionary, character_set, text[idx], max_word_length)
+    for end_idx in xrange(min(len(text), idx+max_word_length), idx, -1):
+        if dictionary.has_word(character_set, text[idx:end_idx]):
+            return end_idx
+    return None
+
+# Used in place of the MMSEG rules when they fail at 'idx'. Returns the
+# longest word starting at 'idx' or, if there is none, the unknown
+# character there. With 'on_unknown' set to 'merge', the unknown character
+# is joined by the unknown characters following it.
+def _fallback_word(text, character_set, idx, dictionary, max_word_length, on_unknown, statistics):
+    end_idx = _longest_word_end(text, character_set, idx, dictionary, max_word_length)
+    if end_idx != None:
+        word = text[idx:end_idx]
+        if statistics != None:
+            statistics._add_word(word)
+            statistics.fallback_word_count += 1
+        return word
+    end_idx = idx + 1
+    if on_unknown == 'merge':
+        while end_idx < len(text) and \
+                _longest_word_end(text, character_set, end_idx, dictionary, max_word_length) == None:
+            end_idx += 1
+    word = text[idx:end_idx]
+    if statistics != None:
+        statistics._add_unknown_word(word)
+    return word
+
 # Segments a contiguous string of characters; that is, it must not contain
-# any punctuation or whitespace.
-def segment_contiguous(text, character_set, dictionary, max_word_length, frequency_table):
+# any punctuation or whitespace. See 'segment' for 'on_unknown' and
+# 'statistics' and 'get_next_word' for 'trace'.
+def segment_contiguous(text, character_set, dictionary, max_word_length, frequency_table,
+        on_unknown='raise', statistics=None, trace=None):
     result = []
     idx = 0
-    #print 'text:',text
     while idx < len(text):
-        next_word = get_next_word(text, character_set, idx, dictionary, max_word_length, frequency_table)
-        #print 'next_word:',next_word
+        try:
+            next_word = get_next_word(text, character_set, idx, dictionary, max_word_length,
+                frequency_table, trace)
+        except DecompositionError:
+            # A single character word with no frequency data
+            if on_unknown == 'raise':
+                raise
+            next_word = None
         if next_word == None:
-            raise DecompositionError(text)
+            if on_unknown == 'raise':
+                raise DecompositionError(text)
+            next_word = _fallback_word(text, character_set, idx, dictionary,
+                max_word_length, on_unknown, statistics)
+            _record_decision(trace, 'fallback')
+        elif statistics != None:
+            statistics._add_word(next_word)
         result.append(next_word)
         idx += len(next_word)
     return result
 
+# Segments a contiguous string of characters into the sequence of words
+# with the highest probability according to 'word_model'. Only words for
+# which 'dictionary' has 'has_word' are considered. Between sequences with
+# the same probability, the one with fewer words is taken.
+#
+# best[i] is the score of the best sequence of words making up text[0:i] and
+# starts[i] is where the last word of that sequence starts. Each position
+# looks back at most 'max_word_length' characters so the running time is
+# O(n*max_word_length). Words longer than the longest word starting with
+# their first character are not looked up.
+#
+# Unless 'on_unknown' is 'raise', a character that isn't a word is allowed as
+# a word on its own, with the probability 'word_model' gives it. See
+# 'segment' for 'on_unknown' and 'statistics'.
+def segment_max_probability(text, character_set, dictionary, max_word_length, word_model,
+        on_unknown='raise', statistics=None):
+    length = len(text)
+    best = [None] * (length + 1)
+    starts = [0] * (length + 1)
+    unknown = [False] * (length + 1)
+    limits = [
+        _dictionary_max_word_length(dictionary, character_set, ch, max_word_length)
+        for ch in text
+    ]
+    best[0] = (0.0, 0)
+    for end in xrange(1, length + 1):
+        for start in xrange(max(0, end - max_word_length), end):
+            if best[start] == None:
+                continue
+            if end - start > limits[start] and (on_unknown == 'raise' or end - start != 1):
+                continue
+            word = text[start:end]
+            is_unknown = False
+            if not dictionary.has_word(character_set, word):
+                if on_unknown == 'raise' or end - start != 1:
+                    continue
+                is_unknown = True
+            log_probability, negative_word_count = best[start]
+            score = (
+                log_probability + word_model.log_probability(word),
+                negative_word_count - 1
+            )
+            if best[end] == None or score > best[end]:
+                best[end] = score
+                starts[end] = start
+                unknown[end] = is_unknown
+    if best[length] == None:
+        raise DecompositionError(text)
+    result = []
+    end = length
+    while end > 0:
+        word = text[starts[end]:end]
+        if unknown[end] and on_unknown == 'merge' and len(result) > 0 and result[-1][1]:
+            result[-1] = (word + result[-1][0], True)
+        else:
+            result.append((word, unknown[end]))
+        end = starts[end]
+    result.reverse()
+    if statistics != None:
+        for word, is_unknown in result:
+            if is_unknown:
+                statistics._add_unknown_word(word)
+            else:
+                statistics._add_word(word)
+    return [word for word, is_unknown in result]
+
 def split_into_contiguous(text):
     result = []
     current_section = ''
@@ -970,29 +2946,1266 @@ def split_into_contiguous(text):
         result.append(current_section)
     return result
 
+#==============================================================================
+# User dictionaries
+
+# Words added at run time, e.g. product or place names, kept in a trie.
+# Words can be added and removed at any time. A UserDictionary has the same
+# 'has_word' as Dictionary so it can be used on its own or as a layer of a
+# LayeredDictionary. 'character_set' says which character sets its words
+# belong to.
+#
+# Each node of the trie is a dictionary from a character to the next node.
+# Nodes that end a word have None as a key.
+class UserDictionary:
+
+    def __init__(self, words=(), name=None, character_set=TRADITIONAL|SIMPLIFIED):
+        self.name = name
+        self.character_set = character_set
+        self._trie = {}
+        self._count = 0
+        self._word_lengths = WordLengthTable()
+        for word in words:
+            self.add(word)
+
+    def __contains__(self, word):
+        node = self._trie
+        for ch in word:
+            node = node.get(ch)
+            if node == None:
+                return False
+        return None in node
+
+    def __len__(self):
+        return self._count
+
+    # Iterates over a copy of the words taken under _shared_data_lock, so
+    # words can be added and removed meanwhile.
+    def __iter__(self):
+        with _shared_data_lock:
+            words = []
+            stack = [(u'', self._trie)]
+            while stack:
+                prefix, node = stack.pop()
+                for ch, child in node.items():
+                    if ch == None:
+                        words.append(prefix)
+                    else:
+                        stack.append((prefix + ch, child))
+        return iter(words)
+
+    def has_word(self, character_set, word):
+        return bool(character_set & self.character_set) and word in self
+
+    def add(self, word):
+        if len(word) == 0:
+            raise ZhonglibException('Cannot add an empty word')
+        with _shared_data_lock:
+            node = self._trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            if not None in node:
+                node[None] = True
+                self._count += 1
+                self._word_lengths.add(word)
+
+    # Removes 'word' and any nodes of the trie that are no longer needed.
+    def remove(self, word):
+        with _shared_data_lock:
+            self._remove(word)
+
+    def _remove(self, word):
+        path = [self._trie]
+        for ch in word:
+            node = path[-1].get(ch)
+            if node == None:
+                raise KeyError(word)
+            path.append(node)
+        if not None in path[-1]:
+            raise KeyError(word)
+        del path[-1][None]
+        for idx in xrange(len(word), 0, -1):
+            if len(path[idx]) > 0:
+                break
+            del path[idx-1][word[idx-1]]
+        self._count -= 1
+        if len(word) == self._word_lengths.get(word[0]):
+            self._word_lengths.set(word[0], self._depth(self._trie.get(word[0])))
+
+    # Returns the length of the longest word below 'node', plus one for
+    # 'node' itself, or 0 if there is no node.
+    def _depth(self, node):
+        if node == None:
+            return 0
+        result = 0
+        stack = [(node, 1)]
+        while stack:
+            node, depth = stack.pop()
+            for ch, child in node.items():
+                if ch == None:
+                    result = max(result, depth)
+                else:
+                    stack.append((child, depth + 1))
+        return result
+
+    # See 'WordLengthTable.get'
+    def max_word_length(self, character_set, first_character=None):
+        if not character_set & self.character_set:
+            return 0
+        return self._word_lengths.get(first_character)
+
+    # Returns roughly how many bytes the trie takes up.
+    def memory_use(self):
+        total = 0
+        with _shared_data_lock:
+            stack = [self._trie]
+            while stack:
+                node = stack.pop()
+                total += sys.getsizeof(node)
+                for ch, child in node.items():
+                    if ch != None:
+                        total += sys.getsizeof(ch)
+                        stack.append(child)
+        return total
+
+    # Returns the average time in seconds 'has_word' takes for the words in
+    # 'sample'. Every lookup in a LayeredDictionary goes through every layer
+    # so this is how much each layer adds to a lookup.
+    def lookup_time(self, sample, repeat=3):
+        sample = list(sample)
+        if len(sample) == 0:
+            return 0.0
+        best = None
+        for i in xrange(repeat):
+            start = time.time()
+            for word in sample:
+                self.has_word(self.character_set, word)
+            elapsed = time.time() - start
+            if best == None or elapsed < best:
+                best = elapsed
+        return best/len(sample)
+
+# Reads a user dictionary with one word on each line. Lines starting with
+# '#' are comments.
+def read_user_dictionary(file_name, name=None, character_set=TRADITIONAL|SIMPLIFIED):
+    if not os.path.exists(file_name):
+        raise ZhonglibException('User dictionary does not exist: ' + file_name)
+    words = []
+    with codecs.open(file_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line[0] == '#':
+                continue
+            words.append(line)
+    if name == None:
+        name = os.path.basename(file_name)
+    return UserDictionary(words, name, character_set)
+
+# User dictionaries laid over another dictionary, such as the standard
+# dictionary. A word is in the layered dictionary if it is in any layer or
+# in the base dictionary. 'layers' is kept as it is, not copied, so layers
+# added to or removed from it, and words added to or removed from the
+# layers, take effect straight away.
+class LayeredDictionary:
+
+    def __init__(self, base, layers):
+        self.base = base
+        self.layers = layers
+
+    def has_word(self, character_set, word):
+        for layer in self.layers:
+            if layer.has_word(character_set, word):
+                return True
+        return self.base.has_word(character_set, word)
+
+    # See 'WordLengthTable.get'. Returns None if the base dictionary or a
+    # layer doesn't know its word lengths.
+    def max_word_length(self, character_set, first_character=None):
+        lengths = [
+            _dictionary_max_word_length(d, character_set, first_character, None)
+            for d in [self.base] + self.layers
+        ]
+        if None in lengths:
+            return None
+        return max(lengths)
+
+    # Returns a (name, word count, bytes, seconds per lookup) tuple for each
+    # layer. See 'UserDictionary.lookup_time' for 'sample'.
+    def layer_report(self, sample):
+        sample = list(sample)
+        return [
+            (layer.name, len(layer), layer.memory_use(), layer.lookup_time(sample))
+            for layer in self.layers
+        ]
+
+# User dictionaries laid over the standard lexicon by 'segment'
+__user_dictionaries = []
+
+def add_user_dictionary(user_dictionary):
+    with _shared_data_lock:
+        __user_dictionaries.append(user_dictionary)
+
+def remove_user_dictionary(user_dictionary):
+    with _shared_data_lock:
+        __user_dictionaries.remove(user_dictionary)
+
+def user_dictionaries():
+    with _shared_data_lock:
+        return list(__user_dictionaries)
+
+# If 'max_word_length' is None, it is taken from 'dictionary'. Dictionaries
+# without 'max_word_length' have to be given one.
+def _segment_max_word_length(dictionary, character_set, max_word_length):
+    if max_word_length == None:
+        max_word_length = _dictionary_max_word_length(dictionary, character_set, None, None)
+    if max_word_length == None:
+        raise ZhonglibException('max_word_length is needed for this dictionary')
+    return max_word_length
+
+# Values for the 'method' argument of 'segment'
+_segmentation_methods = frozenset({'mmseg', 'max_probability'})
+
+# Tracing of 'segment'. It is off unless there is a hook or stats are
+# enabled, in which case every call of 'segment' makes a SegmentationTrace.
+__segmentation_hook = None
+__segmentation_stats = None
+
+# 'hook' is called with the SegmentationTrace of each call of 'segment'
+# once the call has finished, including calls that raise an exception.
+# A hook of None turns this off.
+def set_segmentation_hook(hook):
+    global __segmentation_hook
+    __segmentation_hook = hook
+
+# Starts totalling the traces of 'segment' calls in a new SegmentationStats
+# or, if 'enabled' is False, stops.
+def enable_segmentation_stats(enabled=True, slowest_count=10):
+    global __segmentation_stats
+    if enabled:
+        __segmentation_stats = SegmentationStats(slowest_count)
+    else:
+        __segmentation_stats = None
+
+# Returns the SegmentationStats being totalled, or None if stats aren't
+# enabled.
+def segmentation_stats():
+    return __segmentation_stats
+
+def reset_segmentation_stats():
+    if __segmentation_stats != None:
+        enable_segmentation_stats(True, __segmentation_stats.slowest_count)
+
 # Segments a piece of text.  Whitespace and punctuation are used as the
 # primary segmentation points.  After that, each contiguous string of
 # characters is segmented using 'segment_contiguous.'
-# 'character_set' is one of TRADITIONAL or SIMPLIFIED.
-
-def segment(text, character_set, dictionary=None, max_word_length=None, frequency_table=None):
-    assert character_set == TRADITIONAL or character_set == SIMPLIFIED
-    if dictionary == None:
-        dictionary = standard_dictionary()
-        max_word_length = 9  # Fix this. It should be based on dictionary contents.
-    if frequency_table == None:
-        frequency_table = get_frequency_table(character_set)
+# 'character_set' is one of TRADITIONAL or SIMPLIFIED, or AUTO to use the
+# one found by 'detect_character_set'.
+#
+# With 'method' set to 'max_probability', 'segment_max_probability' is used
+# instead with 'word_model', which is the standard word model if None. If
+# there is no 'dictionary', the word model is used as the dictionary.
+#
+# 'on_unknown' says what to do when the text can't be segmented. 'raise'
+# raises DecompositionError. 'single' makes each unknown character a word
+# of its own and 'merge' makes each run of unknown characters one word.
+# If 'statistics' is a SegmentationStatistics, the words found, including
+# unknown ones, are counted in it.
+#
+# When there is no 'dictionary', the user dictionaries added with
+# 'add_user_dictionary' are laid over the standard one. 'max_word_length'
+# only has to be given for dictionaries that can't tell how long their
+# words are.
+#
+# Calls are traced if there is a hook set with 'set_segmentation_hook' or
+# stats have been enabled with 'enable_segmentation_stats'.
+def segment(text, character_set, dictionary=None, max_word_length=None, frequency_table=None,
+        method='mmseg', word_model=None, on_unknown='raise', statistics=None):
+    hook = __segmentation_hook
+    stats = __segmentation_stats
+    if hook == None and stats == None:
+        return _segment(text, character_set, dictionary, max_word_length, frequency_table,
+            method, word_model, on_unknown, statistics, None)
+    trace = SegmentationTrace(text, character_set, method)
+    start = time.time()
+    try:
+        result = _segment(text, character_set, dictionary, max_word_length, frequency_table,
+            method, word_model, on_unknown, statistics, trace)
+        trace.word_count = len(result)
+        return result
+    except Exception as e:
+        trace.error = e.__class__.__name__
+        raise
+    finally:
+        trace.seconds = time.time() - start
+        if stats != None:
+            stats._add_trace(trace)
+        if hook != None:
+            hook(trace)
+
+def _segment(text, character_set, dictionary, max_word_length, frequency_table,
+        method, word_model, on_unknown, statistics, trace):
+    if character_set == AUTO:
+        character_set = detect_character_set(text)
+        if trace != None:
+            trace.character_set = character_set
+    segment_text = _contiguous_segmenter(character_set, dictionary, max_word_length,
+        frequency_table, method, word_model, on_unknown, statistics, trace)
     result = []
     for c in split_into_contiguous(text):
-        result += segment_contiguous(
-            c,
+        result += segment_text(c)
+    return result
+
+# Returns a function that segments a contiguous string of characters with
+# the arguments of 'segment', except that 'character_set' can't be AUTO.
+# The standard data is looked up once so the function can be used on many
+# strings.
+def _contiguous_segmenter(character_set, dictionary, max_word_length, frequency_table,
+        method, word_model, on_unknown, statistics=None, trace=None):
+    assert character_set == TRADITIONAL or character_set == SIMPLIFIED
+    if not method in _segmentation_methods:
+        raise ZhonglibException('Invalid segmentation method: ' + method)
+    if not on_unknown in _on_unknown_values:
+        raise ZhonglibException('Invalid value for on_unknown: ' + on_unknown)
+    if method == 'max_probability':
+        if word_model == None:
+            word_model = standard_word_model(character_set)
+        if dictionary == None:
+            dictionary = LayeredDictionary(word_model, user_dictionaries())
+        max_word_length = _segment_max_word_length(dictionary, character_set, max_word_length)
+        if trace != None:
+            dictionary = _ProbeCountingDictionary(dictionary, trace)
+        return lambda text: segment_max_probability(
+            text,
             character_set,
             dictionary,
             max_word_length,
-            frequency_table
+            word_model,
+            on_unknown,
+            statistics
         )
+    if dictionary == None:
+        dictionary = LayeredDictionary(standard_dictionary(), user_dictionaries())
+    max_word_length = _segment_max_word_length(dictionary, character_set, max_word_length)
+    if trace != None:
+        dictionary = _ProbeCountingDictionary(dictionary, trace)
+    if frequency_table == None:
+        frequency_table = get_frequency_table(character_set)
+    return lambda text: segment_contiguous(
+        text,
+        character_set,
+        dictionary,
+        max_word_length,
+        frequency_table,
+        on_unknown,
+        statistics,
+        trace
+    )
+
+# Segments each of 'texts' with the same arguments as 'segment'
+def segment_many(texts, character_set, dictionary=None, max_word_length=None,
+        frequency_table=None, method='mmseg', word_model=None, on_unknown='raise'):
+    return [
+        segment(text, character_set, dictionary, max_word_length, frequency_table,
+            method, word_model, on_unknown)
+        for text in texts
+    ]
+
+#==============================================================================
+# Whoosh analysis
+
+# Ideographs, which are segmented into words. Characters outside the Basic
+# Multilingual Plane are only included where Python can match them as
+# single characters.
+_ideograph_ranges = u'\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+if sys.maxunicode > 0xFFFF:
+    _ideograph_ranges += u'\U00020000-\U0002b81f\U0002f800-\U0002fa1f'
+
+# A run of ideographs, or a run of other word characters as matched by
+# RegexTokenizer's default pattern.
+_chinese_token_pattern = re.compile(
+    u'([%s]+)|[^\\W%s]+(?:\\.?[^\\W%s]+)*'%(_ideograph_ranges, _ideograph_ranges, _ideograph_ranges),
+    re.UNICODE)
+
+# A Whoosh tokenizer that splits runs of Chinese characters into words with
+# 'segment' and takes other words, e.g. in English, as RegexTokenizer does.
+# It records positions and character offsets as asked.
+#
+# 'character_set' is TRADITIONAL, SIMPLIFIED or AUTO, in which case it is
+# detected once for each text. The other arguments are passed on to
+# 'segment'; 'on_unknown' is 'single' so that text is never rejected.
+#
+# The standard data is looked up once for each text rather than for each
+# run, and these calls of 'segment' aren't traced. The words of each run of
+# Chinese characters are kept in a cache of up to 'cache_size' runs, which
+# is emptied when it is full. The cache isn't kept when the tokenizer is
+# pickled into a Whoosh schema. Any dictionary or word model given must be
+# picklable for that.
+class ChineseTokenizer(whoosh.analysis.Tokenizer):
+
+    def __init__(self, character_set=AUTO, dictionary=None, max_word_length=None,
+            frequency_table=None, method='mmseg', word_model=None, on_unknown='single',
+            cache_size=100000):
+        self.character_set = character_set
+        self.dictionary = dictionary
+        self.max_word_length = max_word_length
+        self.frequency_table = frequency_table
+        self.method = method
+        self.word_model = word_model
+        self.on_unknown = on_unknown
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_cache'] = {}
+        return state
+
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and \
+            self.__getstate__() == other.__getstate__()
+
+    def __ne__(self, other):
+        return not self == other
+
+    # Returns the words of 'run', a run of Chinese characters. 'segmenters'
+    # holds the functions from '_contiguous_segmenter' made for the text
+    # being tokenized, by character set.
+    def _words(self, run, character_set, segmenters):
+        key = (run, character_set)
+        words = self._cache.get(key)
+        if words == None:
+            segment_run = segmenters.get(character_set)
+            if segment_run == None:
+                segment_run = _contiguous_segmenter(character_set, self.dictionary,
+                    self.max_word_length, self.frequency_table, self.method,
+                    self.word_model, self.on_unknown)
+                segmenters[character_set] = segment_run
+            words = segment_run(run)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[key] = words
+        return words
+
+    def __call__(self, value, positions=False, chars=False, keeporiginal=False,
+            removestops=True, start_pos=0, start_char=0, tokenize=True, mode='', **kwargs):
+        token = whoosh.analysis.Token(positions, chars, removestops=removestops, mode=mode, **kwargs)
+        if not tokenize:
+            token.original = token.text = value
+            token.boost = 1.0
+            if positions:
+                token.pos = start_pos
+            if chars:
+                token.startchar = start_char
+                token.endchar = start_char + len(value)
+            yield token
+            return
+        character_set = self.character_set
+        if character_set == AUTO:
+            character_set = detect_character_set(value)
+        segmenters = {}
+        pos = start_pos
+        for match in _chinese_token_pattern.finditer(value):
+            if match.group(1) == None:
+                words = (match.group(0),)
+            else:
+                words = self._words(match.group(0), character_set, segmenters)
+            offset = match.start()
+            for word in words:
+                token.text = word
+                token.boost = 1.0
+                if keeporiginal:
+                    token.original = word
+                token.stopped = False
+                if positions:
+                    token.pos = pos
+                if chars:
+                    token.startchar = start_char + offset
+                    token.endchar = start_char + offset + len(word)
+                pos += 1
+                offset += len(word)
+                yield token
+
+# A ChineseTokenizer with the words in other languages lowercased, like
+# Whoosh's SimpleAnalyzer. The arguments are those of ChineseTokenizer.
+def ChineseAnalyzer(*args, **kwargs):
+    return ChineseTokenizer(*args, **kwargs) | whoosh.analysis.LowercaseFilter()
+
+# Like ChineseTokenizer but runs of Chinese characters are split into
+# overlapping pairs of characters rather than words. A run of one character
+# is a token on its own. Pairs don't depend on the dictionary, so they find
+# words that segmentation splits differently in different texts.
+class ChineseBigramTokenizer(whoosh.analysis.Tokenizer):
+
+    def __eq__(self, other):
+        return self.__class__ is other.__class__
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __call__(self, value, positions=False, chars=False, keeporiginal=False,
+            removestops=True, start_pos=0, start_char=0, tokenize=True, mode='', **kwargs):
+        token = whoosh.analysis.Token(positions, chars, removestops=removestops, mode=mode, **kwargs)
+        pos = start_pos
+        for match in _chinese_token_pattern.finditer(value):
+            start, end = match.span()
+            if match.group(1) == None or end - start == 1:
+                spans = ((start, end),)
+            else:
+                spans = ((i, i + 2) for i in xrange(start, end - 1))
+            for token_start, token_end in spans:
+                token.text = value[token_start:token_end]
+                token.boost = 1.0
+                if keeporiginal:
+                    token.original = token.text
+                token.stopped = False
+                if positions:
+                    token.pos = pos
+                if chars:
+                    token.startchar = start_char + token_start
+                    token.endchar = start_char + token_end
+                pos += 1
+                yield token
+
+def ChineseBigramAnalyzer():
+    return ChineseBigramTokenizer() | whoosh.analysis.LowercaseFilter()
+
+#==============================================================================
+# Document index
+
+import whoosh.highlight
+from whoosh.query import And
+from whoosh.query import Or
+
+# Punctuation that ends a sentence for SentenceFragmenter
+_chinese_sentence_characters = u'。！？；….!?;'
+
+# Wraps a Whoosh fragmenter so that matches that overlap or touch are
+# highlighted as one, e.g. the pairs 银行 and 行业 in 银行业, or two words
+# of the query next to each other.
+class _MergingFragmenter(whoosh.highlight.Fragmenter):
+
+    def __init__(self, fragmenter):
+        self._fragmenter = fragmenter
+        self.charlimit = fragmenter.charlimit
+
+    def must_retokenize(self):
+        return self._fragmenter.must_retokenize()
+
+    @staticmethod
+    def _merge(fragments):
+        for fragment in fragments:
+            merged = []
+            for token in sorted(fragment.matches, key=lambda t: t.startchar):
+                if merged and token.startchar <= merged[-1].endchar:
+                    merged[-1].endchar = max(merged[-1].endchar, token.endchar)
+                else:
+                    merged.append(token.copy())
+            fragment.matches = merged
+            yield fragment
+
+    def fragment_tokens(self, text, all_tokens):
+        return self._merge(self._fragmenter.fragment_tokens(text, all_tokens))
+
+    def fragment_matches(self, text, matched_tokens):
+        return self._merge(self._fragmenter.fragment_matches(text, matched_tokens))
+
+# Returns a fragmenter for highlighting. 'sentence' fragments are whole
+# sentences, ended by Chinese or Western punctuation. 'context' fragments
+# are the matched words with up to 'surround' characters either side. As
+# the text is broken into words by the field's analyzer, fragments start
+# and end on word boundaries.
+def chinese_fragmenter(kind='sentence', maxchars=200, surround=20):
+    if kind == 'sentence':
+        fragmenter = whoosh.highlight.SentenceFragmenter(maxchars, _chinese_sentence_characters)
+    elif kind == 'context':
+        fragmenter = whoosh.highlight.ContextFragmenter(maxchars, surround)
+    else:
+        raise ZhonglibException('Invalid fragmenter: ' + kind)
+    return _MergingFragmenter(fragmenter)
+
+# One document found by DocumentIndex.search. 'highlights' is the HTML of
+# the best fragments with the matches in <b> tags or None if highlighting
+# wasn't asked for or the text isn't stored.
+class DocumentHit:
+
+    def __init__(self, identifier, score, highlights):
+        self.id = identifier
+        self.score = score
+        self.highlights = highlights
+
+# Values for the 'mode' argument of 'DocumentIndex.search'
+_document_query_modes = frozenset({'all', 'any'})
+
+# Creates an empty index of Chinese documents in the directory 'path' and
+# returns it as a DocumentIndex. The text of each document is indexed
+# twice: as words found by 'segment' and as pairs of characters, which
+# finds words that aren't in the dictionary or are segmented differently.
+#
+# 'character_set' and the other keyword arguments are those of
+# ChineseTokenizer. If 'store_text' is True, the text is kept in the index
+# so that search results can be highlighted.
+def create_document_index(path, character_set=AUTO, store_text=True, **segment_options):
+    if os.path.exists(path):
+        raise ZhonglibException('Document index already exists: ' + path)
+    os.mkdir(path)
+    schema = Schema(
+        id=ID(stored=True, unique=True),
+        text=TEXT(analyzer=ChineseAnalyzer(character_set, **segment_options), stored=store_text),
+        bigrams=TEXT(analyzer=ChineseBigramAnalyzer()))
+    create_in(path, schema)
+    return DocumentIndex(path)
+
+# An index made by 'create_document_index'
+class DocumentIndex:
+
+    def __init__(self, path):
+        self._index = open_dir(path)
+        self._path = path
+
+    def __len__(self):
+        return self._index.doc_count()
+
+    # Adds the (id, text) pairs from the iterable 'documents', which are
+    # read as they are indexed, and returns the number added. Ids are
+    # unicode strings. With 'update', documents replace those with the same
+    # id.
+    #
+    # With 'procs' more than 1, Whoosh's MpWriter segments and indexes the
+    # documents in that many processes, 'batch_size' documents at a time.
+    # Each process loads the standard data for itself and writes its own
+    # index segment. The segments aren't merged into one here because
+    # MpWriter fails when a process is given no documents to merge.
+    def add_documents(self, documents, procs=1, batch_size=100, update=False):
+        if procs > 1:
+            writer = self._index.writer(procs=procs, batchsize=batch_size, multisegment=True)
+        else:
+            writer = self._index.writer()
+        count = 0
+        try:
+            for identifier, text in documents:
+                if update:
+                    writer.update_document(id=identifier, text=text, bigrams=text)
+                else:
+                    writer.add_document(id=identifier, text=text, bigrams=text)
+                count += 1
+        except:
+            writer.cancel()
+            raise
+        writer.commit()
+        return count
+
+    def delete_document(self, identifier):
+        writer = self._index.writer()
+        writer.delete_by_term('id', identifier)
+        writer.commit()
+
+    # Returns a Whoosh query for 'text' made with the same analyzers as
+    # the documents, so it is segmented the same way. With 'mode' 'all',
+    # documents must have every word of 'text', or every pair of
+    # characters; with 'any', one is enough. Matches on words score higher
+    # than matches on pairs alone.
+    def parse_query(self, text, mode='all'):
+        if not mode in _document_query_modes:
+            raise ZhonglibException('Invalid query mode: ' + mode)
+        if mode == 'all':
+            combine = And
+        else:
+            combine = Or
+        schema = self._index.schema
+        queries = []
+        for field, boost in (('text', 2.0), ('bigrams', 1.0)):
+            terms = []
+            for token in schema[field].analyzer(text):
+                if not token.text in terms:
+                    terms.append(token.text)
+            if terms:
+                queries.append(combine([Term(field, t) for t in terms], boost=boost))
+        if len(queries) == 0:
+            return NullQuery
+        return Or(queries)
+
+    # Returns a DocumentHit for each of the best 'limit' documents for
+    # 'text'. See 'parse_query' for 'mode'. With 'highlight', up to 'top'
+    # fragments of the text are highlighted; see 'chinese_fragmenter' for
+    # 'fragmenter'.
+    def search(self, text, limit=10, mode='all', highlight=True, fragmenter='sentence', top=3):
+        query = self.parse_query(text, mode)
+        highlight = highlight and self._index.schema['text'].stored
+        result = []
+        with self._index.searcher() as searcher:
+            hits = searcher.search(query, limit=limit, terms=highlight)
+            if highlight:
+                hits.fragmenter = chinese_fragmenter(fragmenter)
+            for hit in hits:
+                highlights = None
+                if highlight:
+                    highlights = hit.highlights('text', top=top)
+                    if not highlights:
+                        # Only pairs of characters matched
+                        highlights = hit.highlights('bigrams', text=hit['text'], top=top)
+                result.append(DocumentHit(hit['id'], hit.score, highlights))
+        return result
+
+#==============================================================================
+# Keyword extraction
+
+# Inverse document frequencies of words. Words that aren't in the table
+# get 'default', which should be high as they are rare.
+class IdfTable:
+
+    def __init__(self, idf, default):
+        self._idf = dict(idf)
+        self.default = default
+
+    def __contains__(self, word):
+        return word in self._idf
+
+    def __len__(self):
+        return len(self._idf)
+
+    def __getitem__(self, word):
+        return self._idf.get(word, self.default)
+
+    def items(self):
+        return self._idf.items()
+
+    # Writes the table as lines of word and IDF after a line with the
+    # default.
+    def write(self, file_name):
+        with codecs.open(file_name, 'w', encoding='utf-8') as f:
+            f.write(u'# default %r\n'%self.default)
+            for word, idf in sorted(self._idf.items()):
+                f.write(u'%s %r\n'%(word, idf))
+
+# Blank lines and lines starting with '#', other than the default, are
+# skipped.
+def read_idf_table(file_name):
+    idf = {}
+    default = None
+    with codecs.open(file_name, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            fields = line.split()
+            try:
+                if line.startswith(u'# default '):
+                    default = float(fields[2])
+                elif fields and not line.startswith(u'#'):
+                    word, value = fields
+                    idf[word] = float(value)
+            except (ValueError, IndexError):
+                raise ZhonglibException(u'%s:%s: Bad IDF line: %s'%(
+                    file_name, line_number, line.rstrip()))
+    if default == None:
+        raise ZhonglibException('No default IDF in ' + file_name)
+    return IdfTable(idf, default)
+
+# Makes an IdfTable from 'documents', an iterable of texts, which are
+# segmented with 'segment' and the keyword arguments. The IDF of a word in
+# df of n documents is log((n + 1)/(df + 1)) + 1, so words in every document
+# still count a little and words in none get log(n + 1) + 1.
+def idf_table_from_documents(documents, character_set, **segment_options):
+    segment_options.setdefault('on_unknown', 'single')
+    document_frequencies = collections.defaultdict(int)
+    document_count = 0
+    for text in documents:
+        document_count += 1
+        for word in set(segment(text, character_set, **segment_options)):
+            document_frequencies[word] += 1
+    return IdfTable(
+        ((word, math.log((document_count + 1.0)/(df + 1)) + 1)
+            for word, df in document_frequencies.items()),
+        math.log(document_count + 1.0) + 1)
+
+# Makes an IdfTable from the words of 'word_model'. Without document
+# counts, the IDF of a word is taken to be its information content, -log p,
+# with p from the model, which is high for rare words as an IDF is.
+def idf_table_from_word_model(word_model):
+    idf = dict((word, -word_model.log_probability(word)) for word in word_model)
+    return IdfTable(idf, max(idf.values() or [0.0]))
+
+# The standard IDF tables are only made the first time they are needed.
+__standard_idf_tables = {}
+
+# Made from the standard word model
+def standard_idf_table(character_set):
+    assert character_set == SIMPLIFIED or character_set == TRADITIONAL
+    table = __standard_idf_tables.get(character_set)
+    if table != None:
+        return table
+    with _shared_data_lock:
+        table = __standard_idf_tables.get(character_set)
+        if table == None:
+            table = idf_table_from_word_model(standard_word_model(character_set))
+            __standard_idf_tables[character_set] = table
+    return table
+
+# Values for the 'mode' argument of 'extract_keywords'
+_keyword_modes = frozenset({'tfidf', 'textrank'})
+
+# Scores each word of 'words' by its count times its IDF
+def _tfidf_scores(words, idf_table):
+    counts = collections.OrderedDict()
+    for word in words:
+        counts[word] = counts.get(word, 0) + 1
+    return [(word, count*idf_table[word]) for word, count in counts.items()]
+
+# Scores the words of 'words' with TextRank. Words are linked to the words
+# up to 'window' - 1 places after them, with a weight of the number of
+# times they are that close, and ranked with PageRank.
+def _textrank_scores(words, window, damping=0.85, iterations=30, tolerance=1e-6):
+    links = collections.OrderedDict()
+    for word in words:
+        links.setdefault(word, collections.defaultdict(int))
+    for i, word in enumerate(words):
+        for other in words[i + 1:i + window]:
+            if other != word:
+                links[word][other] += 1
+                links[other][word] += 1
+    if len(links) == 0:
+        return []
+    totals = dict((word, sum(linked.values())) for word, linked in links.items())
+    scores = dict((word, 1.0) for word in links)
+    for i in xrange(iterations):
+        new_scores = {}
+        for word, linked in links.items():
+            rank = sum(scores[other]*weight/totals[other] for other, weight in linked.items())
+            new_scores[word] = (1 - damping) + damping*rank
+        change = max(abs(new_scores[word] - scores[word]) for word in links)
+        scores = new_scores
+        if change < tolerance:
+            break
+    return [(word, scores[word]) for word in links]
+
+# Returns up to 'k' keywords of 'text' as (word, score) pairs, best first.
+# Words with the same score are in the order they first appear.
+#
+# 'text' is segmented with 'segment'; 'method', 'dictionary' and
+# 'word_model' are passed on to it. Only words of at least 'min_length'
+# characters that aren't in 'stop_words' are candidates; punctuation
+# never is.
+#
+# With 'mode' 'tfidf', words are scored by their count times their IDF from
+# 'idf_table', which is the standard one for 'character_set' if None. With
+# 'textrank', words are scored by TextRank over a window of 'window' words.
+def extract_keywords(text, character_set, k=10, mode='tfidf', idf_table=None,
+        min_length=2, stop_words=(), window=5, method='mmseg', dictionary=None, word_model=None):
+    if not mode in _keyword_modes:
+        raise ZhonglibException('Invalid keyword mode: ' + mode)
+    if character_set == AUTO:
+        character_set = detect_character_set(text)
+    words = [
+        word
+        for word in segment(text, character_set, dictionary, method=method,
+            word_model=word_model, on_unknown='single')
+        if len(word) >= min_length and not word in stop_words
+            and any(c.isalnum() for c in word)
+    ]
+    if mode == 'tfidf':
+        if idf_table == None:
+            idf_table = standard_idf_table(character_set)
+        scores = _tfidf_scores(words, idf_table)
+    else:
+        scores = _textrank_scores(words, window)
+    return heapq.nlargest(k, scores, key=lambda item: item[1])
+
+# Keyword arguments of 'extract_keywords' for the worker processes of
+# 'extract_keywords_many'
+_keyword_worker_options = None
+
+def _start_keyword_worker(options):
+    global _keyword_worker_options
+    _keyword_worker_options = options
+
+def _keyword_worker(text):
+    return extract_keywords(text, **_keyword_worker_options)
+
+# Like 'extract_keywords' for each of 'texts'. With 'processes' more than 1,
+# the texts are shared between that many worker processes, 'chunk_size' at
+# a time. The IDF table and the other arguments are sent to each worker
+# once, when it starts, rather than with every text.
+def extract_keywords_many(texts, character_set, k=10, mode='tfidf', idf_table=None,
+        processes=1, chunk_size=16, **options):
+    if mode == 'tfidf' and idf_table == None and character_set != AUTO:
+        idf_table = standard_idf_table(character_set)
+    options.update(character_set=character_set, k=k, mode=mode, idf_table=idf_table)
+    if processes <= 1:
+        return [extract_keywords(text, **options) for text in texts]
+    pool = multiprocessing.Pool(processes, _start_keyword_worker, (options,))
+    try:
+        result = pool.map(_keyword_worker, texts, chunk_size)
+    finally:
+        pool.terminate()
     return result
 
+#==============================================================================
+# Building frequency tables
+
+import whoosh.externalsort
+
+_ideograph_run_pattern = re.compile(u'[%s]+'%_ideograph_ranges, re.UNICODE)
+_ideograph_word_pattern = re.compile(u'[%s]+$'%_ideograph_ranges, re.UNICODE)
+
+# The kinds of entry counted by 'count_corpus', in the order it returns
+# them
+_CHARACTERS = 0
+_WORDS = 1
+_NGRAMS = 2
+
+# Counts the characters, words and n-grams in 'texts' and returns three
+# dictionaries of counts. Only ideographs are counted. Words are those that
+# 'segment' finds with 'segment_options', and n-grams are the runs of
+# 'ngram_length' characters within runs of ideographs.
+def count_corpus(texts, character_set, ngram_length=2, **segment_options):
+    segment_options.setdefault('on_unknown', 'single')
+    characters = collections.defaultdict(int)
+    words = collections.defaultdict(int)
+    ngrams = collections.defaultdict(int)
+    for text in texts:
+        for run in _ideograph_run_pattern.findall(text):
+            for ch in run:
+                characters[ch] += 1
+            for idx in xrange(len(run) - ngram_length + 1):
+                ngrams[run[idx:idx + ngram_length]] += 1
+        for word in segment(text, character_set, **segment_options):
+            if _ideograph_word_pattern.match(word):
+                words[word] += 1
+    return characters, words, ngrams
+
+# Adds up counts of each kind of entry. The totals are kept in memory until
+# there are more than 'max_entries' of them; then they are written out to a
+# whoosh.externalsort.SortingPool as a sorted run, and the runs are merged
+# at the end.
+class _CountMerger:
+
+    def __init__(self, max_entries, tempdir):
+        self._counts = [collections.defaultdict(int) for kind in (_CHARACTERS, _WORDS, _NGRAMS)]
+        self._max_entries = max_entries
+        self._tempdir = tempdir
+        self._pool = None
+
+    def add(self, counts):
+        for totals, more in zip(self._counts, counts):
+            for entry, count in more.iteritems():
+                totals[entry] += count
+        if sum(len(totals) for totals in self._counts) > self._max_entries:
+            self._spill()
+
+    def _spill(self):
+        if self._pool == None:
+            self._pool = whoosh.externalsort.SortingPool(self._max_entries, self._tempdir)
+        for kind, totals in enumerate(self._counts):
+            for entry, count in totals.iteritems():
+                self._pool.add((kind, entry, count))
+        self._pool.save()
+        self._counts = [collections.defaultdict(int) for totals in self._counts]
+
+    # Yields a (kind, entry, count) triple for every entry
+    def items(self):
+        if self._pool == None:
+            for kind, totals in enumerate(self._counts):
+                for entry, count in totals.iteritems():
+                    yield kind, entry, count
+            return
+        self._spill()
+        previous = None
+        total = 0
+        for kind, entry, count in self._pool.items():
+            if (kind, entry) != previous:
+                if previous != None:
+                    yield previous + (total,)
+                previous = (kind, entry)
+                total = 0
+            total += count
+        if previous != None:
+            yield previous + (total,)
+
+# Yields the items of 'iterable' no more than 'window' ahead of those that
+# have been passed back to 'done'. A multiprocessing Pool reads its tasks
+# as fast as it can, so without this it would read a whole corpus into
+# memory.
+class _Throttle:
+
+    def __init__(self, iterable, window):
+        self._iterable = iterable
+        self._slots = threading.Semaphore(window)
+        self._stopped = False
+
+    def __iter__(self):
+        for item in self._iterable:
+            self._slots.acquire()
+            if self._stopped:
+                return
+            yield item
+
+    def done(self):
+        self._slots.release()
+
+    # Lets the Pool's task thread finish if it is waiting
+    def stop(self):
+        self._stopped = True
+        self._slots.release()
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Arguments of 'count_corpus' for the worker processes of
+# 'build_frequency_tables'
+_counting_worker_options = None
+
+def _start_counting_worker(options):
+    global _counting_worker_options
+    _counting_worker_options = options
+
+def _counting_worker(texts):
+    return count_corpus(texts, **_counting_worker_options)
+
+# Counts the characters, words and n-grams of 'texts', an iterable of
+# strings that can be much larger than memory, and writes them to
+# 'directory' as
+#
+#     <name>-frequencies.txt         characters, as read_frequency_table reads
+#     <name>-word-frequencies.txt    words, in the same format
+#     <name>-words.dic               words of two or more characters, as
+#                                    read_word_list reads
+#     <name>-<ngram_length>-grams.txt   n-grams, in the same format as
+#                                    the frequencies
+#
+# Entries are written most frequent first, and those counted fewer than
+# 'min_count' times are left out. 'name' is 'simplified' or 'traditional'
+# for those character sets, so the files can replace those in
+# zhonglib-data, and must be given for AUTO. Returns the paths written, by
+# the names 'characters', 'words', 'word_list' and 'ngrams'.
+#
+# The texts are counted 'chunk_size' at a time by 'processes' worker
+# processes, or in this one if 'processes' is 1. Once more than
+# 'max_entries' distinct entries have been counted, the counts are sorted
+# and merged on disk, in 'tempdir'. The other arguments are passed on to
+# 'segment'.
+def build_frequency_tables(texts, character_set, directory, name=None, ngram_length=2,
+        min_count=1, processes=1, chunk_size=100, max_entries=1000000, tempdir=None,
+        **segment_options):
+    if name == None:
+        if character_set == SIMPLIFIED:
+            name = 'simplified'
+        elif character_set == TRADITIONAL:
+            name = 'traditional'
+        else:
+            raise ZhonglibException('A name is needed for the frequency tables')
+    if ngram_length < 1:
+        raise ZhonglibException('Invalid n-gram length: %d'%ngram_length)
+    options = dict(segment_options, character_set=character_set, ngram_length=ngram_length)
+    merger = _CountMerger(max_entries, tempdir)
+    if processes <= 1:
+        for chunk in _chunks(texts, chunk_size):
+            merger.add(count_corpus(chunk, **options))
+    else:
+        throttle = _Throttle(_chunks(texts, chunk_size), 2*processes)
+        pool = multiprocessing.Pool(processes, _start_counting_worker, (options,))
+        try:
+            for counts in pool.imap_unordered(_counting_worker, throttle):
+                throttle.done()
+                merger.add(counts)
+        finally:
+            throttle.stop()
+            pool.terminate()
+
+    paths = {
+        'characters': os.path.join(directory, name + '-frequencies.txt'),
+        'words': os.path.join(directory, name + '-word-frequencies.txt'),
+        'word_list': os.path.join(directory, name + '-words.dic'),
+        'ngrams': os.path.join(directory, '%s-%d-grams.txt'%(name, ngram_length)),
+    }
+    files = [
+        codecs.open(paths[key], 'w', encoding='utf-8')
+        for key in ('characters', 'words', 'ngrams', 'word_list')
+    ]
+    try:
+        ranked = whoosh.externalsort.sort(
+            ((kind, -count, entry) for kind, entry, count in merger.items() if count >= min_count),
+            max_entries, tempdir)
+        for kind, count, entry in ranked:
+            files[kind].write(u'%s %d\n'%(entry, -count))
+            if kind == _WORDS and len(entry) > 1:
+                files[-1].write(u'%d %s\n'%(len(entry), entry))
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+#==============================================================================
+# Near-duplicate detection
+
+import whoosh.classify
+
+_fingerprint_bits = 64
+
+# Changed whenever the layout of DuplicateIndex files changes
+_duplicate_index_version = 1
+
+# Returns the 64-bit SimHash of the shingles of 'shingle_size' words of
+# 'text', weighted by how often they occur. Texts that differ in a few
+# words have fingerprints that differ in a few bits. Words are found with
+# 'segment' and 'segment_options', and punctuation is left out. Texts
+# without any words, such as empty ones, have no fingerprint and give None.
+def document_fingerprint(text, character_set, shingle_size=3, **segment_options):
+    segment_options.setdefault('on_unknown', 'single')
+    words = tuple(
+        word
+        for word in segment(text, character_set, **segment_options)
+        if any(c.isalnum() for c in word)
+    )
+    if len(words) == 0:
+        return None
+    size = max(1, min(shingle_size, len(words)))
+    features = (
+        (u' '.join(shingle), weight)
+        for shingle, weight in whoosh.classify.shingles(words, size)
+    )
+    return whoosh.classify.simhash(features, _fingerprint_bits)
+
+# Finds documents whose fingerprints differ from a given one in no more than
+# 'max_distance' bits. The fingerprints are split into 'bands' bands, and
+# each band has a table from its bits to the documents with those bits.
+# With at least max_distance + 1 bands, a fingerprint that close to another
+# has the same bits in at least one band, so only the documents in the same
+# entry of one of the tables need to be compared.
+#
+# 'character_set', 'shingle_size' and the keyword arguments are used for
+# 'document_fingerprint'. Documents can be added and removed at any time,
+# so one index can be used for a stream of documents.
+class DuplicateIndex:
+
+    def __init__(self, character_set, max_distance=3, bands=None, shingle_size=3,
+            **segment_options):
+        if bands == None:
+            bands = max_distance + 1
+        if bands <= max_distance or bands > _fingerprint_bits:
+            raise ZhonglibException(
+                'Invalid number of bands for a distance of %d: %d'%(max_distance, bands))
+        self.character_set = character_set
+        self.max_distance = max_distance
+        self.shingle_size = shingle_size
+        self._segment_options = segment_options
+        # (shift, mask) of each band; the last band has the bits left over
+        width = _fingerprint_bits//bands
+        self._bands = [
+            (idx*width, (1 << (width if idx < bands - 1 else _fingerprint_bits - idx*width)) - 1)
+            for idx in xrange(bands)
+        ]
+        self._tables = [{} for band in self._bands]
+        # id -> (the order it was added in, fingerprint)
+        self._fingerprints = {}
+        self._added = 0
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def __contains__(self, id):
+        return id in self._fingerprints
+
+    def fingerprint(self, text):
+        return document_fingerprint(text, self.character_set, self.shingle_size,
+            **self._segment_options)
+
+    # Adds a document by its fingerprint, replacing any document with the
+    # same id.
+    def add(self, id, fingerprint):
+        if id in self._fingerprints:
+            self.remove(id)
+        self._fingerprints[id] = (self._added, fingerprint)
+        self._added += 1
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            table.setdefault((fingerprint >> shift) & mask, []).append(id)
+
+    def remove(self, id):
+        order, fingerprint = self._fingerprints.pop(id)
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            key = (fingerprint >> shift) & mask
+            ids = table[key]
+            ids.remove(id)
+            if len(ids) == 0:
+                del table[key]
+
+    # Returns (id, distance) pairs for the documents within 'max_distance'
+    # bits of 'fingerprint', closest first and then in the order they were
+    # added. A fingerprint of None has no near duplicates.
+    def find(self, fingerprint):
+        if fingerprint == None:
+            return []
+        candidates = set()
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            candidates.update(table.get((fingerprint >> shift) & mask, ()))
+        found = []
+        for id in candidates:
+            order, other = self._fingerprints[id]
+            distance = whoosh.classify.hamming_distance(fingerprint, other, _fingerprint_bits)
+            if distance <= self.max_distance:
+                found.append((distance, order, id))
+        found.sort()
+        return [(id, distance) for distance, order, id in found]
+
+    # Returns the near duplicates of 'text' already in the index, as for
+    # 'find', and then adds it. A text without words isn't added because
+    # it has no fingerprint to compare.
+    def add_document(self, id, text):
+        fingerprint = self.fingerprint(text)
+        if fingerprint == None:
+            return []
+        found = self.find(fingerprint)
+        self.add(id, fingerprint)
+        return found
+
+    # Writes the fingerprints and settings but not the segmentation
+    # arguments, which are given to 'read_duplicate_index'. Ids must be
+    # strings or numbers.
+    def write(self, file_name):
+        ranked = sorted((order, id, fingerprint)
+            for id, (order, fingerprint) in self._fingerprints.items())
+        value = (
+            _duplicate_index_version,
+            self.character_set,
+            self.max_distance,
+            len(self._bands),
+            self.shingle_size,
+            [id for order, id, fingerprint in ranked],
+            [fingerprint for order, id, fingerprint in ranked],
+        )
+        with open(file_name, 'wb') as f:
+            marshal.dump(value, f)
+
+def read_duplicate_index(file_name, **segment_options):
+    with open(file_name, 'rb') as f:
+        value = marshal.load(f)
+    if value[0] != _duplicate_index_version:
+        raise ZhonglibException('Unsupported duplicate index version in ' + file_name)
+    version, character_set, max_distance, bands, shingle_size, ids, fingerprints = value
+    index = DuplicateIndex(character_set, max_distance, bands, shingle_size, **segment_options)
+    for id, fingerprint in zip(ids, fingerprints):
+        index.add(id, fingerprint)
+    return index
+
+# Yields the (id, text) pairs of 'documents' that aren't near duplicates of
+# one yielded before, or of one already in 'index'. Those yielded are added
+# to the index, which is made with 'character_set' and the keyword
+# arguments if it is None, so it can be kept for the next stream. Texts
+# without words are always yielded and never added.
+def unique_documents(documents, character_set, index=None, **options):
+    if index == None:
+        index = DuplicateIndex(character_set, **options)
+    for id, text in documents:
+        fingerprint = index.fingerprint(text)
+        if fingerprint == None:
+            yield id, text
+        elif not index.find(fingerprint):
+            index.add(id, fingerprint)
+            yield id, text
+
 # Helper function for topological_sort below.
 def __topological_visit(graph, node, result, marked, tmp_marked):
     if node in tmp_marked:
@@ -1024,6 +4237,10 @@ def __is_id_in_cycle(decomposer, identifier, current_id, visited):
         return True
     if current_id in visited:
         return False
+    # An ID with no record, which the load report lists, can't be part of
+    # a cycle.
+    if not current_id in decomposer:
+        return False
     record = decomposer[current_id]
     try:
         visited.add(current_id)
@@ -1076,3 +4293,320 @@ def check_decomposer_for_cycles(decomposer):
                 msg = 'Group %s is in a cyle.'%identifier
             result.append(msg)
     return result
+
+#==============================================================================
+# Requests run in the background
+
+# The result of a request given to a RequestPool. It can be waited for with
+# 'result' or 'exception', or 'add_done_callback' can be used to hear when
+# it's done, which suits an event loop. Callbacks are called in the worker
+# thread, or straight away if the request is already done. Exceptions
+# raised by callbacks are logged to the 'zhonglib' logger and otherwise
+# ignored.
+class RequestFuture:
+
+    def __init__(self, deadline=None):
+        self._condition = threading.Condition()
+        self._state = 'pending'
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._deadline = deadline
+
+    # Stops the request from being run. Returns False if it has already
+    # started.
+    def cancel(self):
+        if self._finish(None, RequestCancelled('The request was cancelled'), 'cancelled', True):
+            return True
+        return self.cancelled()
+
+    def cancelled(self):
+        return self._state == 'cancelled'
+
+    def done(self):
+        return self._state == 'done' or self._state == 'cancelled'
+
+    # Returns the result of the request or raises its exception. Raises
+    # RequestTimeout if it isn't done within 'timeout' seconds.
+    def result(self, timeout=None):
+        exception = self.exception(timeout)
+        if exception != None:
+            raise exception
+        return self._result
+
+    # Returns the exception raised by the request or None if there wasn't
+    # one. See 'result' for 'timeout'.
+    def exception(self, timeout=None):
+        with self._condition:
+            if timeout != None:
+                end = time.time() + timeout
+            while not self.done():
+                if timeout == None:
+                    self._condition.wait()
+                else:
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        raise RequestTimeout('Timed out waiting for the request')
+                    self._condition.wait(remaining)
+            return self._exception
+
+    def add_done_callback(self, callback):
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+    # Called by the worker before running the request. Returns False if it
+    # mustn't be run because it was cancelled or its deadline has passed.
+    def _start(self):
+        with self._condition:
+            if self._state != 'pending':
+                return False
+            if self._deadline == None or time.time() <= self._deadline:
+                self._state = 'running'
+                return True
+        self._finish(None, RequestTimeout('The request was not started in time'))
+        return False
+
+    # Sets the outcome of the request unless it is already done, or, with
+    # 'only_if_pending', has started. Returns whether it was set.
+    def _finish(self, result, exception, state='done', only_if_pending=False):
+        with self._condition:
+            if self.done() or (only_if_pending and self._state != 'pending'):
+                return False
+            self._result = result
+            self._exception = exception
+            self._state = state
+            callbacks = self._callbacks
+            self._callbacks = []
+            self._condition.notify_all()
+        for callback in callbacks:
+            self._call(callback)
+        return True
+
+    # A callback that raises is logged, so that it can't stop the worker or
+    # the other callbacks.
+    def _call(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            _log.exception('A RequestFuture callback raised an exception')
+
+# Two requests can be run together if their keys are the same. Options are
+# compared by identity, except for numbers and strings, so that big objects
+# such as frequency tables aren't compared item by item.
+def _same_request_key(key_1, key_2):
+    if len(key_1) != len(key_2):
+        return False
+    for x, y in zip(key_1, key_2):
+        if x is y:
+            continue
+        if isinstance(x, (int, long, basestring)) and x == y:
+            continue
+        return False
+    return True
+
+# Runs lookups and segmentation in worker threads so that callers, such as
+# an event loop, aren't blocked. Each method returns a RequestFuture.
+#
+# At most 'max_pending' requests can wait; beyond that, ZhonglibException
+# is raised rather than blocking the caller. A request with a 'timeout'
+# that hasn't been started within that many seconds fails with
+# RequestTimeout. The timeout only covers the wait to be started: a request
+# that has started runs to the end, and 'RequestFuture.result' waits for it
+# unless given a timeout of its own. Requests that haven't been started can
+# be cancelled.
+#
+# A worker takes up to 'batch_size' waiting requests at a time. Requests of
+# the same kind with the same options are run as one bulk operation, e.g.
+# many 'find' requests become one 'Dictionary.find_many' with one searcher.
+# If a bulk operation fails, its requests are run one by one so that only
+# the ones at fault fail.
+#
+# Lookups use 'dictionary', or the standard dictionary if it's None.
+#
+# The workers share the module's data, which is built under
+# _shared_data_lock, and SegmentationStats, which has its own lock.
+# Dictionaries, word models and the like given as options are shared too,
+# so they mustn't be changed while requests that use them are running,
+# except for UserDictionary, which can be.
+class RequestPool:
+
+    def __init__(self, workers=4, max_pending=1000, batch_size=32, dictionary=None):
+        assert workers > 0 and batch_size > 0
+        self._queue = Queue.Queue(max_pending)
+        self._batch_size = batch_size
+        self._dictionary = dictionary
+        # Held while '_closed' is checked and a request queued, so that no
+        # request can be queued behind the workers' stop signals.
+        self._lock = threading.Lock()
+        self._closed = False
+        self._running_workers = workers
+        self._threads = []
+        for i in xrange(workers):
+            thread = threading.Thread(target=self._work, name='zhonglib-request-%s'%i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+    def find(self, word, character_set=0, include_english=False, timeout=None):
+        return self._submit(self._find_many, (character_set, include_english), [word], True, timeout)
+
+    def find_many(self, words, character_set=0, include_english=False, timeout=None):
+        return self._submit(self._find_many, (character_set, include_english), list(words), False, timeout)
+
+    # See 'segment' for the arguments
+    def segment(self, text, character_set, dictionary=None, max_word_length=None,
+            frequency_table=None, method='mmseg', word_model=None, on_unknown='raise', timeout=None):
+        key = (character_set, dictionary, max_word_length, frequency_table, method, word_model, on_unknown)
+        return self._submit(self._segment_many, key, [text], True, timeout)
+
+    def segment_many(self, texts, character_set, dictionary=None, max_word_length=None,
+            frequency_table=None, method='mmseg', word_model=None, on_unknown='raise', timeout=None):
+        key = (character_set, dictionary, max_word_length, frequency_table, method, word_model, on_unknown)
+        return self._submit(self._segment_many, key, list(texts), False, timeout)
+
+    def decompose(self, text, character_set, timeout=None):
+        return self._submit(self._decompose_many, (character_set,), [text], True, timeout)
+
+    # Stops the workers once the waiting requests have been run. With
+    # 'wait', returns only after they have stopped.
+    def close(self, wait=True):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for thread in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _submit(self, function, key, items, single, timeout):
+        deadline = None
+        if timeout != None:
+            deadline = time.time() + timeout
+        future = RequestFuture(deadline)
+        with self._lock:
+            if self._closed:
+                raise ZhonglibException('The request pool is closed')
+            try:
+                self._queue.put_nowait((function, key, items, single, future))
+            except Queue.Full:
+                raise ZhonglibException('Too many requests are waiting')
+        return future
+
+    # The bulk operations. Each returns one result for each item.
+
+    def _find_many(self, key, words):
+        dictionary = self._dictionary
+        if dictionary == None:
+            dictionary = standard_dictionary()
+        character_set, include_english = key
+        return dictionary.find_many(words, character_set, include_english)
+
+    def _segment_many(self, key, texts):
+        return segment_many(texts, *key)
+
+    def _decompose_many(self, key, texts):
+        return [decompose(text, key[0]) for text in texts]
+
+    # The last worker to stop fails any requests still waiting, so that
+    # nobody waits for them for ever.
+    def _work(self):
+        try:
+            self._serve()
+        finally:
+            with self._lock:
+                self._running_workers -= 1
+                last = self._running_workers == 0
+            if last:
+                self._fail_waiting()
+
+    def _fail_waiting(self):
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except Queue.Empty:
+                return
+            if request != None:
+                request[4]._finish(None, ZhonglibException('The request pool is closed'))
+
+    def _serve(self):
+        stop = False
+        while not stop:
+            request = self._queue.get()
+            if request == None:
+                return
+            batch = [request]
+            while len(batch) < self._batch_size:
+                try:
+                    request = self._queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if request == None:
+                    stop = True
+                    break
+                batch.append(request)
+            groups = []
+            for request in batch:
+                function, key = request[0], request[1]
+                for group in groups:
+                    if group[0] == function and _same_request_key(group[1], key):
+                        group[2].append(request)
+                        break
+                else:
+                    groups.append((function, key, [request]))
+            for function, key, requests in groups:
+                try:
+                    self._run(function, key, requests)
+                except Exception as e:
+                    # Whatever went wrong, the requests mustn't be left
+                    # waiting.
+                    _log.exception('A RequestPool worker failed')
+                    for request in requests:
+                        request[4]._finish(None, e)
+
+    def _run(self, function, key, requests):
+        requests = [r for r in requests if r[4]._start()]
+        if len(requests) == 0:
+            return
+        items = []
+        for r in requests:
+            items.extend(r[2])
+        try:
+            results = function(key, items)
+        except Exception as e:
+            if len(requests) == 1:
+                requests[0][4]._finish(None, e)
+            else:
+                for r in requests:
+                    self._run_one(function, key, r)
+            return
+        idx = 0
+        for function, key, request_items, single, future in requests:
+            request_results = results[idx:idx + len(request_items)]
+            idx += len(request_items)
+            if single:
+                future._finish(request_results[0], None)
+            else:
+                future._finish(request_results, None)
+
+    def _run_one(self, function, key, request):
+        items, single, future = request[2], request[3], request[4]
+        try:
+            results = function(key, items)
+        except Exception as e:
+            future._finish(None, e)
+            return
+        if single:
+            future._finish(results[0], None)
+        else:
+            future._finish(results, None)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# Client for the zhonglib server, zhonglibd.py. The server keeps one warm
+# copy of the dictionary, frequency tables and decomposer, so processes that
+# use this client instead of importing zhonglib don't load their own. This
+# module doesn't import zhonglib.
+#
+# The protocol is HTTP/1.1 over localhost TCP or a Unix socket. A batch of
+# requests is POSTed to /batch as JSON:
+#
+#     {"requests": [["segment", "我们的", "simplified"],
+#                   ["find", "银行", "both", false]]}
+#
+# and the reply has one result for each request, in the same order:
+#
+#     {"results": [["ok", ["我们", "的"]], ["error", "..."]]}
+#
+# The requests are
+#
+#     ["segment", text, character set, method, on_unknown]
+#     ["find", word, character set, include_english]
+#     ["decompose", text, character set]
+#     ["pinyin", text, character set]
+#
+# where the arguments after the text can be left out. Character sets are
+# "simplified", "traditional", "both" (only for find) or "auto" (for the
+# others, which is the default). GET /status returns the server's counters.
+
+import httplib
+import json
+import socket
+import threading
+
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+
+# Raised for requests that failed on the server and for replies that
+# aren't understood.
+class ServerError(Exception):
+
+    def __init__(self, message):
+        self.message = message
+
+    def __unicode__(self):
+        return self.message
+
+    def __str__(self):
+        return self.message.encode('utf-8')
+
+# An HTTP connection over a Unix socket
+class _UnixHTTPConnection(httplib.HTTPConnection):
+
+    def __init__(self, path, timeout):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+# Addresses with a '/' in them are Unix socket paths. Others are
+# 'host:port'.
+def _is_unix_address(address):
+    return '/' in address
+
+# Talks to a server at 'address'. Connections are kept open and reused;
+# at most 'max_connections' are used at once, so that many threads can
+# share a Client.
+class Client:
+
+    def __init__(self, address=DEFAULT_ADDRESS, max_connections=4, timeout=30):
+        self._address = address
+        self._timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _new_connection(self):
+        if _is_unix_address(self._address):
+            return _UnixHTTPConnection(self._address, self._timeout)
+        host, port = self._address.rsplit(':', 1)
+        return httplib.HTTPConnection(host, int(port), timeout=self._timeout)
+
+    # Returns (connection, whether it was used before)
+    def _take_connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _request(self, method, path, body=None):
+        with self._slots:
+            connection, reused = self._take_connection()
+            while True:
+                try:
+                    headers = {}
+                    if body != None:
+                        headers['Content-Type'] = 'application/json'
+                    connection.request(method, path, body, headers)
+                    response = connection.getresponse()
+                    data = response.read()
+                    break
+                except (httplib.HTTPException, socket.error):
+                    connection.close()
+                    # The server may have closed an idle connection. Try
+                    # again with a new one, but only once.
+                    if not reused:
+                        raise
+                    connection, reused = self._new_connection(), False
+            if response.will_close:
+                connection.close()
+            else:
+                with self._lock:
+                    self._idle.append(connection)
+        if response.status != 200:
+            raise ServerError(u'Server replied %s: %s'%(response.status, data.decode('utf-8', 'replace')))
+        return json.loads(data)
+
+    # Sends 'requests', a list of requests as described at the top of this
+    # file, and returns a result for each one; either ['ok', value] or
+    # ['error', message].
+    def batch(self, requests):
+        reply = self._request('POST', '/batch', json.dumps({'requests': requests}))
+        results = reply.get('results')
+        if not isinstance(results, list) or len(results) != len(requests):
+            raise ServerError(u'Bad reply from server')
+        return results
+
+    # Like 'batch' but returns just the values, raising ServerError for the
+    # first request that failed.
+    def call(self, requests):
+        values = []
+        for status, value in self.batch(requests):
+            if status != 'ok':
+                raise ServerError(value)
+            values.append(value)
+        return values
+
+    def segment(self, text, character_set='auto', method='mmseg', on_unknown='raise'):
+        return self.call([['segment', text, character_set, method, on_unknown]])[0]
+
+    def segment_many(self, texts, character_set='auto', method='mmseg', on_unknown='raise'):
+        return self.call([['segment', text, character_set, method, on_unknown] for text in texts])
+
+    # Returns the entries found as (traditional, simplified, pinyin, english)
+    # tuples.
+    def find(self, word, character_set='both', include_english=False):
+        entries = self.call([['find', word, character_set, include_english]])[0]
+        return [tuple(entry) for entry in entries]
+
+    def decompose(self, text, character_set='auto'):
+        return self.call([['decompose', text, character_set]])[0]
+
+    # Returns (word, reading) pairs where a reading is a list of
+    # (syllable, tone) pairs or None, as for zhonglib.to_pinyin
+    def pinyin(self, text, character_set='auto'):
+        result = []
+        for word, reading in self.call([['pinyin', text, character_set]])[0]:
+            result.append((word, [tuple(pair) if pair != None else None for pair in reading]))
+        return result
+
+    def status(self):
+        return self._request('GET', '/status')
+
+    def close(self):
+        with self._lock:
+            for connection in self._idle:
+                connection.close()
+            self._idle = []
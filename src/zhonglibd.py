@@ -0,0 +1,248 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+# Serves segment, find, decompose and pinyin requests so that many worker
+# processes can share one warm copy of the dictionary, frequency tables and
+# decomposer. Listens on localhost TCP or on a Unix socket. See
+# zhonglib_client.py for the protocol and the client.
+
+import BaseHTTPServer
+import json
+import os
+import SocketServer
+import stat
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+import zhonglib
+from zhonglib_client import DEFAULT_ADDRESS, _is_unix_address
+
+_character_sets = {
+    'simplified': zhonglib.SIMPLIFIED,
+    'traditional': zhonglib.TRADITIONAL,
+    'both': zhonglib.SIMPLIFIED | zhonglib.TRADITIONAL,
+    'auto': zhonglib.AUTO,
+}
+
+def _character_set(name, allowed):
+    if not name in allowed:
+        raise zhonglib.ZhonglibException(u'Invalid character set: %s'%name)
+    return _character_sets[name]
+
+_text_character_sets = ('simplified', 'traditional', 'auto')
+_find_character_sets = ('simplified', 'traditional', 'both')
+
+# For segmentation, AUTO is left to 'segment'. Decomposition and pinyin
+# need a definite character set.
+def _detected(text, character_set):
+    if character_set == zhonglib.AUTO:
+        return zhonglib.detect_character_set(text)
+    return character_set
+
+def _segment(text, character_set='auto', method='mmseg', on_unknown='raise'):
+    return zhonglib.segment(text, _character_set(character_set, _text_character_sets),
+        method=method, on_unknown=on_unknown)
+
+def _decompose(text, character_set='auto'):
+    character_set = _character_set(character_set, _text_character_sets)
+    return zhonglib.decompose(text, _detected(text, character_set))
+
+def _pinyin(text, character_set='auto'):
+    return zhonglib.to_pinyin(text, _character_set(character_set, _text_character_sets))
+
+def _entry_to_list(entry):
+    return [entry.traditional, entry.simplified, entry.pinyin, entry.raw_english]
+
+# Finds are done together, with one searcher, for each character set and
+# include_english.
+def _find_many(words, character_set, include_english):
+    character_set = _character_set(character_set, _find_character_sets)
+    return [
+        [_entry_to_list(entry) for entry in entries]
+        for entries in zhonglib.find_many(words, character_set, include_english)
+    ]
+
+_operations = {
+    'segment': _segment,
+    'decompose': _decompose,
+    'pinyin': _pinyin,
+}
+
+def _error(exception):
+    return ['error', u'%s: %s'%(exception.__class__.__name__, unicode(exception))]
+
+def run_batch(requests):
+    results = [None]*len(requests)
+    finds = {}
+    for idx, request in enumerate(requests):
+        if (not isinstance(request, list) or len(request) < 2 or
+                not isinstance(request[0], basestring)):
+            results[idx] = ['error', u'Bad request']
+            continue
+        if request[0] == 'find':
+            if len(request) > 2 and not isinstance(request[2], basestring):
+                results[idx] = ['error', u'Bad request']
+                continue
+            key = (request[2] if len(request) > 2 else 'both', bool(len(request) > 3 and request[3]))
+            finds.setdefault(key, []).append(idx)
+            continue
+        operation = _operations.get(request[0])
+        if operation == None:
+            results[idx] = ['error', u'Unknown request: %s'%request[0]]
+            continue
+        try:
+            results[idx] = ['ok', operation(*request[1:])]
+        except Exception as e:
+            results[idx] = _error(e)
+    for (character_set, include_english), indices in finds.items():
+        words = [requests[idx][1] for idx in indices]
+        try:
+            found = _find_many(words, character_set, include_english)
+            for idx, entries in zip(indices, found):
+                results[idx] = ['ok', entries]
+        except Exception as e:
+            for idx in indices:
+                results[idx] = _error(e)
+    return results
+
+# Loads everything that would otherwise be loaded by the first request
+def warm_up(verbose=False):
+    start = time.time()
+    zhonglib.standard_pinyin_converter()
+    zhonglib.standard_character_set_detector()
+    for character_set in (zhonglib.SIMPLIFIED, zhonglib.TRADITIONAL):
+        zhonglib.standard_word_model(character_set)
+    if zhonglib.has_standard_dictionary():
+        zhonglib.standard_dictionary().readings()
+    elif verbose:
+        print >> sys.stderr, 'There is no standard dictionary; find will fail.'
+    if verbose:
+        print >> sys.stderr, 'Warmed up in %.2f seconds'%(time.time() - start)
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, value):
+        body = json.dumps(value)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/status':
+            self._reply(404, {'error': 'Not found'})
+            return
+        self._reply(200, self.server.status())
+
+    def do_POST(self):
+        if self.path != '/batch':
+            self._reply(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.getheader('Content-Length', 0))
+            requests = json.loads(self.rfile.read(length))['requests']
+            if not isinstance(requests, list):
+                raise ValueError('requests is not a list')
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {'error': str(e)})
+            return
+        start = time.time()
+        results = run_batch(requests)
+        self.server.count(len(requests), time.time() - start)
+        self._reply(200, {'results': results})
+
+    # Unix socket clients have no address
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+# Counters shared by both kinds of server
+class _ServerMixin:
+
+    def _start_counting(self, verbose):
+        self.verbose = verbose
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._seconds = 0.0
+
+    def count(self, requests, seconds):
+        with self._lock:
+            self._batches += 1
+            self._requests += requests
+            self._seconds += seconds
+
+    def status(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'uptime': time.time() - self._started,
+                'batches': self._batches,
+                'requests': self._requests,
+                'seconds': self._seconds,
+            }
+
+class TCPServer(_ServerMixin, SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host, port, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), _Handler)
+        self._start_counting(verbose)
+
+class UnixServer(_ServerMixin, SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+    # A socket left at 'path' by an earlier server is removed, but nothing
+    # else is.
+    def __init__(self, path, verbose=False):
+        if os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise zhonglib.ZhonglibException(u'Not a socket: %s'%path)
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+        self._start_counting(verbose)
+
+# 'address' is as for zhonglib_client.Client
+def make_server(address=DEFAULT_ADDRESS, verbose=False):
+    if _is_unix_address(address):
+        return UnixServer(address, verbose)
+    host, port = address.rsplit(':', 1)
+    return TCPServer(host, int(port), verbose)
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-a', '--address', default=DEFAULT_ADDRESS,
+        help='host:port to listen on, or the path of a Unix socket [%default]')
+    parser.add_option('-v', '--verbose', action='store_true', help='Log every request')
+    options, args = parser.parse_args()
+    if args:
+        parser.error('No arguments are expected')
+    warm_up(True)
+    server = make_server(options.address, options.verbose)
+    print >> sys.stderr, 'Listening on', options.address
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if _is_unix_address(options.address) and os.path.exists(options.address):
+            os.remove(options.address)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+# Shared by the tests. This module doesn't start with 'test' so that
+# unittest discovery doesn't look for tests in it.
+
+# A dictionary that only has 'has_word', like the simplest dictionaries
+# 'segment' accepts. Every word is in it for every character set.
+class TestDict:
+
+    def __init__(self, words):
+        self._words = words
+
+    def has_word(self, character_set, text):
+        return text in self._words
@@ -83,6 +83,38 @@ class TestCharacterDecomposition(unittest.TestCase):
         self.assertEquals(self._character_m, self._decomposer['m'])
         self.assertEquals(self._character_n, self._decomposer['n'])
 
+    def test_decomposition_tree_memo(self):
+        memo = {}
+        self.assertEqual(self._character_s, self._decomposer.decomposition_tree('s', memo))
+        self.assertEqual(self._character_r, memo['r'])
+        self.assertTrue(memo['r'] is self._decomposer.decomposition_tree('r', memo))
+
+    def test_decompose_many(self):
+        self.assertEquals(
+            [['m', 'n', 'p'], ['p', 'q', 'n'], ['m', 'n', 'p']],
+            zl.decompose_many('rtr', decomposer=self._decomposer))
+
+    def test_decompose_many_not_flattened(self):
+        self.assertEquals(
+            [self._character_u, self._character_n],
+            zl.decompose_many('un', flatten=False, decomposer=self._decomposer))
+
+    def test_decompose_many_missing(self):
+        self.assertEquals(
+            [['m', 'n', 'p'], ['t']],
+            zl.decompose_many('rzu', decomposer=self._decomposer))
+        self.assertEquals(
+            [['m', 'n', 'p'], None, ['t']],
+            zl.decompose_many('rzu', on_missing='none', decomposer=self._decomposer))
+        with self.assertRaises(zl.ZhonglibException) as cm:
+            zl.decompose_many('rzu', on_missing='raise', decomposer=self._decomposer)
+        self.assertEqual(u'No decomposition data for "z"', cm.exception.message)
+
+    def test_decompose_many_bad_on_missing(self):
+        for on_missing in ['ignore', None, ['skip']]:
+            self.assertRaises(zl.ZhonglibException, zl.decompose_many,
+                'rzu', on_missing=on_missing, decomposer=self._decomposer)
+
     def test_standard_decomposer_1(self):
         decomposition = zl.decompose_character(u'好', flatten=True)
         self.assertEquals([u'女', u'子'], decomposition)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import zhonglib as zl
+
+class TestCharacterSetDetection(unittest.TestCase):
+
+    def test_detector(self):
+        detector = zl.CharacterSetDetector(u'们发', u'們發髮')
+        self.assertEqual(zl.SIMPLIFIED, detector.character_set(u'们'))
+        self.assertEqual(zl.TRADITIONAL, detector.character_set(u'髮'))
+        self.assertEqual(0, detector.character_set(u'我'))
+        self.assertEqual(0, detector.character_set(u'a'))
+        self.assertEqual((1, 2), detector.counts(u'我們发髮'))
+        self.assertEqual(zl.TRADITIONAL, detector.detect(u'我們发髮'))
+        self.assertEqual(zl.SIMPLIFIED, detector.detect(u'我们'))
+        self.assertEqual(zl.TRADITIONAL, detector.detect(u'我', zl.TRADITIONAL))
+        self.assertEqual(zl.SIMPLIFIED, detector.detect(u''))
+
+    def test_make_detector(self):
+        simplified = {u'我': 10, u'们': 5, u'台': 3}
+        traditional = {u'我': 10, u'們': 5, u'臺': 2, u'台': 1, u'後': 1}
+        detector = zl.make_character_set_detector(simplified, traditional)
+        self.assertEqual(zl.SIMPLIFIED, detector.character_set(u'们'))
+        self.assertEqual(zl.TRADITIONAL, detector.character_set(u'後'))
+        self.assertEqual(0, detector.character_set(u'台'))
+        # 后 is the simplified form of 後 but 后 is also traditional
+        pairs = [(u'們', u'们'), (u'後', u'后'), (u'后', u'后'), (u'我', u'我')]
+        detector = zl.make_character_set_detector(simplified, traditional, pairs)
+        self.assertEqual(zl.TRADITIONAL, detector.character_set(u'後'))
+        self.assertEqual(0, detector.character_set(u'后'))
+        self.assertEqual(0, detector.character_set(u'我'))
+
+    def test_standard_detector(self):
+        self.assertEqual(zl.SIMPLIFIED, zl.detect_character_set(u'我们发现了问题。'))
+        self.assertEqual(zl.TRADITIONAL, zl.detect_character_set(u'我們發現了問題。'))
+
+    def test_segment_auto(self):
+        traces = []
+        zl.set_segmentation_hook(traces.append)
+        try:
+            model = zl.WordFrequencyModel({u'我': 10, u'們': 5, u'们': 5},
+                words=[u'我們', u'我们'])
+            self.assertEqual([u'我們'],
+                zl.segment(u'我們', zl.AUTO, method='max_probability', word_model=model))
+        finally:
+            zl.set_segmentation_hook(None)
+        self.assertEqual(zl.TRADITIONAL, traces[0].character_set)
+
+if __name__ == '__main__':
+    unittest.main()
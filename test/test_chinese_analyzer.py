@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+import shutil
+import tempfile
+import unittest
+import zhonglib as zl
+from whoosh.fields import Schema, TEXT, ID
+from whoosh.index import create_in
+from whoosh.query import Term
+
+class TestChineseAnalyzer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self._model = zl.WordFrequencyModel(
+            {u'我': 100, u'们': 50, u'银': 10, u'行': 20, u'去': 30, u'們': 10},
+            words=[u'我们', u'银行', u'我們'])
+
+    def _tokenizer(self, **kwargs):
+        return zl.ChineseTokenizer(zl.SIMPLIFIED, method='max_probability',
+            word_model=self._model, **kwargs)
+
+    def _tokens(self, analyzer, text, **kwargs):
+        return [(t.text, t.pos, t.startchar, t.endchar)
+            for t in analyzer(text, positions=True, chars=True, **kwargs)]
+
+    def test_tokens(self):
+        self.assertEqual(
+            [(u'我们', 0, 0, 2), (u'去', 1, 2, 3), (u'Bank', 2, 4, 8),
+             (u'of', 3, 9, 11), (u'银行', 4, 12, 14), (u'3.5', 5, 15, 18)],
+            self._tokens(self._tokenizer(), u'我们去 Bank of 银行，3.5'))
+
+    def test_mixed_words(self):
+        self.assertEqual(
+            [(u'abc', 0, 0, 3), (u'我们', 1, 3, 5), (u'x1', 2, 5, 7)],
+            self._tokens(self._tokenizer(), u'abc我们x1'))
+
+    def test_start_pos_and_char(self):
+        self.assertEqual([(u'我们', 5, 10, 12)],
+            self._tokens(self._tokenizer(), u'我们', start_pos=5, start_char=10))
+
+    def test_analyzer_lowercases(self):
+        analyzer = zl.ChineseAnalyzer(zl.SIMPLIFIED, method='max_probability',
+            word_model=self._model)
+        self.assertEqual([u'bank', u'银行'], [t.text for t in analyzer(u'BANK 银行')])
+
+    def test_auto_character_set(self):
+        tokenizer = zl.ChineseTokenizer(method='max_probability', word_model=self._model)
+        self.assertEqual([u'我們'], [t.text for t in tokenizer(u'我們')])
+
+    def test_cache(self):
+        tokenizer = self._tokenizer(cache_size=1)
+        list(tokenizer(u'我们'))
+        self.assertEqual(1, len(tokenizer._cache))
+        list(tokenizer(u'银行'))
+        self.assertEqual(1, len(tokenizer._cache))
+        copy = pickle.loads(pickle.dumps(tokenizer))
+        self.assertEqual({}, copy._cache)
+
+    def test_equality_ignores_cache(self):
+        tokenizer = zl.ChineseTokenizer(zl.SIMPLIFIED)
+        tokenizer._cache[u'我们'] = [u'我们']
+        self.assertEqual(zl.ChineseTokenizer(zl.SIMPLIFIED), tokenizer)
+        self.assertNotEqual(zl.ChineseTokenizer(zl.TRADITIONAL), tokenizer)
+
+    def test_index(self):
+        directory = tempfile.mkdtemp()
+        try:
+            schema = Schema(id=ID(stored=True), body=TEXT(analyzer=zl.ChineseAnalyzer(
+                zl.SIMPLIFIED, method='max_probability', on_unknown='single')))
+            index = create_in(directory, schema)
+            writer = index.writer()
+            writer.add_document(id=u'1', body=u'我们去银行')
+            writer.add_document(id=u'2', body=u'银行')
+            writer.commit()
+            with index.searcher() as searcher:
+                ids = sorted(hit['id'] for hit in searcher.search(Term('body', u'银行')))
+                self.assertEqual([u'1', u'2'], ids)
+                ids = [hit['id'] for hit in searcher.search(Term('body', u'我们'))]
+                self.assertEqual([u'1'], ids)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import os.path
+import unittest
+import zhonglib as zl
+
+class TestComponentSimilarity(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        decomp_data_file = os.path.join(
+                                os.path.dirname(__file__),
+                                'test_similarity_data.txt')
+        decomposer = zl.CharacterDecomposer(decomp_data_file)
+        self._index = zl.SimilarityIndex(decomposer)
+
+    def test_component_similarity(self):
+        self.assertEqual(1.0, zl.component_similarity([u'日', u'青'], [u'青', u'日']))
+        self.assertAlmostEqual(1.0/3, zl.component_similarity([u'日', u'青'], [u'目', u'青']))
+        self.assertAlmostEqual(2.0/3, zl.component_similarity([u'日', u'日'], [u'日', u'日', u'日']))
+        self.assertEqual(0.0, zl.component_similarity([], []))
+
+    def test_primitives_not_indexed(self):
+        self.assertEqual(6, len(self._index))
+        self.assertFalse(u'日' in self._index)
+        self.assertEqual([], self._index.similar(u'日'))
+
+    def test_identical_components(self):
+        # Characters with the same components always share every bucket.
+        self.assertTrue(u'暒' in self._index.candidates(u'晴'))
+        self.assertEqual((u'暒', 1.0), self._index.similar(u'晴', 1)[0])
+
+    def test_ranking(self):
+        result = self._index.similar(u'晴')
+        similarities = [similarity for ch, similarity in result]
+        self.assertEqual(sorted(similarities, reverse=True), similarities)
+        self.assertFalse(u'晴' in [ch for ch, similarity in result])
+
+    def test_standard_index(self):
+        self.assertTrue(u'晶' in zl.similar_characters(u'昌', 5))
+
+if __name__ == '__main__':
+    unittest.main()
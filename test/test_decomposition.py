@@ -36,6 +36,12 @@ class TestDecomposition(unittest.TestCase):
         decomposition = zl.decompose(u'好', zl.TRADITIONAL)
         self.assertEquals([u'女', u'子'], decomposition)
 
+    def test_decompose_repeated_components(self):
+        # A component that occurs more than once is listed each time
+        self.assertEqual([u'木', u'木', u'木'], zl.decompose_character(u'森'))
+        self.assertEqual([u'日', u'日'], zl.decompose_character(u'昌'))
+        self.assertEqual([u'一', u'一'], zl.decompose_character(u'二'))
+
     def test_decompose_word(self):
         decomposition = zl.decompose(u'本子', zl.TRADITIONAL)
         self.assertEquals([u'本', u'子'], decomposition)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import os.path
+import unittest
+import zhonglib as zl
+
+def data_file(name):
+    return os.path.join(os.path.dirname(__file__), name)
+
+class TestDecompositionValidation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self._file_name = data_file('test_decomposition_errors_data.txt')
+        self._decomposer = zl.CharacterDecomposer(self._file_name)
+        self._report = self._decomposer.load_report()
+
+    def line_problems(self):
+        return dict((p[1], p[2]) for p in self._report.problems if p[1] != None)
+
+    def test_statistics(self):
+        self.assertEqual(12, self._report.line_count)
+        self.assertEqual(3, self._report.record_count)
+        self.assertEqual(3, self._report.character_count)
+        self.assertEqual(0, self._report.group_count)
+        self.assertEqual(8, self._report.skipped_count)
+        self.assertFalse(self._report.is_ok())
+
+    def test_malformed_line(self):
+        self.assertEqual(u'Expected 4 fields but found 1', self.line_problems()[4])
+
+    def test_duplicate(self):
+        self.assertEqual(u'Duplicate ID "m"; first defined on line 1', self.line_problems()[5])
+        # The first record is kept
+        self.assertEqual(None, zl.record_referent(self._decomposer['m']))
+
+    def test_bad_codes(self):
+        self.assertEqual(u'Bad node type code "y"', self.line_problems()[6])
+        self.assertEqual(u'Bad relation type code "w"', self.line_problems()[7])
+
+    def test_bad_ids(self):
+        self.assertEqual(u'"𠂇𠂇" must be a single character', self.line_problems()[8])
+        self.assertEqual(u'"mn" must be a single character', self.line_problems()[9])
+        self.assertEqual(u'Group 1 cannot be a variant', self.line_problems()[10])
+        self.assertEqual(u'Empty component in "m,,n"', self.line_problems()[11])
+
+    def test_surrogate_pair(self):
+        self.assertEqual(
+            u'"\ud840\udc87" is a surrogate pair; a wide Python build is needed',
+            zl._describe_bad_character_id(u'\ud840\udc87'))
+
+    def test_dangling_reference(self):
+        self.assertEqual(
+            (self._file_name, None, u'"x" is referred to by r but is not defined'),
+            self._report.problems[-1])
+
+    def test_dangling_reference_not_a_record(self):
+        self.assertFalse('x' in self._decomposer)
+        self.assertRaises(KeyError, lambda: self._decomposer['x'])
+        self.assertEqual(['m', 'n', 'r'], sorted(self._decomposer))
+        self.assertEqual(3, len(self._decomposer))
+
+    def test_messages(self):
+        self.assertEqual(
+            u'%s:4: Expected 4 fields but found 1'%self._file_name,
+            self._report.messages()[0])
+
+    def test_clean_data(self):
+        decomposer = zl.CharacterDecomposer(data_file('test_decomposition_data.txt'))
+        self.assertTrue(decomposer.load_report().is_ok())
+
+class TestDecompositionOverrides(unittest.TestCase):
+
+    def test_overrides(self):
+        decomposer = zl.CharacterDecomposer(
+            data_file('test_decomposition_errors_data.txt'),
+            [data_file('test_decomposition_override_data.txt')])
+        report = decomposer.load_report()
+        self.assertEqual(['m'], zl.record_referent(decomposer['r']))
+        self.assertEqual('r', zl.record_referent(decomposer['u']))
+        self.assertEqual(5, report.record_count)
+        self.assertEqual(1, report.variant_count)
+        self.assertEqual(1, report.override_count)
+        self.assertEqual(15, report.line_count)
+        # 'x' is now defined
+        self.assertEqual(('x', zl.CHARACTER, zl.COMPOSED_OF, None, 1), decomposer['x'])
+        self.assertEqual([], [p for p in report.problems if p[1] == None])
+
+    def test_load_overrides(self):
+        decomposer = zl.CharacterDecomposer(data_file('test_decomposition_data.txt'))
+        decomposer.load_overrides(data_file('test_decomposition_override_data.txt'))
+        self.assertEqual(['m'], zl.record_referent(decomposer['r']))
+        self.assertEqual(['r', 'q'], zl.record_referent(decomposer['s']))
+        self.assertEqual(2, len(decomposer.load_report().files))
+
+    def test_dangling_reference_in_override(self):
+        override_file = data_file('test_decomposition_dangling_override_data.txt')
+        decomposer = zl.CharacterDecomposer(data_file('test_decomposition_data.txt'), [override_file])
+        self.assertEqual(
+            [(override_file, None, u'"y" is referred to by r but is not defined')],
+            decomposer.load_report().problems)
+
+class TestDecompositionCycleCheck(unittest.TestCase):
+
+    def test_cycle_check_with_dangling_reference(self):
+        decomposer = zl.CharacterDecomposer(data_file('test_decomposition_errors_data.txt'))
+        self.assertFalse(zl.is_id_in_cycle(decomposer, 'r'))
+        self.assertEqual([], zl.check_decomposer_for_cycles(decomposer))
+
+if __name__ == '__main__':
+    unittest.main()
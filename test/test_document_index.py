@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+import zhonglib as zl
+
+_documents = [
+    (u'1', u'我们去银行。今天天气很好。'),
+    (u'2', u'银行业发展很快。'),
+    (u'3', u'今天我们在家。'),
+]
+
+class TestDocumentIndex(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._index = zl.create_document_index(self._directory + '/index',
+            zl.SIMPLIFIED, method='max_probability', on_unknown='single')
+        self.assertEqual(3, self._index.add_documents(iter(_documents)))
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _ids(self, hits):
+        return sorted(hit.id for hit in hits)
+
+    def test_bigram_tokens(self):
+        self.assertEqual(
+            [(u'银行', 0, 2), (u'行业', 1, 3), (u'好', 4, 5), (u'ok', 6, 8)],
+            [(t.text, t.startchar, t.endchar)
+                for t in zl.ChineseBigramAnalyzer()(u'银行业，好 OK', chars=True)])
+
+    def test_search_words(self):
+        self.assertEqual(3, len(self._index))
+        self.assertEqual([u'1', u'3'], self._ids(self._index.search(u'我们')))
+        self.assertEqual([u'1'], self._ids(self._index.search(u'我们银行')))
+        self.assertEqual([u'1', u'2', u'3'], self._ids(self._index.search(u'我们银行', mode='any')))
+        self.assertEqual([], self._index.search(u'，'))
+
+    def test_words_score_higher(self):
+        # 银行 is a word in 1 but only a pair of characters in 2, where it
+        # is part of 银行业
+        hits = self._index.search(u'银行')
+        self.assertEqual([u'1', u'2'], self._ids(hits))
+        self.assertEqual(u'1', hits[0].id)
+
+    def test_highlights(self):
+        hits = self._index.search(u'天气', fragmenter='sentence')
+        self.assertEqual(1, len(hits))
+        self.assertEqual(u'今天<b class="match term0">天气</b>很好', hits[0].highlights)
+        hits = self._index.search(u'行业')
+        self.assertEqual(u'2', hits[0].id)
+        self.assertTrue(u'<b' in hits[0].highlights)
+        self.assertEqual(None, self._index.search(u'天气', highlight=False)[0].highlights)
+
+    def test_update_and_delete(self):
+        self._index.add_documents([(u'3', u'天气不好。')], update=True)
+        self.assertEqual([u'1', u'3'], self._ids(self._index.search(u'天气')))
+        self._index.delete_document(u'3')
+        self.assertEqual([u'1'], self._ids(self._index.search(u'天气')))
+
+    def test_reopen(self):
+        index = zl.DocumentIndex(self._directory + '/index')
+        self.assertEqual([u'2'], self._ids(index.search(u'发展')))
+
+    def test_errors(self):
+        self.assertRaises(zl.ZhonglibException, zl.create_document_index, self._directory + '/index')
+        self.assertRaises(zl.ZhonglibException, self._index.search, u'我们', mode='some')
+        self.assertRaises(zl.ZhonglibException, self._index.search, u'我们', fragmenter='page')
+
+    def test_parallel_indexing(self):
+        documents = [(unicode(i), u'我们去银行。') for i in xrange(10, 20)]
+        self.assertEqual(10, self._index.add_documents(documents, procs=2, batch_size=3))
+        self.assertEqual(13, len(self._index))
+        self.assertEqual(12, len(self._index.search(u'银行', limit=None)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import zhonglib as zl
+
+_news = (u'国家统计局今天发布数据显示，今年前三个季度国内生产总值同比增长百分之五，'
+    u'经济运行总体平稳，就业形势基本稳定，居民收入继续增加，消费市场逐步恢复，工业生产保持增长。')
+_edited = _news.replace(u'基本稳定', u'总体稳定')
+_other = (u'昨天下午，市政府召开新闻发布会，介绍城市交通建设情况，'
+    u'新的地铁线路将在明年年底开通运营，方便市民出行。')
+
+_options = dict(method='max_probability')
+
+class TestDuplicates(unittest.TestCase):
+
+    def _index(self, **options):
+        options.update(_options)
+        return zl.DuplicateIndex(zl.SIMPLIFIED, **options)
+
+    def test_fingerprint(self):
+        fingerprint = zl.document_fingerprint(_news, zl.SIMPLIFIED, **_options)
+        self.assertEqual(fingerprint, zl.document_fingerprint(_news, zl.SIMPLIFIED, **_options))
+        self.assertTrue(0 <= fingerprint < 1 << 64)
+        self.assertEqual(None, zl.document_fingerprint(u'。', zl.SIMPLIFIED, **_options))
+        self.assertEqual(None, zl.document_fingerprint(u'', zl.SIMPLIFIED, **_options))
+        zl.document_fingerprint(u'银行', zl.SIMPLIFIED, **_options)
+
+    def test_find(self):
+        index = self._index()
+        self.assertEqual([], index.add_document(u'news', _news))
+        self.assertEqual([], index.add_document(u'other', _other))
+        found = index.add_document(u'edited', _edited)
+        self.assertEqual([u'news'], [id for id, distance in found])
+        self.assertTrue(found[0][1] <= 3)
+        self.assertEqual([(u'news', 0), (u'edited', found[0][1])],
+            index.find(index.fingerprint(_news)))
+        self.assertEqual(3, len(index))
+
+    def test_documents_without_words(self):
+        index = self._index()
+        self.assertEqual([], index.add_document(u'empty', u''))
+        self.assertEqual([], index.add_document(u'stop', u'。'))
+        self.assertEqual([], index.add_document(u'news', _news))
+        self.assertEqual([], index.find(None))
+        self.assertEqual(1, len(index))
+        self.assertFalse(u'empty' in index)
+
+    def test_bands(self):
+        fingerprint = (1 << 63) | 1
+        index = self._index(max_distance=2, bands=3)
+        index.add(1, fingerprint)
+        index.add(2, fingerprint ^ 0b110)
+        index.add(3, fingerprint ^ 0b1110)
+        self.assertEqual([(1, 0), (2, 2)], index.find(fingerprint))
+        self.assertRaises(zl.ZhonglibException, self._index, max_distance=3, bands=3)
+
+    def test_remove(self):
+        index = self._index()
+        index.add(u'a', 5)
+        index.add(u'b', 5)
+        index.add(u'a', 7)
+        self.assertEqual([(u'b', 0), (u'a', 1)], index.find(5))
+        index.remove(u'b')
+        self.assertFalse(u'b' in index)
+        self.assertEqual([(u'a', 1)], index.find(5))
+
+    def test_unique_documents(self):
+        documents = [(1, _news), (2, _edited), (3, _other), (4, _news)]
+        index = self._index()
+        self.assertEqual([1, 3], [id for id, text in zl.unique_documents(documents, zl.SIMPLIFIED,
+            index=index)])
+        self.assertEqual([], list(zl.unique_documents([(5, _other)], zl.SIMPLIFIED, index=index)))
+        self.assertEqual([3, 4], [id for id, text in
+            zl.unique_documents(documents[2:], zl.SIMPLIFIED, **_options)])
+        documents = [(1, u''), (2, u'。'), (3, _news), (4, u''), (5, u'！')]
+        index = self._index()
+        self.assertEqual([1, 2, 3, 4, 5], [id for id, text in zl.unique_documents(documents,
+            zl.SIMPLIFIED, index=index)])
+        self.assertEqual(1, len(index))
+
+    def test_read_write(self):
+        directory = tempfile.mkdtemp()
+        try:
+            index = self._index(max_distance=2)
+            index.add_document(u'news', _news)
+            index.add_document(u'other', _other)
+            file_name = os.path.join(directory, 'duplicates')
+            index.write(file_name)
+            copy = zl.read_duplicate_index(file_name, **_options)
+            self.assertEqual(2, copy.max_distance)
+            self.assertEqual(2, len(copy))
+            fingerprint = copy.fingerprint(_news)
+            self.assertEqual(index.find(fingerprint), copy.find(fingerprint))
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import zhonglib as zl
+
+_model = zl.WordFrequencyModel({u'我': 5, u'们': 5, u'银': 1, u'行': 3, u'好': 4},
+    words=[u'我们', u'银行'])
+
+_texts = [
+    u'我们去银行。',
+    u'我们好，OK 好！',
+    u'银行好',
+] * 5
+
+_options = dict(method='max_probability', word_model=_model)
+
+class TestFrequencyBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_count_corpus(self):
+        characters, words, ngrams = zl.count_corpus(_texts[:3], zl.SIMPLIFIED, **_options)
+        self.assertEqual(2, characters[u'我'])
+        self.assertEqual(3, characters[u'好'])
+        self.assertFalse(u'O' in characters)
+        self.assertEqual({u'我们': 2, u'去': 1, u'银行': 2, u'好': 3}, dict(words))
+        self.assertEqual(2, ngrams[u'我们'])
+        self.assertEqual(1, ngrams[u'行好'])
+        self.assertFalse(u'行。' in ngrams)
+
+    def _build(self, **options):
+        options.update(_options)
+        return zl.build_frequency_tables(iter(_texts), zl.SIMPLIFIED, self._directory,
+            chunk_size=2, **options)
+
+    def _check(self, paths):
+        characters = zl.read_frequency_table(paths['characters'])
+        self.assertEqual(15, characters[u'好'])
+        self.assertEqual(u'好', characters.entry_at_rank(1))
+        words = zl.read_frequency_table(paths['words'])
+        self.assertEqual(10, words[u'我们'])
+        self.assertEqual(5, words[u'去'])
+        self.assertEqual([u'我们', u'银行'], sorted(zl.read_word_list(paths['word_list'])))
+        ngrams = zl.read_frequency_table(paths['ngrams'])
+        self.assertEqual(10, ngrams[u'银行'])
+        with open(paths['characters']) as f:
+            counts = [int(line.split()[1]) for line in f]
+        self.assertEqual(sorted(counts, reverse=True), counts)
+
+    def test_build(self):
+        paths = self._build()
+        self.assertEqual(os.path.join(self._directory, 'simplified-frequencies.txt'),
+            paths['characters'])
+        self.assertEqual(os.path.join(self._directory, 'simplified-2-grams.txt'), paths['ngrams'])
+        self._check(paths)
+
+    def test_build_on_disk(self):
+        self._check(self._build(max_entries=3, tempdir=self._directory))
+        self.assertEqual(4, len(os.listdir(self._directory)))
+
+    def test_build_in_parallel(self):
+        self._check(self._build(processes=2))
+
+    def test_min_count(self):
+        paths = self._build(min_count=6)
+        words = zl.read_frequency_table(paths['words'])
+        self.assertFalse(u'去' in words)
+        self.assertTrue(u'我们' in words)
+
+    def test_name(self):
+        self.assertRaises(zl.ZhonglibException,
+            zl.build_frequency_tables, _texts, zl.AUTO, self._directory)
+        paths = zl.build_frequency_tables(_texts, zl.AUTO, self._directory, name='corpus',
+            ngram_length=3, **_options)
+        self.assertEqual(os.path.join(self._directory, 'corpus-3-grams.txt'), paths['ngrams'])
+
+if __name__ == '__main__':
+    unittest.main()
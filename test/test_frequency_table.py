@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import math
+import os
+import unittest
+import zhonglib as zl
+
+class TestFrequencyTable(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self._path = os.path.join(os.path.dirname(__file__), 'test-frequencies.txt')
+        self._table = zl.read_frequency_table(self._path)
+
+    def test_dictionary_interface(self):
+        self.assertEqual(5, len(self._table))
+        self.assertEqual(100, self._table['A'])
+        self.assertTrue('E' in self._table)
+        self.assertFalse('F' in self._table)
+        self.assertEqual(None, self._table.get('F'))
+        self.assertRaises(KeyError, self._table.__getitem__, 'F')
+        self.assertEqual(['A', 'B', 'C', 'D', 'E'], list(self._table))
+
+    def test_total(self):
+        self.assertEqual(200, self._table.total)
+
+    def test_rank(self):
+        self.assertEqual(1, self._table.rank('A'))
+        self.assertEqual(5, self._table.rank('E'))
+        self.assertEqual('C', self._table.entry_at_rank(3))
+        self.assertEqual([('A', 100), ('B', 50)], self._table.top(2))
+
+    def test_ties_ranked_by_entry(self):
+        table = zl.FrequencyTable({u'b':1, u'a':1, u'c':2})
+        self.assertEqual([u'c', u'a', u'b'], table.keys())
+
+    def test_coverage(self):
+        self.assertEqual(0.5, self._table.coverage(1))
+        self.assertEqual(0.875, self._table.coverage(3))
+        self.assertEqual(1.0, self._table.coverage(10))
+        self.assertEqual(0.0, self._table.coverage(0))
+
+    def test_percentile(self):
+        self.assertEqual(80.0, self._table.percentile('A'))
+        self.assertEqual(0.0, self._table.percentile('E'))
+        self.assertRaises(zl.ZhonglibException, zl.FrequencyTable({}).percentile, 'A')
+
+    def test_probabilities(self):
+        self.assertEqual(0.25, self._table.relative_frequency('B'))
+        self.assertAlmostEqual(math.log(0.125), self._table.log_probability('C'))
+        table = zl.FrequencyTable({u'a':1, u'b':0})
+        self.assertEqual(float('-inf'), table.log_probability(u'b'))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import zhonglib as zl
+
+_documents = [
+    u'我们去银行。银行今天开门。',
+    u'今天天气很好。',
+    u'我们今天在家。',
+]
+
+_options = dict(method='max_probability')
+
+class TestKeywords(unittest.TestCase):
+
+    def setUp(self):
+        self._idf = zl.idf_table_from_documents(_documents, zl.SIMPLIFIED, **_options)
+
+    def test_idf_table_from_documents(self):
+        self.assertTrue(u'银行' in self._idf)
+        self.assertTrue(self._idf[u'银行'] > self._idf[u'今天'])
+        self.assertEqual(self._idf.default, self._idf[u'没有这个'])
+        self.assertTrue(self._idf.default > self._idf[u'银行'])
+
+    def test_read_write(self):
+        directory = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(directory, 'idf.txt')
+            self._idf.write(file_name)
+            table = zl.read_idf_table(file_name)
+            self.assertEqual(sorted(self._idf.items()), sorted(table.items()))
+            self.assertEqual(self._idf.default, table.default)
+        finally:
+            shutil.rmtree(directory)
+
+    def _read(self, text):
+        directory = tempfile.mkdtemp()
+        try:
+            file_name = os.path.join(directory, 'idf.txt')
+            with open(file_name, 'w') as f:
+                f.write(text.encode('utf-8'))
+            return zl.read_idf_table(file_name)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_read_blank_lines(self):
+        table = self._read(u'# default 2.5\n\n银行 2.0\n  \n')
+        self.assertEqual([(u'银行', 2.0)], table.items())
+        self.assertEqual(2.5, table.default)
+
+    def test_read_bad_lines(self):
+        with self.assertRaisesRegexp(zl.ZhonglibException, r'idf\.txt:3: '):
+            self._read(u'# default 2.5\n银行 2.0\n今天\n')
+        with self.assertRaisesRegexp(zl.ZhonglibException, r'idf\.txt:2: '):
+            self._read(u'# default 2.5\n银行 high\n')
+        with self.assertRaisesRegexp(zl.ZhonglibException, r'idf\.txt:1: '):
+            self._read(u'# default high\n')
+
+    def test_tfidf(self):
+        keywords = zl.extract_keywords(_documents[0], zl.SIMPLIFIED, k=2,
+            idf_table=self._idf, **_options)
+        self.assertEqual(2, len(keywords))
+        self.assertEqual(u'银行', keywords[0][0])
+        self.assertEqual([], zl.extract_keywords(u'。，', zl.SIMPLIFIED, idf_table=self._idf,
+            min_length=1, **_options))
+
+    def test_stop_words(self):
+        keywords = zl.extract_keywords(_documents[0], zl.SIMPLIFIED, idf_table=self._idf,
+            stop_words={u'银行'}, **_options)
+        self.assertFalse(u'银行' in [word for word, score in keywords])
+
+    def test_textrank(self):
+        keywords = zl.extract_keywords(u'银行今天开门。我们去银行。银行很好。', zl.SIMPLIFIED,
+            k=3, mode='textrank', **_options)
+        self.assertEqual(u'银行', keywords[0][0])
+        scores = [score for word, score in keywords]
+        self.assertEqual(sorted(scores, reverse=True), scores)
+
+    def test_standard_idf_table(self):
+        keywords = zl.extract_keywords(_documents[0], zl.SIMPLIFIED, k=3, **_options)
+        self.assertTrue(u'银行' in [word for word, score in keywords])
+
+    def test_invalid_mode(self):
+        self.assertRaises(zl.ZhonglibException,
+            zl.extract_keywords, _documents[0], zl.SIMPLIFIED, mode='bm25')
+
+    def test_many(self):
+        expected = [
+            zl.extract_keywords(text, zl.SIMPLIFIED, idf_table=self._idf, **_options)
+            for text in _documents
+        ]
+        self.assertEqual(expected,
+            zl.extract_keywords_many(_documents, zl.SIMPLIFIED, idf_table=self._idf, **_options))
+        self.assertEqual(expected,
+            zl.extract_keywords_many(_documents, zl.SIMPLIFIED, idf_table=self._idf,
+                processes=2, chunk_size=1, **_options))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import zhonglib as zl
+
+class TestPinyinConversion(unittest.TestCase):
+
+    def test_parse_diacritic(self):
+        self.assertEqual([(u'xian', 4), (u'zai', 4)], zl.parse_pinyin(u'xiànzài'))
+        self.assertEqual([(u'xian', 4), (u'zai', 4)], zl.parse_pinyin(u'xiàn zài'))
+        self.assertEqual([(u'ni', 3), (u'hao', 3)], zl.parse_pinyin(u'nǐ hǎo'))
+
+    def test_parse_neutral_tone(self):
+        self.assertEqual([(u'ma', 0)], zl.parse_pinyin(u'ma5'))
+        self.assertEqual([(u'ma', 0)], zl.parse_pinyin(u'ma0'))
+        self.assertEqual([(u'pang', 2), (u'bian', 1), (u'r', 0)], zl.parse_pinyin(u'pángbiānr'))
+
+    def test_parse_no_tone(self):
+        self.assertEqual([(u'ma', None)], zl.parse_pinyin(u'ma'))
+        self.assertEqual([(u'xian', None), (u'zai', None)], zl.parse_pinyin(u'xianzai'))
+        self.assertEqual([(u'ma', 1), (u'ma', None)], zl.parse_pinyin(u'ma1 ma'))
+
+    def test_parse_apostrophe(self):
+        self.assertEqual([(u'xi', 1), (u'an', 1)], zl.parse_pinyin(u"Xī'ān".lower()))
+        self.assertEqual([(u'Xi', 1), (u'an', 1)], zl.parse_pinyin(u"Xī'ān"))
+        self.assertEqual([(u'xian', 1)], zl.parse_pinyin(u'xiān'))
+
+    def test_parse_backtracking(self):
+        # Without an apostrophe, a syllable can't start with a, o or e
+        self.assertEqual([(u'fan', None), (u'gan', None)], zl.parse_pinyin(u'fangan'))
+        self.assertEqual([(u'fang', None), (u'an', None)], zl.parse_pinyin(u"fang'an"))
+        self.assertEqual([(u'min', None), (u'ge', None)], zl.parse_pinyin(u'minge'))
+        # ... unless there is no other way
+        self.assertEqual([(u'hai', None), (u'ou', None)], zl.parse_pinyin(u'haiou'))
+
+    def test_parse_numbered(self):
+        self.assertEqual([(u'men', 2), (u'kou', 3)], zl.parse_pinyin(u'men2 kou3'))
+        self.assertEqual([(u'men', 2), (u'kou', 3)], zl.parse_pinyin(u'men2kou3'))
+        self.assertEqual([(u'lü', 3), (u'guan', 3)], zl.parse_pinyin(u'lu:3guan3'))
+        self.assertEqual([(u'lü', 3)], zl.parse_pinyin(u'lv3'))
+        self.assertEqual([(u'ma', 0)], zl.parse_pinyin(u'ma5'))
+
+    def test_parse_errors(self):
+        self.assertRaises(zl.ZhonglibException, zl.parse_pinyin, u'xyz')
+        self.assertRaises(zl.ZhonglibException, zl.parse_pinyin, u'3ma')
+        self.assertRaises(zl.ZhonglibException, zl.parse_pinyin, u'ma7')
+
+    def test_numbered_to_diacritic(self):
+        self.assertEqual(u'ménkǒu',
+            zl.convert_pinyin(u'men2 kou3', zl.NUMBERED_PINYIN, zl.DIACRITIC_PINYIN))
+        self.assertEqual(u"xī'ān",
+            zl.convert_pinyin(u'xi1 an1', zl.NUMBERED_PINYIN, zl.DIACRITIC_PINYIN))
+
+    def test_diacritic_to_numbered(self):
+        self.assertEqual(u'xian4 zai4',
+            zl.convert_pinyin(u'xiànzài', zl.DIACRITIC_PINYIN, zl.NUMBERED_PINYIN))
+        self.assertEqual(u'lu:4 se4',
+            zl.convert_pinyin(u'lǜsè', zl.DIACRITIC_PINYIN, zl.NUMBERED_PINYIN))
+
+    def test_to_zhuyin(self):
+        self.assertEqual(u'ㄒㄧㄢˋ ㄗㄞˋ',
+            zl.convert_pinyin(u'xiànzài', zl.DIACRITIC_PINYIN, zl.ZHUYIN))
+        self.assertEqual(u'ㄓ ㄉㄠˋ',
+            zl.convert_pinyin(u'zhi1 dao4', zl.NUMBERED_PINYIN, zl.ZHUYIN))
+        self.assertEqual(u'ㄇㄚ ˙ㄇㄚ',
+            zl.convert_pinyin(u'ma1 ma5', zl.NUMBERED_PINYIN, zl.ZHUYIN))
+
+    def test_from_zhuyin(self):
+        self.assertEqual(u'xiànzài',
+            zl.convert_pinyin(u'ㄒㄧㄢˋ ㄗㄞˋ', zl.ZHUYIN, zl.DIACRITIC_PINYIN))
+        self.assertEqual(u'xiànzài',
+            zl.convert_pinyin(u'ㄒㄧㄢˋㄗㄞˋ', zl.ZHUYIN, zl.DIACRITIC_PINYIN))
+        self.assertEqual(u'ma1 ma5',
+            zl.convert_pinyin(u'ㄇㄚ˙ㄇㄚ', zl.ZHUYIN, zl.NUMBERED_PINYIN))
+        self.assertEqual(u'ju2',
+            zl.convert_pinyin(u'ㄐㄩˊ', zl.ZHUYIN, zl.NUMBERED_PINYIN))
+
+    def test_unmarked(self):
+        self.assertEqual(u'ㄒㄧㄢ ㄗㄞ',
+            zl.convert_pinyin(u'xianzai', zl.DIACRITIC_PINYIN, zl.ZHUYIN))
+        self.assertEqual(u'xian zai',
+            zl.convert_pinyin(u'xianzai', zl.DIACRITIC_PINYIN, zl.NUMBERED_PINYIN))
+        self.assertEqual(u"xi'an",
+            zl.convert_pinyin(u'xi an', zl.NUMBERED_PINYIN, zl.DIACRITIC_PINYIN))
+        self.assertEqual(u'ma1 ma',
+            zl.convert_pinyin(u'māma', zl.DIACRITIC_PINYIN, zl.NUMBERED_PINYIN))
+
+    def test_zhuyin_round_trip(self):
+        converter = zl.standard_pinyin_converter()
+        for syllable in zl.pinyin_syllables():
+            for tone in xrange(5):
+                zhuyin = converter.format([(syllable, tone)], zl.ZHUYIN)
+                self.assertEqual([(syllable, tone)], converter.parse(zhuyin, zl.ZHUYIN))
+
+    def test_convert_many(self):
+        result = zl.convert_pinyin_many(
+            [u'ni3 hao3', u'xyz', u'ni3 hao3'],
+            zl.NUMBERED_PINYIN,
+            zl.DIACRITIC_PINYIN,
+            on_error='none')
+        self.assertEqual([u'nǐhǎo', None, u'nǐhǎo'], result)
+        self.assertRaises(zl.ZhonglibException, zl.convert_pinyin_many,
+            [u'xyz'], zl.NUMBERED_PINYIN, zl.DIACRITIC_PINYIN)
+        self.assertRaises(zl.ZhonglibException, zl.convert_pinyin_many,
+            [], zl.NUMBERED_PINYIN, zl.DIACRITIC_PINYIN, 'skip')
@@ -38,6 +38,15 @@ class TestPinyinUtils(unittest.TestCase):
         self.assertEqual(None, pinyin_tuples[0])
         self.assertEqual((u'guan', 3), pinyin_tuples[1])
 
+    def test_token_cache_size(self):
+        size = zl._cedict_token_cache_size
+        zl._cedict_token_cache_size = len(zl._cedict_token_cache)
+        try:
+            self.assertEqual([(u'zzz', 3)], zl.parse_cedict_pinyin(u'[zzz3]'))
+            self.assertFalse(u'zzz3' in zl._cedict_token_cache)
+        finally:
+            zl._cedict_token_cache_size = size
+
     def test_format_pinyin_1(self):
         self.assertEqual(u'a', zl.format_pinyin(u'a', 0))
         self.assertEqual(u'ā', zl.format_pinyin(u'a', 1))
@@ -157,3 +166,53 @@ class TestPinyinUtils(unittest.TestCase):
         tuples = zl.parse_cedict_pinyin('[pang2 bian1 r5]')
         formatted = zl.format_pinyin_sequence(tuples)
         self.assertEqual(formatted, u'pángbiānr')
+
+    def test_syllable_inventory(self):
+        syllables = zl.pinyin_syllables()
+        self.assertEqual(len(syllables), len(set(syllables)))
+        self.assertTrue(400 < len(syllables) < 420)
+        for syllable in (u'a', u'zhuang', u'lüe', u'nü', u'er', u'yo'):
+            self.assertTrue(syllable in syllables)
+
+    def test_toned_table_covers_inventory(self):
+        for syllable in zl.pinyin_syllables():
+            capitalised = syllable[0].upper() + syllable[1:]
+            for tone in xrange(5):
+                self.assertEqual(
+                    zl._compute_toned_pinyin(syllable, tone),
+                    zl._toned_pinyin_table[(syllable, tone)])
+                self.assertTrue((capitalised, tone) in zl._toned_pinyin_table)
+
+    def test_format_capitalised(self):
+        self.assertEqual(u'Lǚ', zl.format_pinyin(u'Lü', 3))
+        self.assertEqual(u'Xiàn', zl.format_pinyin(u'Xian', 4))
+        self.assertEqual(u'Ōu', zl.format_pinyin(u'Ou', 1))
+
+    def test_misplaced_tone_mark_detected(self):
+        self.assertTrue(zl._is_tone_mark_placed_correctly(u'liu', 2, u'liú'))
+        self.assertFalse(zl._is_tone_mark_placed_correctly(u'liu', 2, u'líu'))
+        self.assertTrue(zl._is_tone_mark_placed_correctly(u'gou', 3, u'gǒu'))
+
+    def test_format_pinyin_not_in_table(self):
+        self.assertEqual(u'LǙ', zl.format_pinyin(u'LÜ', 3))
+        self.assertEqual(u'LÜ', zl.format_pinyin(u'LÜ', 0))
+
+    def test_parse_numbered_pinyin_interned(self):
+        first = zl.parse_cedict_pinyin(u'[men2 kou3]')
+        second = zl.parse_cedict_pinyin(u'[kou3 men2]')
+        self.assertTrue(first[0] is second[1])
+        self.assertTrue(first[1] is second[0])
+
+    def test_pinyin_column(self):
+        column = zl.parse_cedict_pinyin_column([u'[men2 kou3]', u'[xx5 guan3]', u'[lu:3]'])
+        self.assertEqual(3, len(column))
+        self.assertEqual([(u'men', 2), (u'kou', 3)], column[0])
+        self.assertEqual([None, (u'guan', 3)], column[1])
+        self.assertEqual([(u'lü', 3)], column[-1])
+        self.assertEqual([u'men', u'kou'],
+            [zl.cedict_syllable(i) for i in column.syllable_ids(0)])
+        self.assertEqual([2, 3], list(column.tones(0)))
+        self.assertRaises(IndexError, column.__getitem__, 3)
+
+    def test_pinyin_column_bad_format(self):
+        self.assertRaises(zl.ZhonglibException, zl.parse_cedict_pinyin_column, [u'men2'])
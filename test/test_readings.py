@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import unittest
+import zhonglib as zl
+
+class TestReadings(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        dictionary_file = os.path.join(
+                os.path.dirname(__file__),
+                'test_reading_dictionary.txt')
+        self._dictionary_dir = os.path.join(
+                os.path.dirname(__file__),
+                'test_reading_dictionary')
+        if os.path.exists(self._dictionary_dir):
+            shutil.rmtree(self._dictionary_dir)
+        zl.create_dictionary(dictionary_file, self._dictionary_dir)
+        self._dictionary = zl.Dictionary(self._dictionary_dir)
+
+    def _to_pinyin(self, text, character_set):
+        return zl.to_pinyin(text, character_set, self._dictionary, 2)
+
+    def test_readings(self):
+        readings = self._dictionary.readings()
+        self.assertEqual(10, len(readings))
+        self.assertEqual([u'[Xing2]', u'[hang2]', u'[xing2]'],
+            readings.readings(u'行', zl.TRADITIONAL))
+        self.assertEqual([u'[yin2 hang2]'], readings.readings(u'银行', zl.SIMPLIFIED))
+        self.assertEqual([], readings.readings(u'银行', zl.TRADITIONAL))
+        self.assertEqual([u'[yin2 hang2]'],
+            readings.readings(u'银行', zl.TRADITIONAL | zl.SIMPLIFIED))
+
+    def test_script_converter(self):
+        converter = self._dictionary.script_converter()
+        self.assertEqual(u'銀行長大', zl.to_traditional(u'银行长大', converter))
+        self.assertEqual(u'银行长大', zl.to_simplified(u'銀行長大', converter))
+
+    def test_usual_reading_skips_proper_nouns(self):
+        readings = self._dictionary.readings()
+        self.assertEqual([(u'hang', 2)], readings.reading(u'行', zl.TRADITIONAL))
+        self.assertEqual(None, readings.reading(u'門', zl.TRADITIONAL))
+
+    def test_readings_from_index(self):
+        # A dictionary made before there were reading tables
+        os.remove(os.path.join(self._dictionary_dir, zl._readings_file_name))
+        try:
+            dictionary = zl.Dictionary(self._dictionary_dir)
+            readings = dictionary.readings()
+            self.assertEqual(10, len(readings))
+            self.assertEqual([u'[yin2 hang2]'], readings.readings(u'銀行', zl.TRADITIONAL))
+        finally:
+            self._dictionary.readings().write(
+                os.path.join(self._dictionary_dir, zl._readings_file_name))
+
+    def test_word_reading_settles_heteronym(self):
+        self.assertEqual(
+            [(u'銀行', [(u'yin', 2), (u'hang', 2)])],
+            self._to_pinyin(u'銀行', zl.TRADITIONAL))
+        self.assertEqual(
+            [(u'长大', [(u'zhang', 3), (u'da', 4)])],
+            self._to_pinyin(u'长大', zl.SIMPLIFIED))
+
+    def test_sentence(self):
+        self.assertEqual(
+            [(u'大', [(u'da', 4)]), (u'人', [(u'ren', 2)]), (u'長', [(u'chang', 2)])],
+            self._to_pinyin(u'大人，長', zl.TRADITIONAL))
+
+    def test_max_word_length(self):
+        self.assertEqual(2, self._dictionary.max_word_length(zl.TRADITIONAL))
+        self.assertEqual(2, self._dictionary.max_word_length(zl.TRADITIONAL, u'銀'))
+        self.assertEqual(1, self._dictionary.max_word_length(zl.TRADITIONAL, u'行'))
+        self.assertEqual(0, self._dictionary.max_word_length(zl.TRADITIONAL, u'银'))
+        self.assertEqual(2, self._dictionary.max_word_length(zl.SIMPLIFIED, u'银'))
+
+    def test_to_pinyin_without_max_word_length(self):
+        self.assertEqual(
+            [(u'銀行', [(u'yin', 2), (u'hang', 2)])],
+            zl.to_pinyin(u'銀行', zl.TRADITIONAL, self._dictionary))
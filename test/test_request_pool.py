@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+import zhonglib as zl
+
+# Every word is in it but lookups wait until 'release' is set, which keeps
+# a worker busy while requests are queued behind it.
+class BlockingDict:
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def has_word(self, character_set, word):
+        self.started.set()
+        self.release.wait(5)
+        return True
+
+# Finds each word as its own entry and records every bulk lookup
+class FindDict:
+
+    def __init__(self):
+        self.calls = []
+
+    def find_many(self, words, character_set, include_english):
+        self.calls.append(list(words))
+        if u'X' in words:
+            raise zl.ZhonglibException('Bad word')
+        return [[word] for word in words]
+
+class TestRequestPool(unittest.TestCase):
+
+    def setUp(self):
+        self._dictionary = FindDict()
+        self._pool = zl.RequestPool(workers=1, max_pending=10, dictionary=self._dictionary)
+        self._blocking = BlockingDict()
+
+    def tearDown(self):
+        self._blocking.release.set()
+        self._pool.close()
+
+    # Keeps the only worker busy until 'release' is called
+    def _block(self):
+        future = self._pool.segment(u'阿', zl.TRADITIONAL, self._blocking, 1, {u'阿': 1})
+        self.assertTrue(self._blocking.started.wait(5))
+        return future
+
+    def _release(self, blocker):
+        self._blocking.release.set()
+        self.assertEqual([u'阿'], blocker.result(5))
+
+    def test_requests_are_batched(self):
+        blocker = self._block()
+        a = self._pool.find(u'a', zl.SIMPLIFIED)
+        b = self._pool.find(u'b', zl.SIMPLIFIED)
+        many = self._pool.find_many([u'c', u'd'], zl.SIMPLIFIED)
+        other = self._pool.find(u'e', zl.TRADITIONAL)
+        self._release(blocker)
+        self.assertEqual([u'a'], a.result(5))
+        self.assertEqual([u'b'], b.result(5))
+        self.assertEqual([[u'c'], [u'd']], many.result(5))
+        self.assertEqual([u'e'], other.result(5))
+        self.assertEqual([[u'a', u'b', u'c', u'd'], [u'e']], self._dictionary.calls)
+
+    def test_failures_are_kept_to_their_request(self):
+        blocker = self._block()
+        good = self._pool.find(u'a', zl.SIMPLIFIED)
+        bad = self._pool.find(u'X', zl.SIMPLIFIED)
+        self._release(blocker)
+        self.assertEqual([u'a'], good.result(5))
+        self.assertRaises(zl.ZhonglibException, bad.result, 5)
+        self.assertEqual([[u'a', u'X'], [u'a'], [u'X']], self._dictionary.calls)
+
+    def test_cancel(self):
+        blocker = self._block()
+        self.assertFalse(blocker.cancel())
+        future = self._pool.find(u'a', zl.SIMPLIFIED)
+        self.assertTrue(future.cancel())
+        self.assertTrue(future.cancelled())
+        self._release(blocker)
+        self.assertRaises(zl.RequestCancelled, future.result)
+        self._pool.close()
+        self.assertEqual([], self._dictionary.calls)
+
+    def test_timeouts(self):
+        blocker = self._block()
+        self.assertRaises(zl.RequestTimeout, blocker.result, 0.01)
+        late = self._pool.find(u'a', zl.SIMPLIFIED, timeout=0)
+        self._release(blocker)
+        self.assertTrue(isinstance(late.exception(5), zl.RequestTimeout))
+
+    def test_callbacks(self):
+        done = []
+        called = threading.Event()
+        future = self._pool.find(u'a', zl.SIMPLIFIED)
+        future.add_done_callback(lambda f: (done.append(f), called.set()))
+        future.result(5)
+        # Callbacks are called after the result is set
+        self.assertTrue(called.wait(5))
+        future.add_done_callback(done.append)
+        self.assertEqual([future, future], done)
+
+    def test_failing_callback(self):
+        def fail(future):
+            raise ValueError('Callback failed')
+        blocker = self._block()
+        futures = [self._pool.find(word, zl.SIMPLIFIED) for word in (u'a', u'b', u'c')]
+        futures[0].add_done_callback(fail)
+        self._release(blocker)
+        self.assertEqual([[u'a'], [u'b'], [u'c']], [future.result(5) for future in futures])
+        self.assertEqual([u'd'], self._pool.find(u'd', zl.SIMPLIFIED).result(5))
+        futures[0].add_done_callback(fail)
+
+    def test_bounded_queue(self):
+        pool = zl.RequestPool(workers=1, max_pending=1, dictionary=self._dictionary)
+        blocking = BlockingDict()
+        try:
+            pool.segment(u'阿', zl.TRADITIONAL, blocking, 1, {u'阿': 1})
+            self.assertTrue(blocking.started.wait(5))
+            pool.find(u'a', zl.SIMPLIFIED)
+            self.assertRaises(zl.ZhonglibException, pool.find, u'b', zl.SIMPLIFIED)
+        finally:
+            blocking.release.set()
+            pool.close()
+        self.assertRaises(zl.ZhonglibException, pool.find, u'c', zl.SIMPLIFIED)
+
+    def test_closed(self):
+        blocker = self._block()
+        self._pool.close(wait=False)
+        self.assertRaises(zl.ZhonglibException, self._pool.find, u'a', zl.SIMPLIFIED)
+        self._release(blocker)
+
+    def test_requests_left_after_close_fail(self):
+        blocker = self._block()
+        # A request behind a stop signal is never run by a worker
+        self._pool._queue.put_nowait(None)
+        late = self._pool.find(u'a', zl.SIMPLIFIED)
+        self._release(blocker)
+        self._pool.close()
+        self.assertTrue(isinstance(late.exception(5), zl.ZhonglibException))
+        self.assertEqual([], self._dictionary.calls)
+
+    def test_segment_many(self):
+        model = zl.WordFrequencyModel({u'阿': 100, u'比': 50}, words=[u'阿比'])
+        future = self._pool.segment_many([u'阿比', u'比阿'], zl.TRADITIONAL,
+            method='max_probability', word_model=model)
+        self.assertEqual([[u'阿比'], [u'比', u'阿']], future.result(5))
+
+if __name__ == '__main__':
+    unittest.main()
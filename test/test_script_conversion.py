@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+import zhonglib as zl
+
+class TestScriptConversion(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self._converter = zl.read_script_converter(os.path.join(
+                os.path.dirname(__file__),
+                'test_conversion_dictionary.txt'))
+
+    def test_characters(self):
+        self.assertEqual(u'发现', zl.to_simplified(u'發現', self._converter))
+        # 发 is 發 more often than 髮
+        self.assertEqual(u'發現', zl.to_traditional(u'发现', self._converter))
+        self.assertEqual(u'發', zl.to_traditional(u'发', self._converter))
+
+    def test_words(self):
+        self.assertEqual(u'頭髮', zl.to_traditional(u'头发', self._converter))
+        self.assertEqual(u'只是一隻', zl.to_traditional(u'只是一只', self._converter))
+        self.assertEqual(u'头发的发展', zl.to_simplified(u'頭髮的發展', self._converter))
+        self.assertEqual(u'頭髮的發展', zl.to_traditional(u'头发的发展', self._converter))
+
+    def test_unknown_characters(self):
+        self.assertEqual(u'abc 門，頭', zl.to_traditional(u'abc 門，头', self._converter))
+
+    def test_convert_many(self):
+        self.assertEqual([u'頭髮', u'', u'發'],
+            self._converter.convert_many([u'头发', u'', u'发'], zl.TRADITIONAL))
+
+    def test_convert_stream(self):
+        # 头发 is split between the pieces
+        pieces = [u'一只头', u'发', u'', u'的发', u'展']
+        result = list(self._converter.convert_stream(pieces, zl.TRADITIONAL))
+        self.assertEqual(u'一隻頭髮的發展', u''.join(result))
+        self.assertEqual(
+            zl.to_traditional(u''.join(pieces), self._converter),
+            u''.join(result))
+
+    def test_invalid_target(self):
+        self.assertRaises(zl.ZhonglibException, self._converter.convert, u'发', 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,35 +4,46 @@ import os
 import os.path
 import unittest
 import zhonglib as zl
-
-class TestDict:
+from helpers import TestDict
+
+_words = (
+    u'阿', # A
+    u'比', # B
+    u'西西', # CC
+    u'阿地', # AD
+    u'阿比', # AB
+    u'一',  # E
+    u'一阿', # EA
+    u'A',
+    u'B',
+    u'CC',
+    u'AD',
+    u'AB',
+    u'E',
+    u'EA',
+)
+
+# Counts the lookups and knows how long words starting with each character
+# can be.
+class CountingDict(TestDict):
 
     def __init__(self):
-        self._words = (
-            u'阿', # A
-            u'比', # B
-            u'西西', # CC
-            u'阿地', # AD
-            u'阿比', # AB
-            u'一',  # E
-            u'一阿', # EA
-            u'A',
-            u'B',
-            u'CC',
-            u'AD',
-            u'AB',
-            u'E',
-            u'EA',
-        )
+        TestDict.__init__(self, _words)
+        self.lookups = []
+        self._lengths = zl.WordLengthTable(self._words)
 
     def has_word(self, character_set, text):
-        return text in self._words
+        self.lookups.append(text)
+        return TestDict.has_word(self, character_set, text)
+
+    def max_word_length(self, character_set, first_character=None):
+        return self._lengths.get(first_character)
 
 class TestSegmentation(unittest.TestCase):
 
     @classmethod
     def setUpClass(self):
-        self._dict = TestDict()
+        self._dict = TestDict(_words)
         self._frequency_table = {u'阿':100, u'比':50}
 
     def _test_chunking_0(self):
@@ -229,5 +240,112 @@ class TestSegmentation(unittest.TestCase):
             zl.segment(u'門口水果', zl.TRADITIONAL)
         )
 
+    def test_chunks_limited_by_first_character(self):
+        dictionary = CountingDict()
+        self.assertEqual(
+            [[u'比', u'阿'], [u'比', u'阿比']],
+            zl.get_chunks(u'比阿比', zl.TRADITIONAL, 0, dictionary, 9, 2))
+        # No word starting with 比 is longer than one character
+        self.assertFalse(u'比阿' in dictionary.lookups)
+        self.assertFalse(u'比阿比' in dictionary.lookups)
+
+    def test_max_word_length_from_dictionary(self):
+        self.assertEqual(
+            [u'阿比', u'一阿', u'阿地'],
+            zl.segment(u'阿比一阿阿地', zl.TRADITIONAL, CountingDict(),
+                frequency_table=self._frequency_table))
+        self.assertRaises(zl.ZhonglibException, zl.segment,
+            u'阿比', zl.TRADITIONAL, self._dict, frequency_table=self._frequency_table)
+
+    def test_unknown_raise(self):
+        self.assertRaises(zl.DecompositionError, zl.segment,
+            u'阿比門門阿', zl.TRADITIONAL, self._dict, 2, self._frequency_table)
+
+    def test_unknown_single(self):
+        statistics = zl.SegmentationStatistics()
+        self.assertEqual(
+            [u'阿比', u'門', u'門', u'阿'],
+            zl.segment(u'阿比門門阿', zl.TRADITIONAL, self._dict, 2,
+                self._frequency_table, on_unknown='single', statistics=statistics))
+        self.assertEqual(4, statistics.word_count)
+        self.assertEqual(5, statistics.character_count)
+        self.assertEqual(2, statistics.unknown_word_count)
+        self.assertEqual(2, statistics.unknown_character_count)
+        self.assertEqual(0.4, statistics.unknown_character_rate())
+        self.assertEqual(0.5, statistics.unknown_word_rate())
+
+    def test_unknown_merge(self):
+        statistics = zl.SegmentationStatistics()
+        self.assertEqual(
+            [u'阿比', u'門門', u'阿'],
+            zl.segment(u'阿比門門阿', zl.TRADITIONAL, self._dict, 2,
+                self._frequency_table, on_unknown='merge', statistics=statistics))
+        self.assertEqual(1, statistics.unknown_word_count)
+        self.assertEqual(2, statistics.unknown_character_count)
+
+    def test_unknown_max_probability(self):
+        model = zl.WordFrequencyModel(self._frequency_table, words=[u'阿比'])
+        self.assertEqual(
+            [u'阿比', u'門', u'門', u'阿'],
+            zl.segment(u'阿比門門阿', zl.TRADITIONAL, method='max_probability',
+                word_model=model, on_unknown='single'))
+        statistics = zl.SegmentationStatistics()
+        self.assertEqual(
+            [u'阿比', u'門門', u'阿'],
+            zl.segment(u'阿比門門阿', zl.TRADITIONAL, method='max_probability',
+                word_model=model, on_unknown='merge', statistics=statistics))
+        self.assertEqual(3, statistics.word_count)
+        self.assertEqual(1, statistics.unknown_word_count)
+
+    def test_invalid_on_unknown(self):
+        self.assertRaises(zl.ZhonglibException, zl.segment,
+            u'阿', zl.TRADITIONAL, self._dict, 2, self._frequency_table, on_unknown='skip')
+
+    def test_trace_hook(self):
+        traces = []
+        zl.set_segmentation_hook(traces.append)
+        try:
+            dictionary = CountingDict()
+            zl.segment(u'阿比一阿阿地', zl.TRADITIONAL, dictionary,
+                frequency_table=self._frequency_table)
+            self.assertRaises(zl.DecompositionError, zl.segment,
+                u'阿比門門阿', zl.TRADITIONAL, self._dict, 2, self._frequency_table)
+        finally:
+            zl.set_segmentation_hook(None)
+        self.assertEqual(2, len(traces))
+        trace = traces[0]
+        self.assertEqual(u'阿比一阿阿地', trace.text)
+        self.assertEqual('mmseg', trace.method)
+        self.assertEqual(3, trace.word_count)
+        self.assertEqual(len(dictionary.lookups), trace.probe_count)
+        self.assertEqual(9, trace.chunk_candidate_count)
+        self.assertEqual(1, trace.decisions['unambiguous'])
+        self.assertEqual(1, trace.decisions['rule1'])
+        self.assertEqual(1, trace.decisions['rule2'])
+        self.assertEqual(None, trace.error)
+        self.assertEqual('DecompositionError', traces[1].error)
+        self.assertEqual(1, traces[1].decisions['no_chunks'])
+
+    def test_segmentation_stats(self):
+        self.assertEqual(None, zl.segmentation_stats())
+        zl.enable_segmentation_stats(slowest_count=1)
+        try:
+            zl.segment(u'阿比門門阿', zl.TRADITIONAL, self._dict, 2,
+                self._frequency_table, on_unknown='single')
+            zl.segment(u'阿比', zl.TRADITIONAL, self._dict, 2, self._frequency_table)
+            stats = zl.segmentation_stats()
+            self.assertEqual(2, stats.call_count)
+            self.assertEqual(0, stats.error_count)
+            self.assertEqual(7, stats.character_count)
+            self.assertEqual(5, stats.word_count)
+            self.assertEqual(3, stats.decisions['fallback'])
+            self.assertEqual(1, len(stats.slowest))
+            self.assertTrue(stats.probes_per_character() > 0)
+            zl.reset_segmentation_stats()
+            self.assertEqual(0, zl.segmentation_stats().call_count)
+        finally:
+            zl.enable_segmentation_stats(False)
+        self.assertEqual(None, zl.segmentation_stats())
+
 if __name__ == '__main__':
     unittest.main()
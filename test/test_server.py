@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zhonglib
+import zhonglibd
+import zhonglib_client
+
+class TestServer(unittest.TestCase):
+
+    def _start(self, address):
+        server = zhonglibd.make_server(address)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def setUp(self):
+        server = self._start('127.0.0.1:0')
+        self._client = zhonglib_client.Client('127.0.0.1:%s'%server.server_address[1])
+        self.addCleanup(self._client.close)
+
+    def test_segment(self):
+        self.assertEqual([u'我们', u'的'],
+            self._client.segment(u'我们的', method='max_probability'))
+        self.assertEqual([[u'我们'], [u'我們']],
+            self._client.segment_many([u'我们', u'我們'], method='max_probability'))
+
+    def test_decompose(self):
+        self.assertEqual([u'女', u'子'], self._client.decompose(u'好'))
+
+    def test_batch_errors(self):
+        results = self._client.batch([
+            ['segment', u'我们', 'simplified', 'max_probability'],
+            ['segment', u'我们', 'simplified', 'no_such_method'],
+            ['no_such_request', u'我们'],
+            ['decompose', u'好', 'klingon'],
+        ])
+        self.assertEqual(['ok', [u'我们']], results[0])
+        self.assertEqual(['error', 'error', 'error'], [r[0] for r in results[1:]])
+        self.assertRaises(zhonglib_client.ServerError, self._client.segment,
+            u'我们', 'simplified', 'no_such_method')
+
+    def test_bad_requests(self):
+        results = self._client.batch([
+            [['segment'], u'我们'],
+            [None, u'我们'],
+            ['find', u'我们', ['simplified']],
+            ['find'],
+            'decompose',
+            ['decompose', u'好'],
+        ])
+        self.assertEqual([['error', u'Bad request']]*5, results[:5])
+        self.assertEqual(['ok', [u'女', u'子']], results[5])
+
+    def test_connections_are_reused(self):
+        for i in xrange(3):
+            self._client.decompose(u'好')
+        self.assertEqual(1, len(self._client._idle))
+        status = self._client.status()
+        self.assertEqual(3, status['batches'])
+        self.assertEqual(os.getpid(), status['pid'])
+
+    def test_unix_socket(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'zhonglib.sock')
+        self._start(path)
+        client = zhonglib_client.Client(path)
+        self.addCleanup(client.close)
+        self.assertEqual([u'女', u'子'], client.decompose(u'好'))
+        self.assertEqual([u'女', u'子'], client.decompose(u'好'))
+        self.assertEqual(1, len(client._idle))
+
+    def test_unix_socket_path_taken(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'zhonglib.sock')
+        with open(path, 'w') as f:
+            f.write('data')
+        self.assertRaises(zhonglib.ZhonglibException, zhonglibd.make_server, path)
+        self.assertTrue(os.path.isfile(path))
+
+if __name__ == '__main__':
+    unittest.main()
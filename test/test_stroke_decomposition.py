@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import os.path
+import unittest
+import zhonglib as zl
+
+class TestStrokeDecomposition(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        decomp_data_file = os.path.join(
+                                os.path.dirname(__file__),
+                                'test_stroke_data.txt')
+        decomposer = zl.CharacterDecomposer(decomp_data_file)
+        self._table = zl.StrokeTable(decomposer)
+
+    def test_stroke(self):
+        self.assertEqual([u'㇐'], self._table.strokes(u'㇐'))
+        self.assertEqual(1, self._table.stroke_count(u'㇐'))
+
+    def test_character(self):
+        self.assertEqual([u'㇐', u'㇑'], self._table.strokes(u'十'))
+        self.assertEqual(2, self._table.stroke_count(u'十'))
+
+    def test_character_composed_of_group(self):
+        self.assertEqual([u'㇐', u'㇑', u'㇒'], self._table.strokes(u'千'))
+        self.assertEqual(3, self._table.stroke_count(u'千'))
+
+    def test_variant(self):
+        # A variant is expanded like the character it is a variant of but
+        # needn't be written with as many strokes.
+        self.assertEqual([u'㇐', u'㇑', u'㇒'], self._table.strokes(u'仟'))
+        self.assertEqual(None, self._table.stroke_count(u'仟'))
+
+    def test_component_primitive(self):
+        # 口 isn't broken down into strokes, so neither is 古
+        self.assertEqual([u'㇐', u'㇑', u'口'], self._table.strokes(u'古'))
+        self.assertEqual(None, self._table.stroke_count(u'古'))
+        self.assertEqual(None, self._table.stroke_count(u'口'))
+
+    def test_unknown_primitive(self):
+        self.assertEqual([u'㇐', u'㇑', u'X'], self._table.strokes(u'Y'))
+        self.assertEqual(None, self._table.stroke_count(u'X'))
+        self.assertEqual(None, self._table.stroke_count(u'Y'))
+
+    def test_no_data(self):
+        with self.assertRaises(zl.ZhonglibException) as cm:
+            self._table.stroke_count(u'行')
+        self.assertEqual(u'No decomposition data for "行"', cm.exception.message)
+
+    def test_standard_stroke_table(self):
+        self.assertEqual([u'㇟', u'㇆'], zl.decompose_to_strokes(u'乜'))
+        self.assertEqual(2, zl.stroke_count(u'乜'))
+
+    def test_standard_repeated_strokes(self):
+        self.assertEqual([u'㇒', u'㇒'], zl.decompose_to_strokes(u'人'))
+        self.assertEqual(2, zl.stroke_count(u'人'))
+
+    def test_standard_components(self):
+        self.assertTrue(u'女' in zl.decompose_to_strokes(u'好'))
+        self.assertEqual(None, zl.stroke_count(u'好'))
+
+if __name__ == '__main__':
+    unittest.main()
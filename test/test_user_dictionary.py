@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+import zhonglib as zl
+from helpers import TestDict
+
+class TestUserDictionary(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(os.path.dirname(__file__), 'test_user_dictionary.txt')
+        self._user_dictionary = zl.read_user_dictionary(path)
+
+    def test_read(self):
+        self.assertEqual('test_user_dictionary.txt', self._user_dictionary.name)
+        self.assertEqual(2, len(self._user_dictionary))
+        self.assertEqual(set([u'比西', u'阿比西地']), set(self._user_dictionary))
+        self.assertEqual(4, self._user_dictionary.max_word_length(zl.TRADITIONAL))
+
+    def test_add_and_remove(self):
+        user_dictionary = zl.UserDictionary([u'阿比'], u'test')
+        self.assertTrue(u'阿比' in user_dictionary)
+        self.assertFalse(u'阿' in user_dictionary)
+        user_dictionary.add(u'阿')
+        user_dictionary.add(u'阿比西地')
+        self.assertTrue(u'阿' in user_dictionary)
+        self.assertEqual(4, user_dictionary.max_word_length(zl.TRADITIONAL))
+        user_dictionary.remove(u'阿比西地')
+        self.assertFalse(u'阿比西地' in user_dictionary)
+        self.assertEqual(2, user_dictionary.max_word_length(zl.TRADITIONAL))
+        # The nodes below 阿比 are gone
+        self.assertFalse(u'西' in user_dictionary._trie[u'阿'][u'比'])
+        user_dictionary.remove(u'阿比')
+        self.assertEqual([u'阿'], list(user_dictionary))
+        self.assertRaises(KeyError, user_dictionary.remove, u'阿比')
+        self.assertRaises(zl.ZhonglibException, user_dictionary.add, u'')
+
+    def test_word_length_table(self):
+        table = zl.WordLengthTable([u'阿比西', u'比西', u'西地'])
+        self.assertEqual(3, table.get())
+        self.assertEqual(2, table.get(u'西'))
+        table.set(u'阿', 1)
+        self.assertEqual(2, table.get())
+        table.set(u'比', 0)
+        table.set(u'西', 0)
+        self.assertEqual(1, table.get())
+        table.add(u'地阿比西')
+        self.assertEqual(4, table.get())
+        table.set(u'阿', 0)
+        table.set(u'地', 0)
+        self.assertEqual(0, table.get())
+
+    def test_character_set(self):
+        user_dictionary = zl.UserDictionary([u'门口'], character_set=zl.SIMPLIFIED)
+        self.assertTrue(user_dictionary.has_word(zl.SIMPLIFIED, u'门口'))
+        self.assertFalse(user_dictionary.has_word(zl.TRADITIONAL, u'门口'))
+
+    def test_layered(self):
+        layers = []
+        dictionary = zl.LayeredDictionary(TestDict([u'阿']), layers)
+        self.assertTrue(dictionary.has_word(zl.TRADITIONAL, u'阿'))
+        self.assertFalse(dictionary.has_word(zl.TRADITIONAL, u'比西'))
+        # The base dictionary doesn't know how long its words are
+        self.assertEqual(None, dictionary.max_word_length(zl.TRADITIONAL))
+        layers.append(self._user_dictionary)
+        self.assertTrue(dictionary.has_word(zl.TRADITIONAL, u'比西'))
+        self.assertEqual(None, dictionary.max_word_length(zl.TRADITIONAL, u'阿'))
+        self.assertEqual(
+            [u'阿', u'比西'],
+            zl.segment(u'阿比西', zl.TRADITIONAL, dictionary, 2, {}))
+
+    def test_layered_max_word_length(self):
+        layers = []
+        base = zl.UserDictionary([u'阿', u'比比'])
+        dictionary = zl.LayeredDictionary(base, layers)
+        self.assertTrue(dictionary.has_word(zl.TRADITIONAL, u'阿'))
+        self.assertFalse(dictionary.has_word(zl.TRADITIONAL, u'比西'))
+        self.assertEqual(2, dictionary.max_word_length(zl.TRADITIONAL))
+        self.assertEqual(1, dictionary.max_word_length(zl.TRADITIONAL, u'阿'))
+        layers.append(self._user_dictionary)
+        self.assertTrue(dictionary.has_word(zl.TRADITIONAL, u'比西'))
+        self.assertEqual(4, dictionary.max_word_length(zl.TRADITIONAL))
+        self.assertEqual(4, dictionary.max_word_length(zl.TRADITIONAL, u'阿'))
+        self.assertEqual(2, dictionary.max_word_length(zl.TRADITIONAL, u'比'))
+        self.assertEqual(0, dictionary.max_word_length(zl.TRADITIONAL, u'西'))
+
+    def test_layer_report(self):
+        dictionary = zl.LayeredDictionary(TestDict([]), [self._user_dictionary])
+        report = dictionary.layer_report([u'比西', u'西'])
+        self.assertEqual(1, len(report))
+        name, count, memory, seconds = report[0]
+        self.assertEqual('test_user_dictionary.txt', name)
+        self.assertEqual(2, count)
+        self.assertTrue(memory > 0)
+        self.assertTrue(seconds >= 0)
+
+    def test_segment_with_user_dictionary(self):
+        model = zl.WordFrequencyModel({u'阿':100, u'比':50, u'西':20, u'地':10})
+        text = u'阿比西地'
+        self.assertEqual([u'阿', u'比', u'西', u'地'],
+            zl.segment(text, zl.TRADITIONAL, method='max_probability', word_model=model))
+        zl.add_user_dictionary(self._user_dictionary)
+        try:
+            self.assertEqual([self._user_dictionary], zl.user_dictionaries())
+            self.assertEqual([u'阿比西地'],
+                zl.segment(text, zl.TRADITIONAL, method='max_probability', word_model=model))
+            self._user_dictionary.remove(u'阿比西地')
+            self.assertEqual([u'阿', u'比西', u'地'],
+                zl.segment(text, zl.TRADITIONAL, method='max_probability', word_model=model))
+        finally:
+            zl.remove_user_dictionary(self._user_dictionary)
+        self.assertEqual([], zl.user_dictionaries())
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import math
+import os
+import unittest
+import zhonglib as zl
+from helpers import TestDict
+
+class TestWordFrequency(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        words_file = os.path.join(os.path.dirname(__file__), 'test_words.dic')
+        self._words = zl.read_word_list(words_file)
+        self._character_frequencies = {u'阿':100, u'比':50, u'西':20, u'地':1}
+        self._model = zl.WordFrequencyModel(self._character_frequencies, words=self._words)
+
+    def test_read_word_list(self):
+        self.assertEqual([u'阿比', u'西地', u'阿比西'], self._words)
+
+    def test_lexicon(self):
+        self.assertEqual(7, len(self._model))
+        self.assertTrue(self._model.has_word(zl.SIMPLIFIED, u'阿比西'))
+        self.assertTrue(self._model.has_word(zl.SIMPLIFIED, u'地'))
+        self.assertFalse(self._model.has_word(zl.SIMPLIFIED, u'比西'))
+        self.assertEqual(3, self._model.max_word_length(zl.SIMPLIFIED))
+        self.assertEqual(3, self._model.max_word_length(zl.SIMPLIFIED, u'阿'))
+        self.assertEqual(2, self._model.max_word_length(zl.SIMPLIFIED, u'西'))
+        self.assertEqual(1, self._model.max_word_length(zl.SIMPLIFIED, u'比'))
+
+    def test_estimated_counts(self):
+        self.assertEqual(101, self._model.count(u'阿'))
+        self.assertEqual(51, self._model.count(u'阿比'))
+        self.assertEqual(21, self._model.count(u'阿比西'))
+        self.assertEqual(1, self._model.count(u'門'))
+
+    def test_word_frequencies(self):
+        model = zl.WordFrequencyModel(
+            self._character_frequencies,
+            word_frequencies={u'西地':1000},
+            words=self._words)
+        self.assertEqual(1001, model.count(u'西地'))
+        total = 171 + 1000 + 7
+        self.assertAlmostEqual(math.log(1001.0/total), model.log_probability(u'西地'))
+
+    def test_mmseg_unresolved(self):
+        # Both [阿比, 西地] and [阿比西, 地] have two words and 地 has a
+        # frequency of 1, so none of the MMSEG rules choose between them.
+        dictionary = TestDict(self._words + [u'地'])
+        self.assertRaises(zl.DecompositionError, zl.segment,
+            u'阿比西地', zl.SIMPLIFIED, dictionary, 3, self._character_frequencies)
+
+    def test_max_probability(self):
+        dictionary = TestDict(self._words + [u'地'])
+        self.assertEqual([u'阿比', u'西地'],
+            zl.segment(u'阿比西地', zl.SIMPLIFIED, dictionary, 3,
+                method='max_probability', word_model=self._model))
+
+    def test_max_probability_model_as_dictionary(self):
+        self.assertEqual([u'阿比', u'西地', u'阿'],
+            zl.segment(u'阿比西地，阿', zl.SIMPLIFIED,
+                method='max_probability', word_model=self._model))
+
+    def test_max_probability_no_words(self):
+        self.assertRaises(zl.DecompositionError, zl.segment, u'門', zl.SIMPLIFIED,
+            method='max_probability', word_model=self._model)
+
+    def test_invalid_method(self):
+        self.assertRaises(zl.ZhonglibException, zl.segment, u'阿', zl.SIMPLIFIED,
+            method='viterbi')
+
+    def test_standard_word_model(self):
+        model = zl.standard_word_model(zl.SIMPLIFIED)
+        self.assertTrue(u'同样地' in model)
+        self.assertEqual(
+            [u'我们', u'的', u'国家'],
+            zl.segment(u'我们的国家', zl.SIMPLIFIED, method='max_probability'))